@@ -1,3 +1,4 @@
+import os
 from flask import Flask
 from .routes import main, api
 
@@ -8,6 +9,8 @@ def create_app(config_name=None):
     
     # 配置应用
     app.config['SECRET_KEY'] = 'dev_secret_key'  # 开发环境使用，生产环境应使用环境变量
+    # 部署在支持X-Sendfile的前端服务器（Apache mod_xsendfile、lighttpd）后面时，媒体文件交给前端服务器发送
+    app.config['USE_X_SENDFILE'] = os.environ.get('MILANO_X_SENDFILE', '0') == '1'
     
     # 注册蓝图
     app.register_blueprint(main.bp)
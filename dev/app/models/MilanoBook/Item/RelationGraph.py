@@ -5,6 +5,39 @@ class RelationGraph(Item):
         super().__init__(name, description)
         self._nodes = []
         self._edges = []
+        # 节点键 -> 节点序号，以及每个节点的邻接表 [(相邻节点序号, 关系类型)]
+        self._node_index = {}
+        self._adjacency = []
+        
+    @classmethod
+    def from_arrays(cls, name, description, nodes, sources, targets, relations, relation_types):
+        """
+        由节点列表和边的序号数组直接构建关系图，耗时与节点数和边数成线性关系
+        
+        Args:
+            nodes: 节点列表
+            sources: 每条边起点的节点序号
+            targets: 每条边终点的节点序号
+            relations: 每条边的关系类型在relation_types中的序号
+            relation_types: 关系类型表
+        """
+        graph = cls(name, description)
+        graph._nodes = list(nodes)
+        for i, node in enumerate(graph._nodes):
+            graph._node_index.setdefault(cls._node_key(node), i)
+        
+        # 边已经是节点序号，直接生成边列表和邻接表
+        adjacency = [[] for _ in graph._nodes]
+        edges = []
+        for s, t, r in zip(sources, targets, relations):
+            rel_type = relation_types[r]
+            edges.append((graph._nodes[s], graph._nodes[t], rel_type))
+            adjacency[s].append((t, rel_type))
+            if t != s:
+                adjacency[t].append((s, rel_type))
+        graph._edges = edges
+        graph._adjacency = adjacency
+        return graph
         
     @property
     def nodes(self):
@@ -14,28 +47,91 @@ class RelationGraph(Item):
     def edges(self):
         return self._edges
         
+    @staticmethod
+    def _node_key(node):
+        # 可哈希的节点按值查找（与原先的 == 比较一致），不可哈希的节点按对象身份查找
+        try:
+            hash(node)
+            return (True, node)
+        except TypeError:
+            return (False, id(node))
+        
+    def _find_node(self, node):
+        key = self._node_key(node)
+        index = self._node_index.get(key)
+        if index is None and not key[0]:
+            # 不可哈希且不是同一对象的节点，退回按值比较
+            for i, existing in enumerate(self._nodes):
+                if existing == node:
+                    return i
+        return index
+        
+    def _append_node(self, node):
+        index = len(self._nodes)
+        self._nodes.append(node)
+        self._node_index.setdefault(self._node_key(node), index)
+        self._adjacency.append([])
+        return index
+        
+    def _rebuild_index(self):
+        """直接修改_nodes或_edges后重建节点索引和邻接表"""
+        self._node_index = {}
+        for i, node in enumerate(self._nodes):
+            self._node_index.setdefault(self._node_key(node), i)
+        self._adjacency = [[] for _ in self._nodes]
+        for source, target, rel_type in self._edges:
+            s = self._find_node(source)
+            t = self._find_node(target)
+            self._adjacency[s].append((t, rel_type))
+            if t != s:
+                self._adjacency[t].append((s, rel_type))
+        
     def add_node(self, node):
-        if node not in self._nodes:
-            self._nodes.append(node)
+        if self._find_node(node) is None:
+            self._append_node(node)
         
     def add_edge(self, source_node, target_node, relation_type):
-        if source_node not in self._nodes:
-            self._nodes.append(source_node)
-        if target_node not in self._nodes:
-            self._nodes.append(target_node)
+        s = self._find_node(source_node)
+        if s is None:
+            s = self._append_node(source_node)
+        t = self._find_node(target_node)
+        if t is None:
+            t = self._append_node(target_node)
         
         self._edges.append((source_node, target_node, relation_type))
+        self._adjacency[s].append((t, relation_type))
+        if t != s:
+            self._adjacency[t].append((s, relation_type))
         
-    def get_related_nodes(self, node, relation_type=None):
-        related = []
+    def to_arrays(self):
+        """
+        把边编码为节点序号数组和关系类型表，供持久化使用
+        
+        Returns:
+            (sources, targets, relations, relation_types)
+        """
+        relation_index = {}
+        relation_types = []
+        sources, targets, relations = [], [], []
         for source, target, rel_type in self._edges:
-            if source == node:
-                if relation_type is None or rel_type == relation_type:
-                    related.append((target, rel_type))
-            elif target == node:
-                if relation_type is None or rel_type == relation_type:
-                    related.append((source, rel_type))
-        return related
+            r = relation_index.get(rel_type)
+            if r is None:
+                r = relation_index[rel_type] = len(relation_types)
+                relation_types.append(rel_type)
+            sources.append(self._find_node(source))
+            targets.append(self._find_node(target))
+            relations.append(r)
+        return sources, targets, relations, relation_types
+        
+    def get_related_nodes(self, node, relation_type=None):
+        index = self._find_node(node)
+        if index is None:
+            return []
+        return [
+            (self._nodes[neighbor], rel_type)
+            for neighbor, rel_type in self._adjacency[index]
+            if relation_type is None or rel_type == relation_type
+        ]
         
     def __repr__(self):
         return f"RelationGraph(name='{self.name}', nodes={len(self._nodes)}, edges={len(self._edges)})"
@@ -1,20 +1,70 @@
+import bisect
+import heapq
 from .__init__ import Item
 
 class Timeline(Item):
     def __init__(self, name="Untitled", description=""):
         super().__init__(name, description)
+        # (时间点, 内容)按时间点升序排列，时间点相同的按加入顺序排列
         self._content = []
+        # 与_content对应的时间点列表，用于二分查找
+        self._times = []
         
     @property
     def content(self):
         return self._content
         
+    def _time_points(self):
+        # 直接修改了content（数量变化）时重建时间点列表
+        if len(self._times) != len(self._content):
+            self._content.sort(key=lambda x: x[0])
+            self._times = [time_point for time_point, _ in self._content]
+        return self._times
+        
     def add_timeline_item(self, time_point, item):
-        self._content.append((time_point, item))
+        position = bisect.bisect_right(self._time_points(), time_point)
+        self._times.insert(position, time_point)
+        self._content.insert(position, (time_point, item))
+        
+    def extend(self, timeline_items):
+        """批量加入[(时间点, 内容)]，只排序一次；顺序与逐个调用add_timeline_item相同"""
+        self._content.extend(timeline_items)
+        # 稳定排序，已有内容和新内容都基本有序时接近线性时间
         self._content.sort(key=lambda x: x[0])
+        self._times = [time_point for time_point, _ in self._content]
+        
+    def _range_positions(self, start_time, end_time):
+        times = self._time_points()
+        low = 0 if start_time is None else bisect.bisect_left(times, start_time)
+        high = len(times) if end_time is None else bisect.bisect_right(times, end_time)
+        return low, high
         
     def get_items_by_time_range(self, start_time, end_time):
-        return [item for time_point, item in self._content if start_time <= time_point <= end_time]
+        low, high = self._range_positions(start_time, end_time)
+        return [item for _, item in self._content[low:high]]
+        
+    def iter_timeline_items(self, start_time=None, end_time=None):
+        """按时间顺序逐个产生[start_time, end_time]内的(时间点, 内容)，None表示不限"""
+        low, high = self._range_positions(start_time, end_time)
+        for position in range(low, high):
+            yield self._content[position]
         
     def __repr__(self):
         return f"Timeline(name='{self.name}', item_count={len(self._content)})"
+
+def merge_timelines(timelines, start_time=None, end_time=None):
+    """
+    按时间顺序惰性合并多条时间线，不复制也不整体排序
+    
+    Args:
+        timelines: Timeline列表，时间点相同时按timelines中的先后顺序产生
+        start_time: 只合并不早于此时间的内容，None表示不限
+        end_time: 只合并不晚于此时间的内容，None表示不限
+    
+    Returns:
+        逐个产生(时间点, 内容)的迭代器
+    """
+    return heapq.merge(
+        *(timeline.iter_timeline_items(start_time, end_time) for timeline in timelines),
+        key=lambda x: x[0]
+    )
@@ -1,3 +1,5 @@
+from .interval_index import IntervalIndex
+
 class Paragraph:
     def __init__(self, start_time, end_time, text_content, multi_modal_data=None):
         self.start_time = start_time
@@ -13,8 +15,13 @@ class MilanoBook:
         self.title = title
         self.author = author
         self.source_url = source_url
+        # 入库时预计算的摘要和关键术语
+        self.abstract = ""
+        self.key_terms = []
         self._paragraphs = []
         self._items = []
+        # 段落时间区间索引，第一次按时间查询时建立
+        self._interval_index = None
         
     @property
     def paragraphs(self):
@@ -26,12 +33,35 @@ class MilanoBook:
         
     def add_paragraph(self, paragraph):
         self._paragraphs.append(paragraph)
+        self._interval_index = None
         
     def add_item(self, item):
         self._items.append(item)
         
+    def _time_index(self):
+        # 直接修改了段落列表（数量变化）时重建索引
+        index = getattr(self, "_interval_index", None)
+        if index is None or index.size != len(self._paragraphs):
+            index = self._interval_index = IntervalIndex(self._paragraphs)
+        return index
+        
+    def get_paragraph_indices_by_time(self, start_time, end_time):
+        """与[start_time, end_time]有重叠的段落序号（升序）"""
+        return self._time_index().query(start_time, end_time)
+        
     def get_paragraphs_by_time(self, start_time, end_time):
-        return [p for p in self._paragraphs if not (p.end_time < start_time or p.start_time > end_time)]
+        paragraphs = self._paragraphs
+        return [paragraphs[i] for i in self.get_paragraph_indices_by_time(start_time, end_time)]
+        
+    def get_paragraphs_by_time_ranges(self, ranges):
+        """批量查询，ranges为[(start_time, end_time)]，返回与之一一对应的段落列表"""
+        paragraphs = self._paragraphs
+        return [[paragraphs[i] for i in indices] for indices in self._time_index().query_many(ranges)]
+        
+    def get_paragraphs_at(self, times):
+        """批量查找包含每个时间点（如关键帧时间）的段落，没有时为None"""
+        paragraphs = self._paragraphs
+        return [paragraphs[i] if i >= 0 else None for i in self._time_index().locate(times).tolist()]
         
     def __repr__(self):
         return f"MilanoBook(title='{self.title}', author='{self.author}', paragraphs={len(self._paragraphs)}, items={len(self._items)})"
@@ -0,0 +1,194 @@
+import errno
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from .locks import file_lock
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Linux的FICLONE ioctl，btrfs、XFS等文件系统上创建共享数据块的副本（reflink）
+_FICLONE = 0x40049409
+
+# 计算哈希时每次读取的字节数
+_CHUNK_SIZE = 1024 * 1024
+
+def file_sha256(path):
+    """流式计算文件的SHA-256，不把整个文件读入内存"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _reflink(source, target):
+    """尝试创建reflink副本，文件系统不支持时返回False"""
+    if fcntl is None:
+        return False
+    try:
+        with open(source, "rb") as src, open(target, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        return True
+    except OSError:
+        if os.path.exists(target):
+            os.remove(target)
+        return False
+
+
+def link_file(source, target):
+    """
+    让target拥有与source相同的内容，尽量不复制数据
+
+    依次尝试硬链接、reflink，都不支持时（如跨文件系统）才复制文件。
+
+    Returns:
+        使用的方式：hardlink、reflink或copy
+    """
+    if os.path.exists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+        return "hardlink"
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EACCES):
+            raise
+    if _reflink(source, target):
+        return "reflink"
+    shutil.copyfile(source, target)
+    return "copy"
+
+
+class BlobStore:
+    """按内容寻址的媒体文件仓库
+
+    每个文件按SHA-256保存一份：blobs/<前两位>/<sha256>；书籍文件夹中的媒体文件只是指向它的硬链接
+    （或reflink、副本）。blobs/refs.json记录每本书引用的媒体，同一个文件被多本书引用时只占用一份空间，
+    最后一个引用释放后才删除。引用表的读-改-写持有blobs/refs.json.lock文件锁，多个进程同时写入也不会丢失引用。
+    """
+
+    def __init__(self, blob_dir):
+        self.blob_dir = blob_dir
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self._refs_path = os.path.join(self.blob_dir, "refs.json")
+        self._refs_lock_path = self._refs_path + ".lock"
+
+    def blob_path(self, sha256):
+        return os.path.join(self.blob_dir, sha256[:2], sha256)
+
+    def ingest(self, source_path, move=True):
+        """
+        把文件放入仓库，已存在相同内容的文件时不再保存第二份
+
+        Args:
+            source_path: 源文件
+            move: 是否移走源文件（下载的临时文件），False时保留源文件
+
+        Returns:
+            文件的sha256
+        """
+        sha256 = file_sha256(source_path)
+        blob_path = self.blob_path(sha256)
+        if os.path.exists(blob_path):
+            if move:
+                os.remove(source_path)
+            return sha256
+
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        tmp_path = f"{blob_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if move:
+            shutil.move(source_path, tmp_path)
+        else:
+            link_file(source_path, tmp_path)
+        os.replace(tmp_path, blob_path)
+        return sha256
+
+    def add_media(self, book_id, kind, source_path, target_path, move=True):
+        """
+        把媒体文件放入仓库，链接到target_path，并记录为book_id的kind（video或audio）媒体
+
+        Returns:
+            {"sha256", "filename", "size"}
+        """
+        with file_lock(self._refs_lock_path):
+            sha256 = self.ingest(source_path, move)
+            link_file(self.blob_path(sha256), target_path)
+
+            media = {
+                "sha256": sha256,
+                "filename": os.path.basename(target_path),
+                "size": os.path.getsize(self.blob_path(sha256))
+            }
+            refs = self._read_refs()
+            previous = refs.setdefault(book_id, {}).get(kind)
+            refs[book_id][kind] = media
+            self._write_refs(refs)
+            if previous and previous["sha256"] != sha256:
+                self._collect([previous["sha256"]], refs)
+            return media
+
+    def get_media(self, book_id):
+        """书籍引用的媒体 {kind: {"sha256", "filename", "size"}}"""
+        return dict(self._read_refs().get(book_id, {}))
+
+    def media_table(self):
+        """全部书籍引用的媒体 {book_id: {kind: {"sha256", "filename", "size"}}}，批量查询时只读取一次引用表"""
+        return self._read_refs()
+
+    def release(self, book_id):
+        """
+        释放书籍的全部媒体引用，删除不再被任何书籍引用的文件
+
+        Returns:
+            释放的字节数
+        """
+        with file_lock(self._refs_lock_path):
+            refs = self._read_refs()
+            media = refs.pop(book_id, None)
+            if not media:
+                return 0
+            self._write_refs(refs)
+            return self._collect([m["sha256"] for m in media.values()], refs)
+
+    def ref_counts(self):
+        """每个文件被引用的次数"""
+        counts = {}
+        for media in self._read_refs().values():
+            for m in media.values():
+                counts[m["sha256"]] = counts.get(m["sha256"], 0) + 1
+        return counts
+
+    def _collect(self, candidates, refs):
+        """删除candidates中引用数为0的文件，返回释放的字节数"""
+        referenced = {m["sha256"] for media in refs.values() for m in media.values()}
+        freed = 0
+        for sha256 in set(candidates) - referenced:
+            blob_path = self.blob_path(sha256)
+            if os.path.exists(blob_path):
+                freed += os.path.getsize(blob_path)
+                os.remove(blob_path)
+                try:
+                    os.rmdir(os.path.dirname(blob_path))
+                except OSError:
+                    # 目录中还有其他文件
+                    pass
+        return freed
+
+    def _read_refs(self):
+        try:
+            with open(self._refs_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _write_refs(self, refs):
+        """原子地写入引用表（先写临时文件再替换）"""
+        tmp_path = f"{self._refs_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(refs, f, ensure_ascii=False)
+        os.replace(tmp_path, self._refs_path)
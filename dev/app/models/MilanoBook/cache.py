@@ -0,0 +1,91 @@
+import threading
+from collections import OrderedDict
+
+
+class BookCache:
+    """已加载MilanoBook对象的LRU缓存
+
+    按书籍数量和估算的内存占用双重限制容量；每个条目都带有加载时的签名
+    （文件mtime/大小或数据库更新时间），签名变化即视为失效。
+    """
+
+    def __init__(self, max_books=32, max_bytes=256 * 1024 * 1024):
+        self.max_books = max_books
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, book_id, signature):
+        """取出签名一致的缓存对象，没有或已失效时返回None"""
+        with self._lock:
+            entry = self._entries.get(book_id)
+            if entry is None or entry[0] != signature:
+                if entry is not None:
+                    self._remove(book_id)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(book_id)
+            self.hits += 1
+            return entry[1]
+
+    def peek(self, book_id, signature):
+        """取出签名一致的缓存对象，不影响淘汰顺序和命中统计"""
+        with self._lock:
+            entry = self._entries.get(book_id)
+            if entry is None or entry[0] != signature:
+                return None
+            return entry[1]
+
+    def put(self, book_id, signature, milano_book):
+        """放入缓存，超出容量时淘汰最久未使用的条目"""
+        size = estimate_size(milano_book)
+        if self.max_books <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(book_id)
+            self._entries[book_id] = (signature, milano_book, size)
+            self._bytes += size
+            while len(self._entries) > self.max_books or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def invalidate(self, book_id=None):
+        """移除指定书籍的缓存，book_id为None时清空"""
+        with self._lock:
+            if book_id is None:
+                self._entries.clear()
+                self._bytes = 0
+            else:
+                self._remove(book_id)
+
+    def info(self):
+        """缓存统计"""
+        with self._lock:
+            return {
+                "books": len(self._entries),
+                "bytes": self._bytes,
+                "max_books": self.max_books,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+    def _remove(self, book_id):
+        entry = self._entries.pop(book_id, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+
+def estimate_size(milano_book):
+    """粗略估算MilanoBook对象占用的内存字节数
+
+    以段落文本为主（CPython中汉字字符串每字约2~4字节），另加每个段落和Item的对象开销。
+    """
+    size = 1024 + len(milano_book.abstract) * 4
+    for paragraph in milano_book.paragraphs:
+        size += 400 + len(paragraph.text_content) * 4 + len(str(paragraph.multi_modal_data)) * 2
+    size += 200 * len(milano_book.items)
+    return size
@@ -0,0 +1,172 @@
+import gzip
+import io
+import json
+import struct
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# book.json数据结构的版本号，旧文件没有这个字段，视为版本1
+# 版本3起，Items中的书内段落保存为 {"type": "ParagraphRef", "index": 序号}
+# 版本4起，RelationGraph完整保存节点、边的序号数组和关系类型表
+FORMAT_VERSION = 4
+
+# 各存储格式对应的文件名；读取时按顺序查找
+BOOK_FORMATS = {
+    "json": "book.json",
+    "compact": "book.json",
+    "gzip": "book.json.gz",
+    "zstd": "book.json.zst",
+    "segmented": "book.mbk"
+}
+BOOK_FILE_NAMES = ["book.json", "book.json.gz", "book.json.zst", "book.mbk"]
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# 分段格式：魔数 | 头部长度(uint32) | 头部JSON | 段落偏移表((n+1)个uint64) | 段落块 | Items块
+# 偏移量相对段落块起点，第n+1个偏移量即Items块的起点；整个文件可以直接mmap
+SEGMENTED_MAGIC = b"MILANOBK"
+_HEADER_LENGTH = struct.Struct("<I")
+_OFFSET_SIZE = 8
+
+
+def _dumps(data):
+    """无缩进编码为JSON字节，优先使用orjson"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY)
+        except TypeError:
+            # orjson不支持的类型（如非字符串键）交给标准库处理
+            pass
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _loads(raw):
+    """解码JSON字节"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(bytes(raw).decode("utf-8"))
+
+
+def encode_book(book_data, book_format="json"):
+    """
+    把书籍数据编码为字节
+
+    Args:
+        book_data: 书籍数据字典
+        book_format: json（缩进，便于阅读）、compact（无缩进，优先使用orjson）、gzip或zstd（compact再压缩），
+            或segmented（分段格式，支持只读取元数据或部分段落）
+
+    Returns:
+        编码后的字节
+    """
+    if book_format not in BOOK_FORMATS:
+        raise ValueError(f"未知的书籍存储格式：{book_format}")
+
+    if book_format == "json":
+        return json.dumps(book_data, ensure_ascii=False, indent=2).encode("utf-8")
+    if book_format == "segmented":
+        return encode_segmented(book_data)
+
+    raw = _dumps(book_data)
+    if book_format == "gzip":
+        return gzip.compress(raw, compresslevel=6)
+    if book_format == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd格式需要安装zstandard：pip install zstandard")
+        return zstandard.ZstdCompressor(level=3).compress(raw)
+    return raw
+
+
+def decode_book(raw):
+    """根据文件头自动识别格式，把字节解码为书籍数据字典"""
+    if raw.startswith(SEGMENTED_MAGIC):
+        return SegmentedBookFile(io.BytesIO(raw)).read_all()
+    if raw.startswith(_GZIP_MAGIC):
+        raw = gzip.decompress(raw)
+    elif raw.startswith(_ZSTD_MAGIC):
+        if zstandard is None:
+            raise RuntimeError("读取zstd格式的书籍需要安装zstandard：pip install zstandard")
+        raw = zstandard.ZstdDecompressor().decompressobj().decompress(raw)
+
+    return _loads(raw)
+
+
+def encode_segmented(book_data):
+    """把书籍数据编码为分段格式"""
+    paragraphs = [_dumps(p) for p in book_data["paragraphs"]]
+    header = {k: v for k, v in book_data.items() if k not in ("paragraphs", "items")}
+    header["paragraph_count"] = len(paragraphs)
+    header_bytes = _dumps(header)
+
+    offsets = [0]
+    for paragraph in paragraphs:
+        offsets.append(offsets[-1] + len(paragraph))
+
+    return b"".join([
+        SEGMENTED_MAGIC,
+        _HEADER_LENGTH.pack(len(header_bytes)),
+        header_bytes,
+        struct.pack(f"<{len(offsets)}Q", *offsets),
+        *paragraphs,
+        _dumps(book_data["items"])
+    ])
+
+
+class SegmentedBookFile:
+    """分段格式书籍文件的随机读取器
+
+    打开时只读取头部；读取一段段落只需要读取对应的偏移量和段落字节，与书籍总长度无关。
+    fileobj可以是以二进制模式打开的文件、BytesIO或mmap对象。
+    """
+
+    def __init__(self, fileobj):
+        self._file = fileobj
+        self._file.seek(0)
+        if self._file.read(len(SEGMENTED_MAGIC)) != SEGMENTED_MAGIC:
+            raise ValueError("不是分段格式的书籍文件")
+        (header_length,) = _HEADER_LENGTH.unpack(self._file.read(_HEADER_LENGTH.size))
+        self.header = _loads(self._file.read(header_length))
+        self.paragraph_count = self.header["paragraph_count"]
+        self._offsets_start = len(SEGMENTED_MAGIC) + _HEADER_LENGTH.size + header_length
+        self._paragraphs_start = self._offsets_start + _OFFSET_SIZE * (self.paragraph_count + 1)
+
+    def _offsets(self, start, end):
+        """读取第start到第end个偏移量（含两端）"""
+        count = end - start + 1
+        self._file.seek(self._offsets_start + _OFFSET_SIZE * start)
+        return struct.unpack(f"<{count}Q", self._file.read(_OFFSET_SIZE * count))
+
+    def read_paragraphs(self, start=0, end=None):
+        """读取[start, end)范围内的段落数据"""
+        end = self.paragraph_count if end is None else min(end, self.paragraph_count)
+        start = max(0, min(start, end))
+        if start == end:
+            return []
+
+        offsets = self._offsets(start, end)
+        self._file.seek(self._paragraphs_start + offsets[0])
+        block = memoryview(self._file.read(offsets[-1] - offsets[0]))
+        base = offsets[0]
+        return [_loads(block[offsets[i] - base:offsets[i + 1] - base]) for i in range(len(offsets) - 1)]
+
+    def read_items(self):
+        """读取Items数据"""
+        (items_offset,) = self._offsets(self.paragraph_count, self.paragraph_count)
+        self._file.seek(self._paragraphs_start + items_offset)
+        return _loads(self._file.read())
+
+    def read_all(self):
+        """读取完整的书籍数据字典"""
+        book_data = {k: v for k, v in self.header.items() if k != "paragraph_count"}
+        book_data["paragraphs"] = self.read_paragraphs()
+        book_data["items"] = self.read_items()
+        return book_data
@@ -0,0 +1,100 @@
+import numpy as np
+
+
+class IntervalIndex:
+    """段落时间区间的静态索引
+
+    段落按开始时间排序，另外保存排序后的前缀最大结束时间（非递减）。查询与[low, high]有重叠的段落时，
+    开始时间不晚于high的段落是排序后的一个前缀，前缀最大结束时间不早于low的位置是一个后缀，
+    两次二分查找后只需检查二者交集中的段落，耗时O(log n + k)（段落之间基本不重叠时k约等于结果数）。
+    批量查询用NumPy的searchsorted一次完成所有二分查找。
+    """
+
+    def __init__(self, paragraphs):
+        """
+        Args:
+            paragraphs: 段落列表，索引建立后段落的时间不应再修改
+        """
+        starts = np.array([p.start_time for p in paragraphs], dtype=np.float64)
+        ends = np.array([p.end_time for p in paragraphs], dtype=np.float64)
+        self.size = len(paragraphs)
+        # 稳定排序，开始时间相同的段落保持原来的先后顺序
+        self.order = np.argsort(starts, kind="stable")
+        self.starts = starts[self.order]
+        self.ends = ends[self.order]
+        self.max_ends = np.maximum.accumulate(self.ends) if self.size else self.ends
+
+    def query(self, low, high):
+        """
+        与[low, high]有重叠（end >= low且start <= high）的段落序号，按序号升序排列
+
+        Returns:
+            段落序号列表
+        """
+        first = int(np.searchsorted(self.max_ends, low, side="left"))
+        last = int(np.searchsorted(self.starts, high, side="right"))
+        return self._collect(first, last, low)
+
+    def query_many(self, ranges):
+        """
+        批量查询多个时间范围
+
+        Args:
+            ranges: [(low, high)]
+
+        Returns:
+            与ranges一一对应的段落序号列表
+        """
+        if len(ranges) == 0:
+            return []
+        bounds = np.asarray(ranges, dtype=np.float64).reshape(-1, 2)
+        firsts = np.searchsorted(self.max_ends, bounds[:, 0], side="left")
+        lasts = np.searchsorted(self.starts, bounds[:, 1], side="right")
+        return [
+            self._collect(int(first), int(last), low)
+            for first, last, low in zip(firsts, lasts, bounds[:, 0])
+        ]
+
+    def locate(self, times):
+        """
+        批量查找包含每个时间点的段落
+
+        有多个段落包含同一时间点时，取开始时间最晚的一个。
+
+        Args:
+            times: 时间点序列（秒）
+
+        Returns:
+            与times一一对应的段落序号数组，没有段落包含该时间点时为-1
+        """
+        times = np.asarray(times, dtype=np.float64)
+        result = np.full(times.shape, -1, dtype=np.int64)
+        if self.size == 0 or times.size == 0:
+            return result
+
+        # 开始时间不晚于t的最后一个段落
+        positions = np.searchsorted(self.starts, times, side="right") - 1
+        valid = positions >= 0
+        clipped = np.clip(positions, 0, None)
+        hit = valid & (self.ends[clipped] >= times)
+        result[hit] = self.order[clipped[hit]]
+
+        # 段落之间有重叠时，最后开始的段落可能已经结束而更早的长段落仍包含t，逐个向前查找
+        pending = np.nonzero(valid & ~hit & (self.max_ends[clipped] >= times))[0]
+        for i in pending:
+            t = times[i]
+            for position in range(int(positions[i]) - 1, -1, -1):
+                if self.max_ends[position] < t:
+                    break
+                if self.ends[position] >= t:
+                    result[i] = self.order[position]
+                    break
+        return result
+
+    def _collect(self, first, last, low):
+        """排序后位置[first, last)中结束时间不早于low的段落序号"""
+        if first >= last:
+            return []
+        positions = np.arange(first, last)
+        matched = self.order[positions[self.ends[first:last] >= low]]
+        return sorted(matched.tolist())
@@ -0,0 +1,74 @@
+from .__init__ import MilanoBook
+
+class LazyMilanoBook(MilanoBook):
+    """按需加载段落和Items的MilanoBook
+
+    创建时只包含元数据；第一次访问paragraphs或items时才通过加载函数读取，
+    get_paragraph和get_paragraph_range只读取需要的段落。
+    同一序号的段落无论通过哪种方式读取，都是同一个Paragraph对象。
+    """
+
+    def __init__(self, metadata, load_paragraphs, load_items):
+        """
+        Args:
+            metadata: 书籍元数据，包含title、author、source_url、abstract、key_terms和paragraph_count
+            load_paragraphs: load_paragraphs(start, end)，返回[start, end)范围内的Paragraph列表
+            load_items: load_items(paragraphs)，根据完整的段落列表返回Item列表
+        """
+        self.title = metadata["title"]
+        self.author = metadata["author"]
+        self.source_url = metadata["source_url"]
+        self.abstract = metadata.get("abstract", "")
+        self.key_terms = metadata.get("key_terms", [])
+        self.paragraph_count = metadata["paragraph_count"]
+        self._load_paragraphs = load_paragraphs
+        self._load_items = load_items
+        self._paragraph_cache = {}
+        self._all_paragraphs = None
+        self._all_items = None
+        self._interval_index = None
+
+    @property
+    def _paragraphs(self):
+        if self._all_paragraphs is None:
+            self._all_paragraphs = self.get_paragraph_range(0, self.paragraph_count)
+        return self._all_paragraphs
+
+    @property
+    def _items(self):
+        if self._all_items is None:
+            self._all_items = self._load_items(self._paragraphs)
+        return self._all_items
+
+    @property
+    def paragraphs_loaded(self):
+        """是否已经加载了全部段落"""
+        return self._all_paragraphs is not None
+
+    @property
+    def items_loaded(self):
+        """是否已经加载了Items"""
+        return self._all_items is not None
+
+    def get_paragraph(self, index):
+        """按序号读取单个段落"""
+        if not 0 <= index < self.paragraph_count:
+            raise IndexError(f"段落序号超出范围：{index}")
+        return self.get_paragraph_range(index, index + 1)[0]
+
+    def get_paragraph_range(self, start, end):
+        """读取[start, end)范围内的段落，已读取过的段落不会重复读取"""
+        start = max(0, start)
+        end = min(end, self.paragraph_count)
+        if self._all_paragraphs is not None:
+            return self._all_paragraphs[start:end]
+
+        missing = [i for i in range(start, end) if i not in self._paragraph_cache]
+        if missing:
+            # 一次读取覆盖所有缺失段落的连续区间
+            for offset, paragraph in enumerate(self._load_paragraphs(missing[0], missing[-1] + 1)):
+                self._paragraph_cache.setdefault(missing[0] + offset, paragraph)
+        return [self._paragraph_cache[i] for i in range(start, end)]
+
+    def __repr__(self):
+        return f"LazyMilanoBook(title='{self.title}', author='{self.author}', paragraphs={self.paragraph_count})"
@@ -0,0 +1,56 @@
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# 锁文件的绝对路径 -> _FileLock，同一进程内对同一个锁文件共享
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+class _FileLock:
+    """同一个锁文件在进程内的状态：可重入的线程锁、嵌套层数和持有flock的文件"""
+
+    def __init__(self):
+        self.rlock = threading.RLock()
+        self.depth = 0
+        self.file = None
+
+
+@contextmanager
+def file_lock(lock_path):
+    """
+    对共享的索引文件做读-改-写时持有的排他锁，同时在线程之间和进程之间（多个gunicorn worker、命令行工具）互斥
+
+    进程内用按路径共享的可重入线程锁，最外层再对锁文件加fcntl.flock；flock属于打开的文件，
+    同一线程嵌套获取时不会重复加锁。没有fcntl的平台（Windows）只有进程内的线程锁。
+
+    Args:
+        lock_path: 锁文件路径，不存在时创建
+    """
+    lock_path = os.path.abspath(lock_path)
+    with _locks_guard:
+        lock = _locks.setdefault(lock_path, _FileLock())
+
+    with lock.rlock:
+        if lock.depth == 0 and fcntl is not None:
+            lock.file = open(lock_path, "a")
+            try:
+                fcntl.flock(lock.file.fileno(), fcntl.LOCK_EX)
+            except BaseException:
+                lock.file.close()
+                lock.file = None
+                raise
+        lock.depth += 1
+        try:
+            yield
+        finally:
+            lock.depth -= 1
+            if lock.depth == 0 and lock.file is not None:
+                fcntl.flock(lock.file.fileno(), fcntl.LOCK_UN)
+                lock.file.close()
+                lock.file = None
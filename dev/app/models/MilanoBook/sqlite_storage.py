@@ -0,0 +1,398 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from .__init__ import MilanoBook, Paragraph
+from .Item.__init__ import Item
+from .Item.StuffList import StuffList
+from .Item.Timeline import Timeline
+from .Item.RelationGraph import RelationGraph
+from .storage import MilanoBookStorage, _is_paragraph
+from .lazy import LazyMilanoBook
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS books (
+    book_id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    author TEXT NOT NULL,
+    source_url TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    abstract TEXT NOT NULL DEFAULT '',
+    key_terms TEXT NOT NULL DEFAULT '[]'
+);
+CREATE INDEX IF NOT EXISTS books_created_at ON books(created_at);
+CREATE TABLE IF NOT EXISTS paragraphs (
+    book_id TEXT NOT NULL REFERENCES books(book_id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    start_time REAL NOT NULL,
+    end_time REAL NOT NULL,
+    text_content TEXT NOT NULL,
+    multi_modal_data TEXT NOT NULL,
+    PRIMARY KEY (book_id, position)
+);
+CREATE INDEX IF NOT EXISTS paragraphs_time ON paragraphs(book_id, start_time);
+CREATE TABLE IF NOT EXISTS items (
+    item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    book_id TEXT NOT NULL REFERENCES books(book_id) ON DELETE CASCADE,
+    parent_id INTEGER REFERENCES items(item_id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS items_book ON items(book_id, parent_id, position);
+CREATE TABLE IF NOT EXISTS item_members (
+    item_id INTEGER NOT NULL REFERENCES items(item_id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    time_point REAL,
+    paragraph_position INTEGER,
+    child_item_id INTEGER REFERENCES items(item_id) ON DELETE CASCADE,
+    payload TEXT,
+    PRIMARY KEY (item_id, position)
+);
+CREATE INDEX IF NOT EXISTS item_members_paragraph ON item_members(paragraph_position);
+"""
+
+class SQLiteMilanoBookStorage(MilanoBookStorage):
+    """基于SQLite（WAL模式）的MilanoBook存储管理器
+
+    与MilanoBookStorage接口相同；书籍、段落、Item和Item成员分别存放在规范化的表中，
+    引用书内段落的成员只保存段落序号。媒体文件与MilanoBookStorage一样保存在storage_dir下的媒体仓库中。
+    每个线程使用独立的连接，可以被多个工作进程同时访问。
+    """
+
+    def __init__(self, storage_dir="milano_books", db_path=None, cache_books=None, cache_bytes=None):
+        """初始化存储管理器并创建数据表"""
+        super().__init__(storage_dir, cache_books, cache_bytes)
+        self.db_path = db_path or os.path.join(self.storage_dir, "library.db")
+        self._local = threading.local()
+
+        conn = self._connect()
+        conn.executescript(_SCHEMA)
+        conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0)")
+        conn.commit()
+
+    def _connect(self):
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _write_book(self, book_id, milano_book, created_at):
+        """在一个事务中替换书籍的全部行"""
+        conn = self._connect()
+        paragraph_index = {id(p): i for i, p in enumerate(milano_book.paragraphs)}
+
+        with conn:
+            conn.execute("DELETE FROM books WHERE book_id = ?", (book_id,))
+            conn.execute(
+                "INSERT INTO books (book_id, title, author, source_url, created_at, updated_at, abstract, key_terms) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (book_id, milano_book.title, milano_book.author, milano_book.source_url, created_at,
+                 time.time(), milano_book.abstract, json.dumps(milano_book.key_terms, ensure_ascii=False))
+            )
+            conn.executemany(
+                "INSERT INTO paragraphs (book_id, position, start_time, end_time, text_content, multi_modal_data) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (book_id, i, p.start_time, p.end_time, p.text_content,
+                     json.dumps(p.multi_modal_data, ensure_ascii=False))
+                    for i, p in enumerate(milano_book.paragraphs)
+                ]
+            )
+            for position, item in enumerate(milano_book.items):
+                self._insert_item(conn, book_id, None, position, item, paragraph_index)
+            conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+
+    def _insert_item(self, conn, book_id, parent_id, position, item, paragraph_index):
+        """插入一个Item及其成员，嵌套的Item递归插入"""
+        item_type = type(item).__name__
+        if isinstance(item, RelationGraph):
+            sources, targets, relations, relation_types = item.to_arrays()
+            members = [(None, node) for node in item.nodes]
+            data = {
+                "relation_types": relation_types,
+                "edges": {"source": sources, "target": targets, "relation": relations}
+            }
+        elif isinstance(item, Timeline):
+            members = list(item.content)
+            data = None
+        else:
+            members = [(None, content) for content in item.content]
+            data = None
+
+        cursor = conn.execute(
+            "INSERT INTO items (book_id, parent_id, position, type, name, description, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (book_id, parent_id, position, item_type, item.name, item.description,
+             json.dumps(data, ensure_ascii=False) if data is not None else None)
+        )
+        item_id = cursor.lastrowid
+
+        for member_position, (time_point, content) in enumerate(members):
+            paragraph_position = None
+            child_item_id = None
+            payload = None
+            if _is_paragraph(content) and id(content) in paragraph_index:
+                paragraph_position = paragraph_index[id(content)]
+            elif isinstance(content, Item):
+                child_item_id = self._insert_item(conn, book_id, item_id, member_position, content, paragraph_index)
+            else:
+                # 书外的段落或其他内容直接内嵌
+                payload = json.dumps(self._serialize_content(content), ensure_ascii=False)
+            conn.execute(
+                "INSERT INTO item_members (item_id, position, time_point, paragraph_position, child_item_id, payload) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (item_id, member_position, time_point, paragraph_position, child_item_id, payload)
+            )
+        return item_id
+
+    def _book_signature(self, book_id):
+        """书籍当前版本的签名（数据库中的更新时间），书籍不存在时抛出FileNotFoundError"""
+        row = self._connect().execute("SELECT updated_at FROM books WHERE book_id = ?", (book_id,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(f"书籍 {book_id} 不存在")
+        return row["updated_at"]
+
+    def book_modified_at(self, book_id):
+        """书籍最后一次写入的时间（Unix时间戳）"""
+        return self._book_signature(book_id)
+
+    def export_book_data(self, book_id):
+        """与JSON后端相同结构的书籍数据字典，用于导出"""
+        row = self._connect().execute("SELECT created_at FROM books WHERE book_id = ?", (book_id,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(f"书籍 {book_id} 不存在")
+        return self._serialize_book(book_id, self._read_book(book_id), row["created_at"])
+
+    def _read_book(self, book_id):
+        """从数据库加载MilanoBook对象，不经过缓存"""
+        conn = self._connect()
+        row = conn.execute("SELECT * FROM books WHERE book_id = ?", (book_id,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(f"书籍 {book_id} 不存在")
+
+        milano_book = MilanoBook(title=row["title"], author=row["author"], source_url=row["source_url"])
+        milano_book.abstract = row["abstract"]
+        milano_book.key_terms = json.loads(row["key_terms"])
+
+        for paragraph in self._read_paragraphs(book_id):
+            milano_book.add_paragraph(paragraph)
+        for item in self._read_items(book_id, milano_book.paragraphs):
+            milano_book.add_item(item)
+
+        return milano_book
+
+    def open_book(self, book_id):
+        """打开书籍但只读取元数据，段落和Items在访问时按需查询"""
+        signature = self._book_signature(book_id)
+        cached = self.book_cache.peek(book_id, signature)
+        if cached is not None:
+            return self._lazy_from_book(cached)
+
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT title, author, source_url, abstract, key_terms, "
+            "(SELECT COUNT(*) FROM paragraphs p WHERE p.book_id = books.book_id) AS paragraph_count "
+            "FROM books WHERE book_id = ?", (book_id,)
+        ).fetchone()
+        if row is None:
+            raise FileNotFoundError(f"书籍 {book_id} 不存在")
+
+        metadata = dict(row)
+        metadata["key_terms"] = json.loads(metadata["key_terms"])
+        return LazyMilanoBook(
+            metadata,
+            lambda start, end: self._read_paragraphs(book_id, start, end),
+            lambda paragraphs: self._read_items(book_id, paragraphs)
+        )
+
+    def query_paragraphs(self, book_id, start_time=None, end_time=None, offset=0, limit=None):
+        """分页查询书籍的段落，过滤和分页在SQL中完成（使用(book_id, start_time)索引）"""
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM books WHERE book_id = ?", (book_id,)).fetchone() is None:
+            raise FileNotFoundError(f"书籍 {book_id} 不存在")
+
+        where = "book_id = ?"
+        params = [book_id]
+        if end_time is not None:
+            where += " AND start_time <= ?"
+            params.append(end_time)
+        if start_time is not None:
+            where += " AND end_time >= ?"
+            params.append(start_time)
+
+        total = conn.execute(f"SELECT COUNT(*) FROM paragraphs WHERE {where}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT position, start_time, end_time, text_content, multi_modal_data FROM paragraphs "
+            f"WHERE {where} ORDER BY position LIMIT ? OFFSET ?",
+            params + [-1 if limit is None else limit, offset]
+        )
+        return total, [
+            (p["position"], Paragraph(
+                start_time=p["start_time"],
+                end_time=p["end_time"],
+                text_content=p["text_content"],
+                multi_modal_data=json.loads(p["multi_modal_data"])
+            ))
+            for p in rows
+        ]
+
+    def _read_paragraphs(self, book_id, start=0, end=None):
+        """按序号读取[start, end)范围内的段落"""
+        rows = self._connect().execute(
+            "SELECT start_time, end_time, text_content, multi_modal_data FROM paragraphs "
+            "WHERE book_id = ? AND position >= ? AND position < ? ORDER BY position",
+            (book_id, start, end if end is not None else 2 ** 62)
+        )
+        return [
+            Paragraph(
+                start_time=p["start_time"],
+                end_time=p["end_time"],
+                text_content=p["text_content"],
+                multi_modal_data=json.loads(p["multi_modal_data"])
+            )
+            for p in rows
+        ]
+
+    def _read_items(self, book_id, paragraphs):
+        """读取书籍的全部Item，段落引用解析为paragraphs中的对象"""
+        conn = self._connect()
+
+        # 一次读出整本书的Item和成员，再在内存中组装
+        items = {}
+        children = {}
+        for item_row in conn.execute(
+            "SELECT * FROM items WHERE book_id = ? ORDER BY parent_id, position", (book_id,)
+        ):
+            items[item_row["item_id"]] = item_row
+            children.setdefault(item_row["parent_id"], []).append(item_row["item_id"])
+
+        members = {}
+        for member_row in conn.execute(
+            "SELECT m.* FROM item_members m JOIN items i ON m.item_id = i.item_id "
+            "WHERE i.book_id = ? ORDER BY m.item_id, m.position", (book_id,)
+        ):
+            members.setdefault(member_row["item_id"], []).append(member_row)
+
+        return [self._build_item(item_id, items, members, paragraphs) for item_id in children.get(None, [])]
+
+    def _build_item(self, item_id, items, members, paragraphs):
+        """根据数据库行组装Item对象"""
+        row = items[item_id]
+        contents = []
+        for member in members.get(item_id, []):
+            if member["paragraph_position"] is not None:
+                content = paragraphs[member["paragraph_position"]]
+            elif member["child_item_id"] is not None:
+                content = self._build_item(member["child_item_id"], items, members, paragraphs)
+            else:
+                content = self._deserialize_content(json.loads(member["payload"]))
+            contents.append((member["time_point"], content))
+
+        if row["type"] == "StuffList":
+            item = StuffList(name=row["name"], description=row["description"])
+        elif row["type"] == "Timeline":
+            item = Timeline(name=row["name"], description=row["description"])
+            item.extend(contents)
+            return item
+        elif row["type"] == "RelationGraph":
+            data = json.loads(row["data"])
+            edges = data["edges"]
+            return RelationGraph.from_arrays(
+                row["name"],
+                row["description"],
+                [content for _, content in contents],
+                edges["source"],
+                edges["target"],
+                edges["relation"],
+                data["relation_types"]
+            )
+        else:
+            item = Item(name=row["name"], description=row["description"])
+
+        for _, content in contents:
+            item.add_content(content)
+        return item
+
+    def list_books(self, sort_by="created_at", reverse=True, limit=None, offset=0):
+        """列出所有存储的书籍，排序和分页在SQL中完成"""
+        if sort_by not in ("created_at", "title", "author"):
+            raise ValueError(f"不支持的排序字段：{sort_by}")
+
+        order = "DESC" if reverse else "ASC"
+        rows = self._connect().execute(
+            f"SELECT book_id, title, author, created_at FROM books "
+            f"ORDER BY {sort_by} {order}, created_at {order} LIMIT ? OFFSET ?",
+            (-1 if limit is None else limit, offset)
+        )
+        return [dict(row) for row in rows]
+
+    def count_books(self):
+        """书籍总数"""
+        return self._connect().execute("SELECT COUNT(*) FROM books").fetchone()[0]
+
+    def catalog_version(self):
+        """书库版本号，每次保存或删除书籍都会递增"""
+        return self._connect().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def rebuild_catalog(self):
+        """数据库本身就是索引，无需重建"""
+        return None
+
+    def reencode_all(self, book_format=None):
+        """数据库后端没有书籍数据文件，无需转换"""
+        return []
+
+    def delete_book(self, book_id):
+        """删除书籍的全部行和书籍文件夹"""
+        conn = self._connect()
+        with conn:
+            deleted = conn.execute("DELETE FROM books WHERE book_id = ?", (book_id,)).rowcount
+            if deleted:
+                conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+        self.book_cache.invalidate(book_id)
+
+        book_dir = self._get_book_dir(book_id)
+        if os.path.isdir(book_dir):
+            shutil.rmtree(book_dir)
+        self.blob_store.release(book_id)
+        return bool(deleted)
+
+    def migrate_from_json(self, json_storage, overwrite=False):
+        """
+        把JSON存储（milano_books/*/book.json）中的书籍导入数据库，保留book_id和created_at
+
+        Args:
+            json_storage: 源MilanoBookStorage
+            overwrite: 是否覆盖数据库中已存在的书籍
+
+        Returns:
+            导入的book_id列表
+        """
+        conn = self._connect()
+        migrated = []
+        for entry in json_storage.list_books(reverse=False):
+            book_id = entry["book_id"]
+            exists = conn.execute("SELECT 1 FROM books WHERE book_id = ?", (book_id,)).fetchone()
+            if exists and not overwrite:
+                continue
+
+            milano_book = json_storage.load_book(book_id)
+            self._write_book(book_id, milano_book, entry["created_at"])
+            self.book_cache.invalidate(book_id)
+            migrated.append(book_id)
+        return migrated
@@ -1,30 +1,126 @@
 import json
 import os
+import bisect
+import hashlib
+import re
 import shutil
+import threading
 from datetime import datetime
 from .__init__ import MilanoBook, Paragraph
 from .Item.__init__ import Item
 from .Item.StuffList import StuffList
 from .Item.Timeline import Timeline
 from .Item.RelationGraph import RelationGraph
+from .blobs import BlobStore
+from .cache import BookCache
+from .codec import FORMAT_VERSION, BOOK_FORMATS, BOOK_FILE_NAMES, SEGMENTED_MAGIC, SegmentedBookFile, encode_book, decode_book
+from .lazy import LazyMilanoBook
+from .locks import file_lock
+
+# load_book可以单独读取的部分
+BOOK_PARTS = ("metadata", "paragraphs", "items")
+
+# 按扩展名识别书籍文件夹中的视频和音频文件，其他文件都不是媒体
+VIDEO_EXTENSIONS = (".mp4", ".m4v", ".mkv", ".webm", ".mov", ".flv", ".avi", ".ts")
+AUDIO_EXTENSIONS = (".mp3", ".m4a", ".aac", ".opus", ".ogg", ".wav", ".flac")
+
+# book_id只能是单个路径分量，防止通过..等路径访问存储目录以外的文件
+BOOK_ID_PATTERN = re.compile(r"book_\w+", re.ASCII)
+
+# 书籍文件夹中记录媒体最近访问时间的标记文件
+MEDIA_ACCESS_MARKER = ".media_accessed"
+
+# 书籍文件夹中记录被淘汰的媒体类型的标记文件，只有被淘汰的媒体才会重新下载
+MEDIA_EVICTED_MARKER = ".media_evicted"
+
+def _valid_book_id(book_id):
+    """检查book_id是否为_new_book_id生成的格式"""
+    return isinstance(book_id, str) and BOOK_ID_PATTERN.fullmatch(book_id) is not None
+
+def _is_paragraph(content):
+    """检查是否是Paragraph（按属性判断：包内通过 .__init__ 和包名导入的Paragraph不是同一个类）"""
+    return hasattr(content, 'start_time') and hasattr(content, 'end_time') and hasattr(content, 'text_content')
 
 class MilanoBookStorage:
     """MilanoBook对象的持久化存储管理器"""
     
-    def __init__(self, storage_dir="milano_books"):
-        """初始化存储管理器"""
+    def __init__(self, storage_dir="milano_books", cache_books=None, cache_bytes=None, book_format=None):
+        """
+        初始化存储管理器
+        
+        Args:
+            storage_dir: 存储目录
+            cache_books: 内存中最多缓存的书籍数，未指定时读取环境变量MILANO_BOOK_CACHE_SIZE（默认32，0表示不缓存）
+            cache_bytes: 缓存占用内存的上限（字节），未指定时读取环境变量MILANO_BOOK_CACHE_MB（默认256MB）
+            book_format: 保存书籍时使用的格式（json、compact、gzip或zstd），未指定时读取环境变量MILANO_BOOK_FORMAT（默认json）；
+                读取时自动识别，不受此参数影响
+        """
         # 创建存储目录
         self.storage_dir = storage_dir
         if not os.path.exists(self.storage_dir):
             os.makedirs(self.storage_dir)
+        
+        # 书籍目录索引，list_books只读取这个小文件
+        self._catalog_path = os.path.join(self.storage_dir, "catalog.json")
+        self._catalog_cache = None
+        # 目录索引的读-改-写在线程和进程之间都要互斥，否则并发保存时会丢失记录
+        self._catalog_lock_path = self._catalog_path + ".lock"
+        
+        # 已加载书籍的LRU缓存，load_book命中时不再读取和反序列化book.json
+        if cache_books is None:
+            cache_books = int(os.environ.get("MILANO_BOOK_CACHE_SIZE", "32"))
+        if cache_bytes is None:
+            cache_bytes = int(float(os.environ.get("MILANO_BOOK_CACHE_MB", "256")) * 1024 * 1024)
+        self.book_cache = BookCache(cache_books, cache_bytes)
+        
+        self.book_format = book_format or os.environ.get("MILANO_BOOK_FORMAT", "json")
+        if self.book_format not in BOOK_FORMATS:
+            raise ValueError(f"未知的书籍存储格式：{self.book_format}")
+        
+        # 按内容寻址的媒体仓库，相同的视频/音频只保存一份
+        self.blob_store = BlobStore(os.path.join(self.storage_dir, "blobs"))
     
     def _get_book_dir(self, book_id):
-        """获取书籍文件夹路径"""
+        """获取书籍文件夹路径，book_id格式无效时抛出FileNotFoundError"""
+        if not _valid_book_id(book_id):
+            raise FileNotFoundError(f"书籍 {book_id} 不存在")
         return os.path.join(self.storage_dir, book_id)
     
     def _get_file_path(self, book_id):
-        """获取书籍JSON文件路径"""
-        return os.path.join(self._get_book_dir(book_id), "book.json")
+        """获取书籍数据文件路径：已存在的文件（任意格式），否则为当前格式对应的文件"""
+        book_dir = self._get_book_dir(book_id)
+        for file_name in BOOK_FILE_NAMES:
+            file_path = os.path.join(book_dir, file_name)
+            if os.path.exists(file_path):
+                return file_path
+        return os.path.join(book_dir, BOOK_FORMATS[self.book_format])
+    
+    def _read_book_data(self, book_id):
+        """读取并解码书籍数据文件，自动识别格式"""
+        file_path = self._get_file_path(book_id)
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"书籍 {book_id} 不存在")
+        
+        with open(file_path, "rb") as f:
+            return decode_book(f.read())
+    
+    def _write_book_data(self, book_id, book_data, book_format=None):
+        """按指定格式写入书籍数据文件（先写临时文件再替换），并删除其他格式的旧文件"""
+        book_format = book_format or self.book_format
+        book_dir = self._get_book_dir(book_id)
+        file_path = os.path.join(book_dir, BOOK_FORMATS[book_format])
+        
+        data = encode_book(book_data, book_format)
+        tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, file_path)
+        
+        for file_name in BOOK_FILE_NAMES:
+            other_path = os.path.join(book_dir, file_name)
+            if other_path != file_path and os.path.exists(other_path):
+                os.remove(other_path)
+        return file_path
     
     def _serialize_paragraph(self, paragraph):
         """序列化Paragraph对象"""
@@ -45,8 +141,14 @@ class MilanoBookStorage:
             multi_modal_data=data["multi_modal_data"]
         )
     
-    def _serialize_item(self, item):
-        """序列化Item对象"""
+    def _serialize_item(self, item, paragraph_index=None):
+        """
+        序列化Item对象
+        
+        Args:
+            item: Item对象
+            paragraph_index: 书内段落的 {id(paragraph): 序号}，书内段落只保存为引用，其他内容完整内嵌
+        """
         item_type = type(item).__name__
         data = {
             "type": item_type,
@@ -59,52 +161,42 @@ class MilanoBookStorage:
             # 直接序列化内容，避免递归调用
             content_list = []
             for content in item.content:
-                if hasattr(content, 'start_time') and hasattr(content, 'end_time') and hasattr(content, 'text_content'):  # 检查是否是Paragraph
-                    content_list.append(self._serialize_paragraph(content))
-                elif hasattr(content, 'name') and hasattr(content, 'description'):  # 检查是否是Item
-                    content_list.append(self._serialize_item(content))
-                else:
-                    content_list.append(content)
+                content_list.append(self._serialize_content(content, paragraph_index))
             data["content"] = content_list
         elif item_type == "Timeline":
             # 转换为可序列化的列表格式，元组转换为列表
             content_list = []
             for time_point, content in item.content:
-                if hasattr(content, 'start_time') and hasattr(content, 'end_time') and hasattr(content, 'text_content'):  # 检查是否是Paragraph
-                    serialized_content = self._serialize_paragraph(content)
-                elif hasattr(content, 'name') and hasattr(content, 'description'):  # 检查是否是Item
-                    serialized_content = self._serialize_item(content)
-                else:
-                    serialized_content = content
-                content_list.append([time_point, serialized_content])
+                content_list.append([time_point, self._serialize_content(content, paragraph_index)])
             data["content"] = content_list
         elif item_type == "RelationGraph":
-            data["nodes_count"] = len(item._nodes)
-            data["edges_count"] = len(item._edges)
+            # 节点按内容序列化（书内段落为引用），边保存为节点序号数组和关系类型表
+            sources, targets, relations, relation_types = item.to_arrays()
+            data["nodes_count"] = len(item.nodes)
+            data["edges_count"] = len(item.edges)
             data["content"] = []
-            edge_types = []
-            for edge in item._edges:
-                if len(edge) >= 3:
-                    edge_types.append(edge[2])
-            data["edge_types"] = edge_types
+            data["nodes"] = [self._serialize_content(node, paragraph_index) for node in item.nodes]
+            data["relation_types"] = relation_types
+            data["edges"] = {"source": sources, "target": targets, "relation": relations}
         else:  # 处理Item基类
             if hasattr(item, 'content') and item.content:
                 content_list = []
                 for content in item.content:
-                    if hasattr(content, 'start_time') and hasattr(content, 'end_time') and hasattr(content, 'text_content'):  # 检查是否是Paragraph
-                        content_list.append(self._serialize_paragraph(content))
-                    elif hasattr(content, 'name') and hasattr(content, 'description'):  # 检查是否是Item
-                        content_list.append(self._serialize_item(content))
-                    else:
-                        content_list.append(content)
+                    content_list.append(self._serialize_content(content, paragraph_index))
                 data["content"] = content_list
             else:
                 data["content"] = []
         
         return data
     
-    def _deserialize_item(self, data):
-        """反序列化Item对象"""
+    def _deserialize_item(self, data, paragraphs=None):
+        """
+        反序列化Item对象
+        
+        Args:
+            data: 序列化的Item数据
+            paragraphs: 书内段落列表，用于解析段落引用
+        """
         item_type = data["type"]
         
         # 根据不同的Item类型创建对象
@@ -112,104 +204,438 @@ class MilanoBookStorage:
             item = StuffList(name=data["name"], description=data["description"])
             # 反序列化内容
             for content_data in data["content"]:
-                content = self._deserialize_content(content_data)
+                content = self._deserialize_content(content_data, paragraphs)
                 item.add_content(content)
         elif item_type == "Timeline":
             item = Timeline(name=data["name"], description=data["description"])
-            # 反序列化内容
-            for time_point, content_data in data["content"]:
-                content = self._deserialize_content(content_data)
-                item.add_timeline_item(time_point, content)
+            # 反序列化内容，保存时已经按时间排序
+            item.extend(
+                (time_point, self._deserialize_content(content_data, paragraphs))
+                for time_point, content_data in data["content"]
+            )
         elif item_type == "RelationGraph":
-            item = RelationGraph(name=data["name"], description=data["description"])
-            # 对于简化的RelationGraph数据，只需要创建空的节点和边列表
-            # 这里不进行详细的反序列化，因为我们在序列化时已经简化了数据
-            # 如果需要完整的反序列化，需要在序列化时保存完整的节点和边数据
-            pass
+            if "nodes" in data:
+                edges = data["edges"]
+                item = RelationGraph.from_arrays(
+                    data["name"],
+                    data["description"],
+                    [self._deserialize_content(node, paragraphs) for node in data["nodes"]],
+                    edges["source"],
+                    edges["target"],
+                    edges["relation"],
+                    data["relation_types"]
+                )
+            else:
+                # 旧格式只保存了节点数和边数，无法恢复图的内容
+                item = RelationGraph(name=data["name"], description=data["description"])
         else:
             # 未知类型，创建基础Item对象
             item = Item(name=data["name"], description=data["description"])
         
         return item
     
-    def _serialize_content(self, content):
-        """序列化内容，可以是Paragraph或Item对象"""
-        if isinstance(content, Paragraph):
+    def _serialize_content(self, content, paragraph_index=None):
+        """序列化内容，可以是Paragraph或Item对象；书内段落序列化为 {"type": "ParagraphRef", "index": 序号}"""
+        if _is_paragraph(content):
+            if paragraph_index is not None and id(content) in paragraph_index:
+                return {"type": "ParagraphRef", "index": paragraph_index[id(content)]}
             return self._serialize_paragraph(content)
         elif isinstance(content, Item):
-            return self._serialize_item(content)
+            return self._serialize_item(content, paragraph_index)
         else:
             # 其他类型，直接返回
             return content
     
-    def _deserialize_content(self, data):
-        """反序列化内容，可以是Paragraph或Item对象"""
+    def _deserialize_content(self, data, paragraphs=None):
+        """反序列化内容，可以是Paragraph或Item对象；段落引用解析为书内的同一个Paragraph对象"""
         if isinstance(data, dict) and "type" in data:
-            if data["type"] == "Paragraph":
+            if data["type"] == "ParagraphRef":
+                return paragraphs[data["index"]]
+            elif data["type"] == "Paragraph":
                 return self._deserialize_paragraph(data)
             else:
-                return self._deserialize_item(data)
+                return self._deserialize_item(data, paragraphs)
         else:
             # 其他类型，直接返回
             return data
     
+    def _new_book_id(self, milano_book):
+        """使用当前时间戳生成book_id"""
+        return f"book_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{id(milano_book)}"
+    
+    def store_media(self, book_id, video_path=None, audio_path=None):
+        """创建书籍文件夹，把视频和音频文件放入媒体仓库，并在书籍文件夹中创建同名链接；替换已有的同类媒体"""
+        book_dir = self._get_book_dir(book_id)
+        if not os.path.exists(book_dir):
+            os.makedirs(book_dir)
+        
+        for kind, media_path in (("video", video_path), ("audio", audio_path)):
+            if media_path and os.path.exists(media_path):
+                previous = self.blob_store.get_media(book_id).get(kind)
+                target_path = os.path.join(book_dir, os.path.basename(media_path))
+                self.blob_store.add_media(book_id, kind, media_path, target_path)
+                # 文件名不同的旧媒体链接也要删除，否则它会继续占用旧文件的空间
+                if previous and previous["filename"] != os.path.basename(media_path):
+                    old_path = os.path.join(book_dir, previous["filename"])
+                    if os.path.exists(old_path):
+                        os.remove(old_path)
+                
+                evicted = self.evicted_media(book_id)
+                if kind in evicted:
+                    self._write_evicted_media(book_dir, evicted - {kind})
+    
+    def evict_media(self, book_id):
+        """
+        删除书籍的视频和音频，书籍数据保留
+        
+        Returns:
+            实际释放的字节数（仍被其他书籍引用的媒体不计算在内）
+        """
+        book_dir = self._get_book_dir(book_id)
+        if not os.path.isdir(book_dir):
+            return 0
+        
+        freed = 0
+        refs = self.blob_store.get_media(book_id)
+        known = {m["filename"] for m in refs.values()}
+        evicted = self.evicted_media(book_id) | set(refs)
+        for file_name in os.listdir(book_dir):
+            file_path = os.path.join(book_dir, file_name)
+            kind = self._media_kind(file_name)
+            if kind is None or not os.path.isfile(file_path):
+                continue
+            evicted.add(kind)
+            # 未放入媒体仓库且没有其他链接的旧文件，删除即释放
+            if file_name not in known and os.stat(file_path).st_nlink == 1:
+                freed += os.path.getsize(file_path)
+            os.remove(file_path)
+        self._write_evicted_media(book_dir, evicted)
+        return freed + self.blob_store.release(book_id)
+    
+    def evicted_media(self, book_id):
+        """被evict_media淘汰、之后没有重新放入的媒体类型集合"""
+        marker_path = os.path.join(self._get_book_dir(book_id), MEDIA_EVICTED_MARKER)
+        try:
+            with open(marker_path, "r", encoding="utf-8") as f:
+                return set(json.load(f))
+        except (FileNotFoundError, ValueError):
+            return set()
+    
+    def _write_evicted_media(self, book_dir, kinds):
+        """写入被淘汰的媒体类型，没有时删除标记文件"""
+        marker_path = os.path.join(book_dir, MEDIA_EVICTED_MARKER)
+        if kinds:
+            with open(marker_path, "w", encoding="utf-8") as f:
+                json.dump(sorted(kinds), f)
+        elif os.path.exists(marker_path):
+            os.remove(marker_path)
+    
+    def touch_media(self, book_id):
+        """记录书籍的媒体被访问，媒体淘汰按最近访问时间排序"""
+        book_dir = self._get_book_dir(book_id)
+        if os.path.isdir(book_dir):
+            with open(os.path.join(book_dir, MEDIA_ACCESS_MARKER), "a"):
+                pass
+            os.utime(os.path.join(book_dir, MEDIA_ACCESS_MARKER))
+    
+    def media_accessed_at(self, book_id):
+        """书籍的媒体最近被访问的时间（Unix时间戳），从未访问过时为书籍写入的时间"""
+        try:
+            return os.path.getmtime(os.path.join(self._get_book_dir(book_id), MEDIA_ACCESS_MARKER))
+        except FileNotFoundError:
+            return self.book_modified_at(book_id)
+    
+    def _media_kind(self, file_name):
+        """按扩展名判断书籍文件夹中的文件是否为媒体文件，返回video、audio或None"""
+        if file_name.startswith("."):
+            return None
+        lower_name = file_name.lower()
+        if lower_name.endswith(VIDEO_EXTENSIONS):
+            return "video"
+        if lower_name.endswith(AUDIO_EXTENSIONS):
+            return "audio"
+        return None
+    
+    def get_media(self, book_id, kind, refs=None):
+        """
+        获取书籍的视频或音频文件
+        
+        Args:
+            book_id: 书籍ID
+            kind: video或audio
+            refs: blob_store.media_table()的结果，对多本书批量查询时传入，避免每次重新读取引用表
+        
+        Returns:
+            {"path", "filename", "size", "sha256"}，没有这种媒体时返回None；
+            尚未放入媒体仓库的旧文件sha256为None
+        """
+        if refs is None:
+            refs = self.blob_store.media_table()
+        book_refs = refs.get(book_id)
+        media = book_refs.get(kind) if book_refs else None
+        if media:
+            blob_path = self.blob_store.blob_path(media["sha256"])
+            if os.path.exists(blob_path):
+                return dict(media, path=blob_path)
+        elif book_refs:
+            # 媒体已纳入媒体仓库的书籍没有这种媒体，不再扫描书籍文件夹
+            return None
+        
+        book_dir = self._get_book_dir(book_id)
+        if not os.path.isdir(book_dir):
+            return None
+        for file_name in sorted(os.listdir(book_dir)):
+            file_path = os.path.join(book_dir, file_name)
+            if self._media_kind(file_name) == kind and os.path.isfile(file_path):
+                return {"path": file_path, "filename": file_name, "size": os.path.getsize(file_path), "sha256": None}
+        return None
+    
+    def dedupe_media(self):
+        """
+        把书籍文件夹中尚未纳入媒体仓库的视频和音频文件放入仓库，内容相同的文件只保留一份
+        
+        Returns:
+            [(book_id, 文件名, sha256)]
+        """
+        results = []
+        for book_id in sorted(os.listdir(self.storage_dir)):
+            if not _valid_book_id(book_id):
+                continue
+            book_dir = self._get_book_dir(book_id)
+            if not os.path.isdir(book_dir):
+                continue
+            
+            known = {m["filename"] for m in self.blob_store.get_media(book_id).values()}
+            for file_name in sorted(os.listdir(book_dir)):
+                file_path = os.path.join(book_dir, file_name)
+                kind = self._media_kind(file_name)
+                if kind is None or file_name in known or not os.path.isfile(file_path):
+                    continue
+                media = self.blob_store.add_media(book_id, kind, file_path, file_path)
+                results.append((book_id, file_name, media["sha256"]))
+        return results
+    
     def save_book(self, milano_book, book_id=None, video_path=None, audio_path=None):
         """保存MilanoBook对象到文件"""
         # 如果没有提供book_id，使用当前时间戳生成
         if book_id is None:
-            book_id = f"book_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{id(milano_book)}"
-        
-        # 创建书籍文件夹
-        book_dir = self._get_book_dir(book_id)
-        if not os.path.exists(book_dir):
-            os.makedirs(book_dir)
+            book_id = self._new_book_id(milano_book)
         
-        # 移动视频和音频文件到书籍目录
-        if video_path and os.path.exists(video_path):
-            video_filename = os.path.basename(video_path)
-            video_target_path = os.path.join(book_dir, video_filename)
-            shutil.move(video_path, video_target_path)
+        self.store_media(book_id, video_path, audio_path)
+        self._write_book(book_id, milano_book, datetime.now().isoformat())
+        self.book_cache.invalidate(book_id)
+        return book_id
+    
+    def _write_book(self, book_id, milano_book, created_at):
+        """序列化并写入书籍数据文件，更新目录索引"""
+        book_data = self._serialize_book(book_id, milano_book, created_at)
+        self._write_book_data(book_id, book_data)
+        self._update_catalog(book_id, self._catalog_entry(book_id, book_data))
+    
+    def book_exists(self, book_id):
+        try:
+            self._book_signature(book_id)
+            return True
+        except FileNotFoundError:
+            return False
+    
+    def book_version(self, book_id):
+        """书籍当前版本的标识，书籍被重新写入后改变，可用作HTTP ETag"""
+        return hashlib.sha1(repr(self._book_signature(book_id)).encode("utf-8")).hexdigest()[:20]
+    
+    def book_modified_at(self, book_id):
+        """书籍数据最后一次写入的时间（Unix时间戳）"""
+        return self._book_signature(book_id)[1] / 1e9
+    
+    def export_book_data(self, book_id):
+        """当前版本结构的书籍数据字典，与存储后端和文件格式无关，用于导出"""
+        book_data = self._read_book_data(book_id)
+        if book_data.get("format_version", 1) < FORMAT_VERSION:
+            book_data = self._serialize_book(book_id, self._read_book(book_id), book_data["created_at"])
+        return book_data
+    
+    def import_book_data(self, book_data, overwrite=False):
+        """
+        导入export_book_data导出的书籍数据，保留book_id和created_at
         
-        if audio_path and os.path.exists(audio_path):
-            audio_filename = os.path.basename(audio_path)
-            audio_target_path = os.path.join(book_dir, audio_filename)
-            shutil.move(audio_path, audio_target_path)
+        Returns:
+            是否导入；书籍已存在且overwrite为False时不导入
+        """
+        book_id = book_data["book_id"]
+        if not overwrite and self.book_exists(book_id):
+            return False
         
-        # 序列化MilanoBook对象
-        book_data = {
+        milano_book = self._book_from_data(book_data)
+        os.makedirs(self._get_book_dir(book_id), exist_ok=True)
+        self._write_book(book_id, milano_book, book_data["created_at"])
+        self.book_cache.invalidate(book_id)
+        return True
+    
+    def _serialize_book(self, book_id, milano_book, created_at):
+        """序列化MilanoBook对象，Items中的书内段落只保存序号"""
+        paragraph_index = {id(p): i for i, p in enumerate(milano_book.paragraphs)}
+        return {
             "book_id": book_id,
             "title": milano_book.title,
             "author": milano_book.author,
             "source_url": milano_book.source_url,
-            "created_at": datetime.now().isoformat(),
+            "created_at": created_at,
+            "format_version": FORMAT_VERSION,
+            "abstract": milano_book.abstract,
+            "key_terms": milano_book.key_terms,
             "paragraphs": [self._serialize_paragraph(p) for p in milano_book.paragraphs],
-            "items": [self._serialize_item(item) for item in milano_book.items]
+            "items": [self._serialize_item(item, paragraph_index) for item in milano_book.items]
         }
+    
+    def load_book(self, book_id, parts=None, paragraph_range=None):
+        """
+        加载MilanoBook对象，优先使用内存缓存
         
-        # 写入文件
-        file_path = self._get_file_path(book_id)
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(book_data, f, ensure_ascii=False, indent=2)
+        缓存中的对象会被多个请求共享，调用方不应修改返回的对象。
         
-        return book_id
+        Args:
+            book_id: 书籍ID
+            parts: 只读取指定部分（metadata、paragraphs、items的组合），返回LazyMilanoBook，
+                未读取的部分在访问时再加载；None表示读取完整的书籍
+            paragraph_range: (start, end)，只读取这个范围内的段落，不能与items同时指定
+        
+        Returns:
+            MilanoBook对象；指定了parts或paragraph_range时为LazyMilanoBook
+        """
+        if parts is not None or paragraph_range is not None:
+            parts = set(parts or ("metadata", "paragraphs"))
+            unknown = parts - set(BOOK_PARTS)
+            if unknown:
+                raise ValueError(f"未知的书籍部分：{', '.join(sorted(unknown))}")
+            if paragraph_range is not None and "items" in parts:
+                raise ValueError("Items引用全部段落，不能与paragraph_range同时读取")
+            
+            milano_book = self.open_book(book_id)
+            if "items" in parts:
+                milano_book.items
+            elif "paragraphs" in parts:
+                if paragraph_range is not None:
+                    milano_book.get_paragraph_range(*paragraph_range)
+                else:
+                    milano_book.paragraphs
+            return milano_book
+        
+        signature = self._book_signature(book_id)
+        milano_book = self.book_cache.get(book_id, signature)
+        if milano_book is None:
+            milano_book = self._read_book(book_id)
+            self.book_cache.put(book_id, signature, milano_book)
+        return milano_book
     
-    def load_book(self, book_id):
-        """从文件加载MilanoBook对象"""
-        file_path = self._get_file_path(book_id)
+    def open_book(self, book_id):
+        """
+        打开书籍但只读取元数据，返回按需加载段落和Items的LazyMilanoBook
         
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"书籍 {book_id} 不存在")
+        书籍已在缓存中时直接从缓存对象取数据；分段格式（segmented）的书籍只读取需要的段落，
+        其他格式需要加载完整的书籍。
+        """
+        signature = self._book_signature(book_id)
+        cached = self.book_cache.peek(book_id, signature)
+        if cached is not None:
+            return self._lazy_from_book(cached)
+        
+        file_path = signature[0]
+        with open(file_path, "rb") as f:
+            is_segmented = f.read(len(SEGMENTED_MAGIC)) == SEGMENTED_MAGIC
+            header = SegmentedBookFile(f).header if is_segmented else None
         
-        # 读取文件
-        with open(file_path, "r", encoding="utf-8") as f:
-            book_data = json.load(f)
+        if header is None or header.get("format_version", 1) < FORMAT_VERSION:
+            # 其他格式无法只读取一部分，直接加载完整的书籍（并放入缓存）
+            return self._lazy_from_book(self.load_book(book_id))
         
-        # 反序列化MilanoBook对象
+        def open_segmented():
+            f = open(file_path, "rb")
+            stat = os.fstat(f.fileno())
+            if (stat.st_mtime_ns, stat.st_size) != signature[1:]:
+                f.close()
+                raise RuntimeError(f"书籍 {book_id} 已被修改，请重新打开")
+            return f
+        
+        def load_paragraphs(start, end):
+            with open_segmented() as f:
+                return [self._deserialize_paragraph(p) for p in SegmentedBookFile(f).read_paragraphs(start, end)]
+        
+        def load_items(paragraphs):
+            with open_segmented() as f:
+                return [self._deserialize_item(item_data, paragraphs) for item_data in SegmentedBookFile(f).read_items()]
+        
+        return LazyMilanoBook(header, load_paragraphs, load_items)
+    
+    def query_paragraphs(self, book_id, start_time=None, end_time=None, offset=0, limit=None):
+        """
+        分页查询书籍的段落，可按时间范围过滤（与get_paragraphs_by_time相同：与[start_time, end_time]有重叠的段落）
+        
+        Args:
+            book_id: 书籍ID
+            start_time: 时间范围起点（秒），None表示不限
+            end_time: 时间范围终点（秒），None表示不限
+            offset: 跳过的段落数
+            limit: 最多返回的段落数，None表示全部
+        
+        Returns:
+            (符合条件的段落总数, [(段落序号, Paragraph)])
+        """
+        milano_book = self.open_book(book_id)
+        end = None if limit is None else offset + limit
+        
+        if start_time is None and end_time is None:
+            # 只按位置分页，segmented格式只读取这一页的段落
+            total = milano_book.paragraph_count
+            end = total if end is None else min(end, total)
+            return total, list(zip(range(offset, end), milano_book.get_paragraph_range(offset, end)))
+        
+        low = float("-inf") if start_time is None else start_time
+        high = float("inf") if end_time is None else end_time
+        indices = milano_book.get_paragraph_indices_by_time(low, high)
+        paragraphs = milano_book.paragraphs
+        return len(indices), [(i, paragraphs[i]) for i in indices[offset:end]]
+    
+    def _lazy_from_book(self, milano_book):
+        """用已加载的MilanoBook对象构造LazyMilanoBook，段落和Items与原对象共享"""
+        return LazyMilanoBook(
+            self._book_metadata(milano_book),
+            lambda start, end: milano_book.paragraphs[start:end],
+            lambda paragraphs: milano_book.items
+        )
+    
+    def _book_metadata(self, milano_book):
+        """LazyMilanoBook所需的元数据"""
+        return {
+            "title": milano_book.title,
+            "author": milano_book.author,
+            "source_url": milano_book.source_url,
+            "abstract": milano_book.abstract,
+            "key_terms": milano_book.key_terms,
+            "paragraph_count": len(milano_book.paragraphs)
+        }
+    
+    def _book_signature(self, book_id):
+        """书籍当前版本的签名（数据文件的路径、mtime和大小），书籍不存在时抛出FileNotFoundError"""
+        file_path = self._get_file_path(book_id)
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"书籍 {book_id} 不存在")
+        return (file_path, stat.st_mtime_ns, stat.st_size)
+    
+    def _read_book(self, book_id):
+        """从文件加载MilanoBook对象，不经过缓存"""
+        return self._book_from_data(self._read_book_data(book_id))
+    
+    def _book_from_data(self, book_data):
+        """把书籍数据字典反序列化为MilanoBook对象"""
         milano_book = MilanoBook(
             title=book_data["title"],
             author=book_data["author"],
             source_url=book_data["source_url"]
         )
+        milano_book.abstract = book_data.get("abstract", "")
+        milano_book.key_terms = book_data.get("key_terms", [])
         
         # 反序列化段落
         for paragraph_data in book_data["paragraphs"]:
@@ -218,38 +644,209 @@ class MilanoBookStorage:
         
         # 反序列化项目
         for item_data in book_data["items"]:
-            item = self._deserialize_item(item_data)
+            item = self._deserialize_item(item_data, milano_book.paragraphs)
             milano_book.add_item(item)
         
+        # 旧格式在Items中内嵌了段落副本
+        if book_data.get("format_version", 1) < 3:
+            self._relink_paragraphs(milano_book)
+        
         return milano_book
     
-    def list_books(self):
-        """列出所有存储的书籍"""
-        books = []
-        if os.path.exists(self.storage_dir):
-            for book_id in os.listdir(self.storage_dir):
-                book_dir = os.path.join(self.storage_dir, book_id)
-                if os.path.isdir(book_dir):
-                    file_path = os.path.join(book_dir, "book.json")
-                    if os.path.exists(file_path):
-                        with open(file_path, "r", encoding="utf-8") as f:
-                            book_data = json.load(f)
-                        books.append({
-                            "book_id": book_id,
-                            "title": book_data["title"],
-                            "author": book_data["author"],
-                            "created_at": book_data["created_at"]
-                        })
-        
-        # 按创建时间排序
-        books.sort(key=lambda x: x["created_at"], reverse=True)
-        return books
+    def _relink_paragraphs(self, milano_book):
+        """把Items中与书内段落内容相同的段落副本换回书内段落对象"""
+        by_value = {(p.start_time, p.end_time, p.text_content): p for p in milano_book.paragraphs}
+        
+        def relink(content):
+            if _is_paragraph(content):
+                return by_value.get((content.start_time, content.end_time, content.text_content), content)
+            if isinstance(content, Item):
+                relink_item(content)
+            return content
+        
+        def relink_item(item):
+            if isinstance(item, RelationGraph):
+                mapping = {id(node): relink(node) for node in item.nodes}
+                item._nodes = [mapping[id(node)] for node in item.nodes]
+                item._edges = [(mapping[id(s)], mapping[id(t)], r) for s, t, r in item.edges]
+                item._rebuild_index()
+            elif isinstance(item, Timeline):
+                item._content = [(time_point, relink(content)) for time_point, content in item.content]
+            else:
+                item._content = [relink(content) for content in item.content]
+        
+        for item in milano_book.items:
+            relink_item(item)
+    
+    def list_books(self, sort_by="created_at", reverse=True, limit=None, offset=0):
+        """
+        列出所有存储的书籍，只读取目录索引，不解析各书籍的book.json
+        
+        Args:
+            sort_by: 排序字段（created_at、title或author）
+            reverse: 是否倒序
+            limit: 最多返回的数量，None表示全部
+            offset: 跳过的数量
+        
+        Returns:
+            书籍摘要列表，每项包含book_id、title、author、created_at
+        """
+        entries = self._load_catalog()["books"]
+        
+        # 索引本身按created_at升序保存，默认排序只需要切片
+        if sort_by != "created_at":
+            entries = sorted(entries, key=lambda x: (x.get(sort_by) or "", x["created_at"]))
+        if reverse:
+            entries = entries[::-1]
+        
+        end = None if limit is None else offset + limit
+        return [dict(entry) for entry in entries[offset:end]]
+    
+    def count_books(self):
+        """书籍总数"""
+        return len(self._load_catalog()["books"])
+    
+    def catalog_version(self):
+        """目录索引的版本号，每次保存或删除书籍都会递增"""
+        return self._load_catalog()["version"]
+    
+    def rebuild_catalog(self):
+        """扫描存储目录，重新生成目录索引"""
+        with file_lock(self._catalog_lock_path):
+            previous = self._read_catalog_file(use_cache=False)
+            entries = []
+            if os.path.exists(self.storage_dir):
+                for book_id in os.listdir(self.storage_dir):
+                    if not _valid_book_id(book_id):
+                        continue
+                    book_dir = self._get_book_dir(book_id)
+                    if os.path.isdir(book_dir) and os.path.exists(self._get_file_path(book_id)):
+                        book_data = self._read_book_data(book_id)
+                        entries.append(self._catalog_entry(book_id, book_data))
+            
+            entries.sort(key=lambda x: x["created_at"])
+            catalog = {
+                "version": (previous["version"] + 1) if previous else 1,
+                "books": entries
+            }
+            self._write_catalog_file(catalog)
+            return catalog
+    
+    def _catalog_entry(self, book_id, book_data):
+        """目录索引中的单条记录"""
+        return {
+            "book_id": book_id,
+            "title": book_data["title"],
+            "author": book_data["author"],
+            "created_at": book_data["created_at"]
+        }
+    
+    def _load_catalog(self):
+        """读取目录索引，不存在或损坏时自动重建"""
+        catalog = self._read_catalog_file()
+        if catalog is None:
+            catalog = self.rebuild_catalog()
+        return catalog
+    
+    def _read_catalog_file(self, use_cache=True):
+        """读取目录索引文件，文件未变化时直接使用内存中的副本；use_cache为False时总是重新读取（读-改-写时使用）"""
+        try:
+            stat = os.stat(self._catalog_path)
+        except FileNotFoundError:
+            return None
+        
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if use_cache and self._catalog_cache is not None and self._catalog_cache[0] == signature:
+            return self._catalog_cache[1]
+        
+        try:
+            with open(self._catalog_path, "r", encoding="utf-8") as f:
+                catalog = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"读取目录索引失败，将重建：{str(e)}")
+            return None
+        
+        self._catalog_cache = (signature, catalog)
+        return catalog
+    
+    def _write_catalog_file(self, catalog):
+        """原子地写入目录索引（先写临时文件再替换）"""
+        tmp_path = f"{self._catalog_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(catalog, f, ensure_ascii=False)
+        os.replace(tmp_path, self._catalog_path)
+        self._catalog_cache = None
+    
+    def _update_catalog(self, book_id, entry=None):
+        """在目录索引中新增/更新（entry不为None）或删除一本书籍"""
+        with file_lock(self._catalog_lock_path):
+            # 其他进程可能在同一时钟刻度内写入了大小相同的索引，不能依赖mtime判断缓存是否有效
+            catalog = self._read_catalog_file(use_cache=False)
+            if catalog is None:
+                # 索引缺失时从磁盘重建，重建结果已经包含本次的变更
+                self.rebuild_catalog()
+                return
+            
+            books = [b for b in catalog["books"] if b["book_id"] != book_id]
+            if entry is not None:
+                keys = [b["created_at"] for b in books]
+                books.insert(bisect.bisect_right(keys, entry["created_at"]), entry)
+            self._write_catalog_file({"version": catalog["version"] + 1, "books": books})
+    
+    def reencode_all(self, book_format=None):
+        """
+        把所有书籍的数据文件转换为指定格式，内容（包括created_at）保持不变；旧版本的数据结构同时升级到当前版本
+        
+        Args:
+            book_format: 目标格式，默认为当前的book_format
+        
+        Returns:
+            [(book_id, 转换前字节数, 转换后字节数)]
+        """
+        book_format = book_format or self.book_format
+        if book_format not in BOOK_FORMATS:
+            raise ValueError(f"未知的书籍存储格式：{book_format}")
+        
+        results = []
+        for entry in self.list_books(reverse=False):
+            book_id = entry["book_id"]
+            old_size = os.path.getsize(self._get_file_path(book_id))
+            book_data = self._read_book_data(book_id)
+            if book_data.get("format_version", 1) < FORMAT_VERSION:
+                milano_book = self._read_book(book_id)
+                book_data = self._serialize_book(book_id, milano_book, book_data["created_at"])
+            new_path = self._write_book_data(book_id, book_data, book_format)
+            self.book_cache.invalidate(book_id)
+            results.append((book_id, old_size, os.path.getsize(new_path)))
+        return results
     
     def delete_book(self, book_id):
-        """删除书籍文件夹"""
+        """删除书籍文件夹，并释放不再被其他书籍引用的媒体文件"""
         book_dir = self._get_book_dir(book_id)
         if os.path.exists(book_dir) and os.path.isdir(book_dir):
             shutil.rmtree(book_dir)
+            self.blob_store.release(book_id)
+            self.book_cache.invalidate(book_id)
+            self._update_catalog(book_id)
             return True
         else:
             return False
+
+def create_storage(backend=None, storage_dir="milano_books"):
+    """
+    根据配置创建存储管理器
+    
+    Args:
+        backend: json（默认，每本书一个book.json）或sqlite，未指定时读取环境变量MILANO_STORAGE_BACKEND
+        storage_dir: 存储目录，sqlite后端的数据库和媒体文件也放在这里
+    
+    Returns:
+        MilanoBookStorage或其子类实例
+    """
+    backend = backend or os.environ.get("MILANO_STORAGE_BACKEND", "json")
+    if backend == "sqlite":
+        from .sqlite_storage import SQLiteMilanoBookStorage
+        return SQLiteMilanoBookStorage(storage_dir)
+    if backend != "json":
+        raise ValueError(f"未知的存储后端：{backend}")
+    return MilanoBookStorage(storage_dir)
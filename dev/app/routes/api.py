@@ -1,10 +1,18 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, send_file
 from app.services.video_processor import VideoProcessor
-from app.models.MilanoBook.storage import MilanoBookStorage
+from app.models.MilanoBook.storage import create_storage
 from app.services.generate_service import GenerateService
+from app.services.note_tasks import NoteTaskManager
+from app.services.notes_storage import NotesStorage, valid_notes_id
+from app.services.llm_metrics import metrics as llm_metrics
+from app.services.circuit_breaker import llm_breaker
+from app.services.media_seek import seeker
+from app.services.clip_cache import ClipCache
+from app.services.media_governor import MediaGovernor
+from app.services.library_archive import iter_export, import_archive, parse_since
 import uuid
 import os
-from datetime import datetime
+from datetime import datetime, timezone
 import json
 
 # 创建蓝图，url_prefix表示所有API路由都以/api开头
@@ -12,7 +20,92 @@ bp = Blueprint('api', __name__, url_prefix='/api')
 
 # 初始化视频处理器和存储管理器
 processor = VideoProcessor()
-storage = MilanoBookStorage()
+storage = create_storage()
+task_manager = NoteTaskManager()
+notes_storage = NotesStorage()
+clip_cache = ClipCache()
+governor = MediaGovernor(storage, processor)
+
+def _save_notes(notes_id, book_ids, user_prompt, content, llm_stats=None):
+    """把生成的笔记保存到notes/<notes_id>.json，本地抽取式草稿会被标记为待升级"""
+    notes_data = {
+        'notes_id': notes_id,
+        'book_ids': book_ids,
+        'content': content,
+        'user_prompt': user_prompt,
+        'llm_stats': llm_stats,
+        'draft': bool(llm_stats and llm_stats.get('fallback')),
+        'created_at': datetime.now().isoformat()
+    }
+    
+    return notes_storage.save_notes(notes_data)
+
+def _cache_headers(response, etag, last_modified=None):
+    """设置ETag、Last-Modified，并要求浏览器和代理每次使用缓存前重新验证"""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+def _not_modified(etag, last_modified=None):
+    """请求中的If-None-Match或If-Modified-Since仍然有效时返回304响应，否则返回None"""
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    elif request.if_modified_since and last_modified is not None:
+        fresh = last_modified <= request.if_modified_since
+    else:
+        fresh = False
+    if not fresh:
+        return None
+    return _cache_headers(Response(status=304), etag, last_modified)
+
+def _http_time(timestamp):
+    """Unix时间戳转换为HTTP日期精度（秒）的UTC时间"""
+    return datetime.fromtimestamp(int(timestamp), tz=timezone.utc)
+
+def _load_books_data(book_ids):
+    """加载多本书籍并转换为笔记生成所需的数据格式"""
+    milano_books_data = []
+    for book_id in book_ids:
+        milano_book = storage.load_book(book_id)
+        
+        paragraphs_data = []
+        for p in milano_book.paragraphs:
+            paragraphs_data.append({
+                'start_time': p.start_time,
+                'end_time': p.end_time,
+                'text_content': p.text_content,
+                'multi_modal_data': p.multi_modal_data
+            })
+        
+        items_data = []
+        for item in milano_book.items:
+            item_type = item.__class__.__name__
+            content_count = 0
+            if hasattr(item, 'content'):
+                content_count = len(item.content)
+            elif hasattr(item, 'nodes'):
+                content_count = len(item.nodes)
+            
+            items_data.append({
+                'type': item_type,
+                'name': item.name,
+                'description': item.description,
+                'content_count': content_count
+            })
+        
+        milano_books_data.append({
+            'book_id': book_id,
+            'title': milano_book.title,
+            'author': milano_book.author,
+            'source_url': milano_book.source_url,
+            'abstract': milano_book.abstract,
+            'key_terms': milano_book.key_terms,
+            'paragraphs': paragraphs_data,
+            'items': items_data
+        })
+    return milano_books_data
 
 @bp.route('/process', methods=['POST'])
 def api_process_video():
@@ -29,6 +122,7 @@ def api_process_video():
         
         # 保存到本地存储
         book_id = storage.save_book(milano_book, video_path=video_path, audio_path=audio_path)
+        governor.enforce(keep=book_id)
         
         # 转换为JSON格式，确保所有对象都被正确序列化
         paragraphs_data = []
@@ -76,8 +170,27 @@ def api_process_video():
 def api_list_books():
     """列出所有存储的书籍"""
     try:
-        books = storage.list_books()
-        return jsonify({'books': books})
+        limit = request.args.get('limit', type=int)
+        offset = request.args.get('offset', 0, type=int)
+        if offset < 0 or (limit is not None and limit < 1):
+            return jsonify({'error': 'offset不能为负数，limit必须大于0'}), 400
+        sort_by = request.args.get('sort', 'created_at')
+        if sort_by not in ('created_at', 'title', 'author'):
+            return jsonify({'error': 'sort只能是created_at、title或author'}), 400
+        
+        # 目录索引的版本号在每次保存或删除书籍时递增，版本号不变时列表内容不变
+        etag = f"books-{storage.catalog_version()}-{storage.count_books()}"
+        not_modified = _not_modified(etag)
+        if not_modified is not None:
+            return not_modified
+        
+        books = storage.list_books(
+            sort_by=sort_by,
+            reverse=request.args.get('order', 'desc') != 'asc',
+            limit=limit,
+            offset=offset
+        )
+        return _cache_headers(jsonify({'books': books, 'total': storage.count_books()}), etag)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -85,6 +198,12 @@ def api_list_books():
 def api_get_book(book_id):
     """获取指定书籍的详细信息"""
     try:
+        etag = storage.book_version(book_id)
+        last_modified = _http_time(storage.book_modified_at(book_id))
+        not_modified = _not_modified(etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        
         milano_book = storage.load_book(book_id)
         
         # 转换为JSON格式，确保所有对象都被正确序列化
@@ -122,7 +241,7 @@ def api_get_book(book_id):
             'items': items_data
         }
         
-        return jsonify(result)
+        return _cache_headers(jsonify(result), etag, last_modified)
     except FileNotFoundError:
         return jsonify({'error': f'书籍 {book_id} 不存在'}), 404
     except Exception as e:
@@ -131,6 +250,153 @@ def api_get_book(book_id):
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+PARAGRAPH_FIELDS = ('start_time', 'end_time', 'text_content', 'multi_modal_data')
+
+@bp.route('/books/<book_id>/paragraphs', methods=['GET'])
+def api_get_paragraphs(book_id):
+    """分页获取书籍的段落，可按时间范围过滤并只返回指定字段"""
+    try:
+        start_time = request.args.get('start', type=float)
+        end_time = request.args.get('end', type=float)
+        offset = request.args.get('offset', 0, type=int)
+        limit = request.args.get('limit', 50, type=int)
+        if offset < 0 or not 0 < limit <= 500:
+            return jsonify({'error': 'offset不能为负数，limit必须在1到500之间'}), 400
+        
+        fields = PARAGRAPH_FIELDS
+        if request.args.get('fields'):
+            fields = tuple(f.strip() for f in request.args['fields'].split(',') if f.strip())
+            unknown = [f for f in fields if f not in PARAGRAPH_FIELDS]
+            if unknown:
+                return jsonify({'error': f'未知的字段：{", ".join(unknown)}'}), 400
+        
+        etag = storage.book_version(book_id)
+        last_modified = _http_time(storage.book_modified_at(book_id))
+        not_modified = _not_modified(etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        
+        total, paragraphs = storage.query_paragraphs(
+            book_id,
+            start_time=start_time,
+            end_time=end_time,
+            offset=offset,
+            limit=limit
+        )
+        
+        paragraphs_data = []
+        for index, p in paragraphs:
+            paragraph_data = {'index': index}
+            for field in fields:
+                paragraph_data[field] = getattr(p, field)
+            paragraphs_data.append(paragraph_data)
+        
+        return _cache_headers(jsonify({
+            'book_id': book_id,
+            'total': total,
+            'offset': offset,
+            'limit': limit,
+            'paragraphs': paragraphs_data
+        }), etag, last_modified)
+    except FileNotFoundError:
+        return jsonify({'error': f'书籍 {book_id} 不存在'}), 404
+    except Exception as e:
+        print(f"API获取段落失败：{str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+MEDIA_KINDS = ('video', 'audio')
+
+@bp.route('/books/<book_id>/media/<kind>', methods=['GET'])
+def api_get_media(book_id, kind):
+    """播放书籍的视频或音频，支持Range请求（拖动进度条）和ETag/Last-Modified条件请求"""
+    try:
+        if kind not in MEDIA_KINDS:
+            return jsonify({'error': f'未知的媒体类型：{kind}'}), 400
+        
+        media = governor.ensure_media(book_id, kind)
+        if media is None:
+            return jsonify({'error': f'书籍 {book_id} 没有{kind}文件'}), 404
+        
+        # 媒体仓库中的文件内容不会改变，直接用sha256作为ETag
+        # 文件内容由send_file交给WSGI服务器的file_wrapper（如gunicorn的sendfile）或前端服务器的X-Sendfile发送
+        # 存储目录是相对于工作目录的路径，send_file会把相对路径当作相对于应用目录
+        return send_file(
+            os.path.abspath(media['path']),
+            download_name=media['filename'],
+            conditional=True,
+            etag=media['sha256'] or True
+        )
+    except FileNotFoundError:
+        return jsonify({'error': f'书籍 {book_id} 不存在'}), 404
+    except Exception as e:
+        print(f"获取媒体文件失败：{str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/books/<book_id>/media/<kind>/seek', methods=['GET'])
+def api_seek_media(book_id, kind):
+    """把段落（paragraph参数）或时间（t参数，秒）换算为媒体中的关键帧时间和字节位置"""
+    try:
+        if kind not in MEDIA_KINDS:
+            return jsonify({'error': f'未知的媒体类型：{kind}'}), 400
+        
+        paragraph_index = request.args.get('paragraph', type=int)
+        seconds = request.args.get('t', type=float)
+        if paragraph_index is None and seconds is None:
+            return jsonify({'error': '缺少paragraph或t参数'}), 400
+        
+        media = governor.ensure_media(book_id, kind)
+        if media is None:
+            return jsonify({'error': f'书籍 {book_id} 没有{kind}文件'}), 404
+        
+        if paragraph_index is not None:
+            milano_book = storage.open_book(book_id)
+            if not 0 <= paragraph_index < milano_book.paragraph_count:
+                return jsonify({'error': f'段落序号超出范围：{paragraph_index}'}), 400
+            seconds = milano_book.get_paragraph(paragraph_index).start_time
+        
+        target = seeker.seek_target(media['path'], seconds, kind)
+        target.update({'book_id': book_id, 'kind': kind, 'paragraph': paragraph_index})
+        return jsonify(target)
+    except FileNotFoundError:
+        return jsonify({'error': f'书籍 {book_id} 不存在'}), 404
+    except Exception as e:
+        print(f"计算媒体跳转位置失败：{str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/books/<book_id>/paragraphs/<int:index>/clip', methods=['GET'])
+def api_get_paragraph_clip(book_id, index):
+    """下载段落对应的视频（kind=video，默认）或音频（kind=audio）片段，首次请求时剪辑并缓存"""
+    try:
+        kind = request.args.get('kind', 'video')
+        if kind not in MEDIA_KINDS:
+            return jsonify({'error': f'未知的媒体类型：{kind}'}), 400
+        
+        milano_book = storage.open_book(book_id)
+        if not 0 <= index < milano_book.paragraph_count:
+            return jsonify({'error': f'段落序号超出范围：{index}'}), 404
+        paragraph = milano_book.get_paragraph(index)
+        
+        media = governor.ensure_media(book_id, kind)
+        if media is None:
+            return jsonify({'error': f'书籍 {book_id} 没有{kind}文件'}), 404
+        
+        # 未放入媒体仓库的旧文件用路径、大小和修改时间区分内容
+        media_id = media['sha256'] or f"{os.path.abspath(media['path'])}:{media['size']}:{os.path.getmtime(media['path'])}"
+        ext = os.path.splitext(media['filename'])[1] or '.mp4'
+        clip_path = clip_cache.get_clip(media['path'], media_id, paragraph.start_time, paragraph.end_time, ext)
+        
+        return send_file(
+            os.path.abspath(clip_path),
+            download_name=f"{book_id}_{index + 1}{ext}",
+            conditional=True,
+            etag=os.path.splitext(os.path.basename(clip_path))[0]
+        )
+    except FileNotFoundError:
+        return jsonify({'error': f'书籍 {book_id} 不存在'}), 404
+    except Exception as e:
+        print(f"获取段落片段失败：{str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @bp.route('/books/<book_id>', methods=['DELETE'])
 def api_delete_book(book_id):
     """删除指定书籍"""
@@ -140,6 +406,8 @@ def api_delete_book(book_id):
             return jsonify({'message': f'书籍 {book_id} 已删除'})
         else:
             return jsonify({'error': f'书籍 {book_id} 不存在'}), 404
+    except FileNotFoundError:
+        return jsonify({'error': f'书籍 {book_id} 不存在'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -157,67 +425,20 @@ def api_generate_notes():
         if not isinstance(book_ids, list):
             return jsonify({'error': 'book_ids必须是数组'}), 400
         
-        milano_books_data = []
-        for book_id in book_ids:
-            milano_book = storage.load_book(book_id)
-            
-            paragraphs_data = []
-            for p in milano_book.paragraphs:
-                paragraphs_data.append({
-                    'start_time': p.start_time,
-                    'end_time': p.end_time,
-                    'text_content': p.text_content,
-                    'multi_modal_data': p.multi_modal_data
-                })
-            
-            items_data = []
-            for item in milano_book.items:
-                item_type = item.__class__.__name__
-                content_count = 0
-                if hasattr(item, 'content'):
-                    content_count = len(item.content)
-                elif hasattr(item, 'nodes'):
-                    content_count = len(item.nodes)
-                
-                items_data.append({
-                    'type': item_type,
-                    'name': item.name,
-                    'description': item.description,
-                    'content_count': content_count
-                })
-            
-            milano_books_data.append({
-                'book_id': book_id,
-                'title': milano_book.title,
-                'author': milano_book.author,
-                'source_url': milano_book.source_url,
-                'paragraphs': paragraphs_data,
-                'items': items_data
-            })
+        milano_books_data = _load_books_data(book_ids)
         
         generate_service = GenerateService()
-        notes_content = generate_service.generate_notes(milano_books_data, user_prompt)
+        llm_stats = {}
+        notes_content = generate_service.generate_notes(milano_books_data, user_prompt, stats=llm_stats)
         
         notes_id = str(uuid.uuid4())
-        notes_path = f"notes/{notes_id}.json"
-        
-        notes_data = {
-            'notes_id': notes_id,
-            'book_ids': book_ids,
-            'content': notes_content,
-            'user_prompt': user_prompt,
-            'created_at': datetime.now().isoformat()
-        }
-        
-        os.makedirs('notes', exist_ok=True)
-        with open(notes_path, 'w', encoding='utf-8') as f:
-            import json
-            json.dump(notes_data, f, ensure_ascii=False, indent=2)
+        _save_notes(notes_id, book_ids, user_prompt, notes_content, llm_stats)
         
         return jsonify({
             'success': True,
             'notes_id': notes_id,
-            'message': '笔记生成成功'
+            'draft': bool(llm_stats.get('fallback')),
+            'message': '大模型暂不可用，已生成笔记草稿' if llm_stats.get('fallback') else '笔记生成成功'
         })
     except FileNotFoundError as e:
         return jsonify({'error': f'书籍不存在：{str(e)}'}), 404
@@ -241,75 +462,24 @@ def api_generate_notes_stream():
         if not isinstance(book_ids, list):
             return jsonify({'error': 'book_ids必须是数组'}), 400
         
-        milano_books_data = []
-        for book_id in book_ids:
-            milano_book = storage.load_book(book_id)
-            
-            paragraphs_data = []
-            for p in milano_book.paragraphs:
-                paragraphs_data.append({
-                    'start_time': p.start_time,
-                    'end_time': p.end_time,
-                    'text_content': p.text_content,
-                    'multi_modal_data': p.multi_modal_data
-                })
-            
-            items_data = []
-            for item in milano_book.items:
-                item_type = item.__class__.__name__
-                content_count = 0
-                if hasattr(item, 'content'):
-                    content_count = len(item.content)
-                elif hasattr(item, 'nodes'):
-                    content_count = len(item.nodes)
-                
-                items_data.append({
-                    'type': item_type,
-                    'name': item.name,
-                    'description': item.description,
-                    'content_count': content_count
-                })
-            
-            milano_books_data.append({
-                'book_id': book_id,
-                'title': milano_book.title,
-                'author': milano_book.author,
-                'source_url': milano_book.source_url,
-                'paragraphs': paragraphs_data,
-                'items': items_data
-            })
+        milano_books_data = _load_books_data(book_ids)
         
         generate_service = GenerateService()
-        
-        # 设置流式响应
-        def generate():
-            notes_id = str(uuid.uuid4())
-            notes_content = ""
-            
-            # 流式生成内容
-            for chunk in generate_service.generate_notes_stream(milano_books_data, user_prompt):
-                notes_content += chunk
-                yield f"data: {json.dumps({'type': 'content', 'content': chunk})}\n\n"
-            
-            # 保存完整笔记
-            notes_path = f"notes/{notes_id}.json"
-            notes_data = {
-                'notes_id': notes_id,
-                'book_ids': book_ids,
-                'content': notes_content,
-                'user_prompt': user_prompt,
-                'created_at': datetime.now().isoformat()
-            }
-            
-            os.makedirs('notes', exist_ok=True)
-            with open(notes_path, 'w', encoding='utf-8') as f:
-                json.dump(notes_data, f, ensure_ascii=False, indent=2)
-            
-            # 发送结束信号
-            yield f"data: {json.dumps({'type': 'done', 'notes_id': notes_id})}\n\n"
-        
-        from flask import Response
-        return Response(generate(), mimetype='text/event-stream')
+        notes_id = str(uuid.uuid4())
+        llm_stats = {}
+        
+        # 生成在后台任务中进行，与当前连接无关，断开后可通过notes_id续传；
+        # 提示词相同的并发请求合并到同一个任务，只调用一次模型
+        task, coalesced = task_manager.start(
+            notes_id,
+            lambda: generate_service.generate_notes_stream(milano_books_data, user_prompt, stats=llm_stats),
+            lambda content: _save_notes(notes_id, book_ids, user_prompt, content, llm_stats),
+            key=generate_service.prompt_key(milano_books_data, user_prompt)
+        )
+        if coalesced:
+            print(f"合并相同的笔记生成请求到任务 {task.notes_id}")
+        
+        return Response(_stream_task(task), mimetype='text/event-stream')
     except FileNotFoundError as e:
         return jsonify({'error': f'书籍不存在：{str(e)}'}), 404
     except Exception as e:
@@ -318,27 +488,148 @@ def api_generate_notes_stream():
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
-@bp.route('/notes', methods=['GET'])
-def api_list_notes():
-    """获取所有生成的笔记"""
+@bp.route('/generate-notes-stream/<notes_id>', methods=['GET'])
+def api_attach_notes_stream(notes_id):
+    """接入笔记生成流，支持Last-Event-ID或offset参数从指定位置续传"""
     try:
-        notes_dir = 'notes'
-        notes = []
+        offset = int(request.headers.get('Last-Event-ID') or request.args.get('offset', 0))
+    except ValueError:
+        return jsonify({'error': 'offset必须是整数'}), 400
+    
+    try:
+        if not valid_notes_id(notes_id):
+            return jsonify({'error': f'笔记 {notes_id} 不存在'}), 404
+        task = task_manager.get(notes_id)
+        if task:
+            return Response(_stream_task(task, offset), mimetype='text/event-stream')
         
-        if os.path.exists(notes_dir):
-            for filename in os.listdir(notes_dir):
-                if filename.endswith('.json'):
-                    notes_path = os.path.join(notes_dir, filename)
-                    with open(notes_path, 'r', encoding='utf-8') as f:
-                        notes_data = json.load(f)
-                        notes.append(notes_data)
+        # 任务已结束，直接从保存的笔记续传
+        if notes_storage.exists(notes_id):
+            notes_data = notes_storage.load_notes(notes_id)
+            return Response(_stream_content(notes_id, notes_data['content'], offset), mimetype='text/event-stream')
         
-        # 按创建时间倒序排序
-        notes.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+        # 进程中断遗留的日志，返回已生成的部分
+        partial_content = task_manager.read_log(notes_id)
+        if partial_content is not None:
+            return Response(_stream_content(notes_id, partial_content, offset, interrupted=True), mimetype='text/event-stream')
+        
+        return jsonify({'error': f'笔记 {notes_id} 不存在'}), 404
+    except Exception as e:
+        print(f"接入笔记生成流失败：{str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+def _sse(event, event_id=None):
+    """格式化一条SSE事件，event_id为已输出内容的字符偏移量"""
+    prefix = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{prefix}data: {json.dumps(event)}\n\n"
+
+def _stream_task(task, offset=0):
+    """跟随后台生成任务输出SSE事件，客户端断开不影响任务本身"""
+    yield _sse({'type': 'start', 'notes_id': task.notes_id, 'offset': offset})
+    
+    for event in task.tail(offset):
+        if event is None:
+            # 心跳注释，防止代理因空闲断开连接
+            yield ": keep-alive\n\n"
+            continue
+        end, chunk = event
+        yield _sse({'type': 'content', 'content': chunk}, end)
+    
+    if task.error:
+        yield _sse({'type': 'error', 'notes_id': task.notes_id, 'error': task.error})
+    else:
+        yield _sse({'type': 'done', 'notes_id': task.notes_id})
+
+def _stream_content(notes_id, content, offset=0, interrupted=False):
+    """把已有的笔记内容从offset开始作为SSE事件输出"""
+    yield _sse({'type': 'start', 'notes_id': notes_id, 'offset': offset})
+    
+    if offset < len(content):
+        yield _sse({'type': 'content', 'content': content[offset:]}, len(content))
+    
+    if interrupted:
+        yield _sse({'type': 'error', 'notes_id': notes_id, 'error': '生成任务已中断'})
+    else:
+        yield _sse({'type': 'done', 'notes_id': notes_id})
+
+@bp.route('/metrics', methods=['GET'])
+def api_metrics():
+    """获取大模型调用的聚合指标（首token时间、延迟、生成速度和token数直方图）"""
+    try:
+        return jsonify({
+            'success': True,
+            'circuit_breaker': llm_breaker.state,
+            'metrics': llm_metrics.snapshot(request.args.get('model'))
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/storage/media', methods=['GET'])
+def api_media_usage():
+    """媒体文件的磁盘占用和预算"""
+    try:
+        return jsonify({'success': True, **governor.media_usage()})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/storage/media/enforce', methods=['POST'])
+def api_enforce_media_budget():
+    """立即执行媒体保留策略（转码音频、按最近访问时间淘汰媒体）"""
+    try:
+        return jsonify({'success': True, **governor.enforce()})
+    except Exception as e:
+        print(f"执行媒体保留策略失败：{str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/library/export', methods=['GET'])
+def api_export_library():
+    """以tar格式流式导出书库（书籍、笔记，media=1时包含媒体文件），since指定时只导出之后写入的内容"""
+    try:
+        include_media = request.args.get('media', '0') == '1'
+        since = parse_since(request.args.get('since'))
+    except ValueError as e:
+        return jsonify({'error': f'无效的since参数：{str(e)}'}), 400
+    
+    filename = f"milano_library_{datetime.now().strftime('%Y%m%d_%H%M%S')}.tar"
+    return Response(
+        iter_export(storage, notes_storage, include_media=include_media, since=since),
+        mimetype='application/x-tar',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+@bp.route('/library/import', methods=['POST'])
+def api_import_library():
+    """导入请求体中的书库归档（tar或压缩后的tar），overwrite=1时覆盖已存在的书籍和笔记"""
+    try:
+        summary = import_archive(storage, notes_storage, request.stream,
+                                 overwrite=request.args.get('overwrite', '0') == '1')
+        return jsonify({'success': True, **summary})
+    except Exception as e:
+        print(f"导入书库失败：{str(e)}")
+        return jsonify({'error': str(e)}), 400
+
+@bp.route('/notes', methods=['GET'])
+def api_list_notes():
+    """分页获取笔记摘要（不含正文），可按书籍或关键词过滤"""
+    try:
+        limit = request.args.get('limit', type=int)
+        offset = request.args.get('offset', 0, type=int)
+        if offset < 0 or (limit is not None and limit < 1):
+            return jsonify({'error': 'offset不能为负数，limit必须大于0'}), 400
+        
+        total, notes = notes_storage.query_notes(
+            limit=limit,
+            offset=offset,
+            book_id=request.args.get('book_id'),
+            query=request.args.get('q')
+        )
         
         return jsonify({
             'success': True,
-            'notes': notes
+            'notes': notes,
+            'total': total
         })
     except Exception as e:
         print(f"获取笔记列表失败：{str(e)}")
@@ -350,14 +641,10 @@ def api_list_notes():
 def api_get_notes(notes_id):
     """获取生成的笔记"""
     try:
-        notes_path = f"notes/{notes_id}.json"
-        
-        if not os.path.exists(notes_path):
+        if not notes_storage.exists(notes_id):
             return jsonify({'error': f'笔记 {notes_id} 不存在'}), 404
         
-        with open(notes_path, 'r', encoding='utf-8') as f:
-            import json
-            notes_data = json.load(f)
+        notes_data = notes_storage.load_notes(notes_id)
         
         return jsonify({
             'success': True,
@@ -369,17 +656,57 @@ def api_get_notes(notes_id):
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@bp.route('/notes/<notes_id>/upgrade', methods=['POST'])
+def api_upgrade_notes(notes_id):
+    """用大模型重新生成本地抽取式草稿笔记"""
+    try:
+        if not notes_storage.exists(notes_id):
+            return jsonify({'error': f'笔记 {notes_id} 不存在'}), 404
+        
+        notes_data = notes_storage.load_notes(notes_id)
+        
+        if not notes_data.get('draft'):
+            return jsonify({'error': f'笔记 {notes_id} 不是草稿，无需升级'}), 400
+        
+        milano_books_data = _load_books_data(notes_data['book_ids'])
+        generate_service = GenerateService()
+        llm_stats = {}
+        try:
+            notes_content = generate_service.generate_notes(
+                milano_books_data,
+                notes_data.get('user_prompt', ''),
+                stats=llm_stats,
+                allow_fallback=False
+            )
+        except Exception as e:
+            return jsonify({'error': f'大模型暂不可用：{str(e)}'}), 503
+        
+        notes_data['content'] = notes_content
+        notes_data['llm_stats'] = llm_stats
+        notes_data['draft'] = False
+        notes_data['upgraded_at'] = datetime.now().isoformat()
+        notes_storage.save_notes(notes_data)
+        
+        return jsonify({
+            'success': True,
+            'notes_id': notes_id,
+            'message': '笔记已升级'
+        })
+    except FileNotFoundError as e:
+        return jsonify({'error': f'书籍不存在：{str(e)}'}), 404
+    except Exception as e:
+        print(f"升级笔记失败：{str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
 @bp.route('/notes/<notes_id>', methods=['DELETE'])
 def api_delete_notes(notes_id):
     """删除指定笔记"""
     try:
-        notes_path = f"notes/{notes_id}.json"
-        
-        if not os.path.exists(notes_path):
+        if not notes_storage.delete_notes(notes_id):
             return jsonify({'error': f'笔记 {notes_id} 不存在'}), 404
         
-        os.remove(notes_path)
-        
         return jsonify({
             'success': True,
             'message': f'笔记 {notes_id} 已删除'
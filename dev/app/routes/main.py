@@ -1,13 +1,17 @@
 from flask import Blueprint, render_template, request
 from app.services.video_processor import VideoProcessor
-from app.models.MilanoBook.storage import MilanoBookStorage
+from app.models.MilanoBook.storage import create_storage
+from app.routes.api import governor
 
 # 创建蓝图
 bp = Blueprint('main', __name__)
 
 # 初始化视频处理器和存储管理器
 processor = VideoProcessor()
-storage = MilanoBookStorage()
+storage = create_storage()
+
+# 结果页面首屏渲染的段落数，其余段落由页面通过 /api/books/<id>/paragraphs 分页加载
+RESULT_PAGE_SIZE = 50
 
 @bp.route('/')
 def index():
@@ -29,9 +33,13 @@ def process_video():
         print(f"开始保存到本地存储")
         book_id = storage.save_book(milano_book, video_path=video_path, audio_path=audio_path)
         print(f"保存成功，书籍ID：{book_id}")
+        governor.enforce(keep=book_id)
         
         # 转换为可序列化的结果
         result = {
+            'book_id': book_id,
+            'paragraph_count': len(milano_book.paragraphs),
+            'page_size': RESULT_PAGE_SIZE,
             'title': milano_book.title,
             'author': milano_book.author,
             'source_url': milano_book.source_url,
@@ -41,7 +49,7 @@ def process_video():
                     'end_time': p.end_time,
                     'text_content': p.text_content,
                     'multi_modal_data': p.multi_modal_data
-                } for p in milano_book.paragraphs
+                } for p in milano_book.paragraphs[:RESULT_PAGE_SIZE]
             ],
             'items': [
                 {
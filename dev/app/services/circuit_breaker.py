@@ -0,0 +1,79 @@
+import os
+import threading
+import time
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，调用被直接拒绝"""
+    pass
+
+
+class CircuitBreaker:
+    """简单的熔断器
+
+    连续失败达到failure_threshold次后进入open状态，reset_timeout秒内的调用直接失败；
+    之后进入half_open状态放行一次试探调用，成功则恢复closed，失败则重新open。
+    """
+
+    def __init__(self, failure_threshold=3, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        """当前状态：closed、open或half_open"""
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def is_open(self):
+        """是否正在熔断（不会占用half_open的试探名额）"""
+        return self.state == "open"
+
+    def allow(self):
+        """判断本次调用是否放行，half_open状态下只放行一个试探调用"""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        """记录一次成功调用，恢复closed状态"""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        """记录一次失败调用，连续失败达到阈值（或试探失败）时打开熔断器"""
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def record_abort(self):
+        """调用被调用方提前放弃，既不算成功也不算失败"""
+        with self._lock:
+            self._probing = False
+
+
+# 进程内所有大模型调用共享的熔断器
+llm_breaker = CircuitBreaker(
+    failure_threshold=int(os.environ.get("MILANO_BREAKER_THRESHOLD", "3")),
+    reset_timeout=float(os.environ.get("MILANO_BREAKER_RESET", "30"))
+)
@@ -0,0 +1,140 @@
+import hashlib
+import os
+import subprocess
+import threading
+from typing import Dict, Optional
+
+
+class ClipCache:
+    """按需剪辑并缓存在磁盘上的媒体片段
+
+    片段用ffmpeg流复制（-c copy，不重新编码）从原始媒体中剪出，起点对齐到开始时间之前的关键帧。
+    缓存文件名由媒体内容和时间范围决定；命中时更新文件的修改时间，总大小超过上限时按修改时间
+    淘汰最久未使用的片段。同一片段的并发请求只会触发一次剪辑，其余请求等待其结果。
+    """
+
+    def __init__(self, cache_dir: str = "clip_cache", max_bytes: Optional[int] = None):
+        """
+        Args:
+            cache_dir: 缓存目录
+            max_bytes: 缓存总大小上限（字节），未指定时读取环境变量MILANO_CLIP_CACHE_MB（默认1024MB）
+        """
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get("MILANO_CLIP_CACHE_MB", "1024")) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # 片段键 -> 正在剪辑该片段的请求写入结果的 {"event", "error"}
+        self._inflight: Dict[str, Dict] = {}
+
+    def clip_key(self, media_id: str, start: float, end: float) -> str:
+        """片段的缓存键，media_id应能区分媒体内容（如sha256）"""
+        return hashlib.sha256(f"{media_id}:{start:.3f}:{end:.3f}".encode("utf-8")).hexdigest()
+
+    def get_clip(self, media_path: str, media_id: str, start: float, end: float, ext: str = ".mp4") -> str:
+        """
+        获取片段文件路径，缓存中没有时剪辑
+
+        Args:
+            media_path: 原始媒体文件
+            media_id: 媒体内容标识
+            start: 开始时间（秒）
+            end: 结束时间（秒）
+            ext: 片段文件扩展名，与原始媒体一致
+
+        Returns:
+            缓存中的片段文件路径
+        """
+        key = self.clip_key(media_id, start, end)
+        clip_path = os.path.join(self.cache_dir, f"{key}{ext}")
+
+        with self._lock:
+            if os.path.exists(clip_path):
+                os.utime(clip_path)
+                return clip_path
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = {"event": threading.Event(), "error": None}
+
+        if not leader:
+            flight["event"].wait()
+            if flight["error"]:
+                raise RuntimeError(flight["error"])
+            return clip_path
+
+        try:
+            self._cut(media_path, start, end, clip_path)
+            self._evict(keep=clip_path)
+            return clip_path
+        except Exception as e:
+            flight["error"] = str(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight["event"].set()
+
+    def _cut(self, media_path: str, start: float, end: float, clip_path: str):
+        """用ffmpeg流复制剪出[start, end)，先写临时文件再替换"""
+        root, ext = os.path.splitext(clip_path)
+        tmp_path = f"{root}.{os.getpid()}.{threading.get_ident()}.tmp{ext}"
+        cmd = [
+            'ffmpeg',
+            '-v', 'error',
+            '-ss', f'{start:.3f}',
+            '-i', media_path,
+            '-t', f'{max(end - start, 0.001):.3f}',
+            '-map', '0',
+            '-c', 'copy',
+            '-avoid_negative_ts', 'make_zero',
+            '-y',
+            tmp_path
+        ]
+        if ext == ".mp4":
+            # 把moov放到文件开头，分享出去的片段可以边下边播
+            cmd[-2:-2] = ['-movflags', '+faststart']
+
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='ignore')
+        except OSError as e:
+            raise RuntimeError(f"ffmpeg不可用，无法剪辑片段：{str(e)}")
+        if result.returncode != 0 or not os.path.exists(tmp_path) or os.path.getsize(tmp_path) == 0:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise RuntimeError(f"剪辑片段失败：{result.stderr.strip()}")
+        os.replace(tmp_path, clip_path)
+
+    def _evict(self, keep: Optional[str] = None):
+        """缓存总大小超过上限时，按修改时间删除最久未使用的片段（不删除keep）"""
+        entries = []
+        total = 0
+        for file_name in os.listdir(self.cache_dir):
+            file_path = os.path.join(self.cache_dir, file_name)
+            if ".tmp" in file_name or not os.path.isfile(file_path):
+                continue
+            stat = os.stat(file_path)
+            entries.append((stat.st_mtime, stat.st_size, file_path))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, file_path in entries:
+            if total <= self.max_bytes:
+                break
+            if file_path == keep:
+                continue
+            try:
+                os.remove(file_path)
+                total -= size
+            except FileNotFoundError:
+                pass
+
+    def info(self) -> Dict[str, int]:
+        """缓存统计"""
+        files = [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir) if ".tmp" not in f]
+        return {
+            "clips": len(files),
+            "bytes": sum(os.path.getsize(f) for f in files if os.path.isfile(f)),
+            "max_bytes": self.max_bytes
+        }
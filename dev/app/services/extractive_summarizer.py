@@ -0,0 +1,140 @@
+import re
+from collections import Counter
+from typing import Any, Dict, List
+
+import numpy as np
+
+# 行和小于此值的句子与其他句子没有共同特征（只剩浮点误差），视为孤立句子
+_ISOLATED_EPSILON = 1e-9
+
+# 中英文句子结束标记
+_SENTENCE_SPLIT = re.compile(r"(?<=[。！？!?；;])|(?<=\.)\s+")
+
+
+def split_sentences(text: str, min_length: int = 6) -> List[str]:
+    """把段落文本切分为句子，过短的片段会被丢弃"""
+    return [s.strip() for s in _SENTENCE_SPLIT.split(text) if s and len(s.strip()) >= min_length]
+
+
+def _bigrams(sentence: str) -> Counter:
+    """字符二元组特征，不依赖分词器，中英文都适用"""
+    chars = re.sub(r"\s+", "", sentence.lower())
+    return Counter(chars[i:i + 2] for i in range(len(chars) - 1))
+
+
+def textrank(sentences: List[str], damping: float = 0.85, iterations: int = 50, tol: float = 1e-6) -> np.ndarray:
+    """
+    TextRank：以句子间余弦相似度为边权的PageRank
+
+    句子特征保存为稀疏的(行, 列, 值)数组，相似度矩阵S = M·Mᵀ不显式构造，每次迭代用两次bincount
+    计算M·(Mᵀ·x)，内存和每次迭代的耗时都与二元组总数成正比，而不是句子数的平方。
+
+    Args:
+        sentences: 句子列表
+        damping: 阻尼系数
+        iterations: 最大迭代次数
+        tol: 收敛阈值
+
+    Returns:
+        每个句子的得分
+    """
+    n = len(sentences)
+    if n == 0:
+        return np.zeros(0)
+
+    vocabulary = {}
+    rows, cols, values = [], [], []
+    for row, sentence in enumerate(sentences):
+        for gram, count in _bigrams(sentence).items():
+            rows.append(row)
+            cols.append(vocabulary.setdefault(gram, len(vocabulary)))
+            values.append(count)
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    width = max(len(vocabulary), 1)
+
+    # 每行归一化为单位向量，点积即余弦相似度
+    norms = np.sqrt(np.bincount(rows, weights=values ** 2, minlength=n))
+    values = values / norms[rows]
+    self_similarity = np.bincount(rows, weights=values ** 2, minlength=n)
+
+    def similarity_dot(x):
+        """S·x，S的对角线置零"""
+        projected = np.bincount(cols, weights=values * x[rows], minlength=width)
+        return np.bincount(rows, weights=values * projected[cols], minlength=n) - self_similarity * x
+
+    # 行归一化得到转移矩阵，孤立句子均匀跳转
+    row_sums = similarity_dot(np.ones(n))
+    linked = row_sums > _ISOLATED_EPSILON
+    inverse_sums = np.where(linked, 1.0 / np.where(linked, row_sums, 1.0), 0.0)
+
+    scores = np.full(n, 1.0 / n)
+    for _ in range(iterations):
+        # S对称，Tᵀ·s = S·(s / 行和) + 孤立句子的得分均匀分给所有句子
+        spread = similarity_dot(scores * inverse_sums) + scores[~linked].sum() / n
+        updated = (1 - damping) / n + damping * spread
+        if np.abs(updated - scores).sum() < tol:
+            return updated
+        scores = updated
+    return scores
+
+
+def summarize(paragraphs: List[Dict[str, Any]], max_sentences: int = 8) -> List[Dict[str, Any]]:
+    """
+    从段落中抽取最具代表性的句子，按原文顺序返回
+
+    Args:
+        paragraphs: 段落数据列表，包含start_time和text_content
+        max_sentences: 最多抽取的句子数
+
+    Returns:
+        [{"start_time": ..., "sentence": ...}]
+    """
+    sentences = []
+    for para in paragraphs:
+        for sentence in split_sentences(para.get("text_content", "")):
+            sentences.append((para.get("start_time", 0.0), sentence))
+
+    if not sentences:
+        return []
+
+    scores = textrank([sentence for _, sentence in sentences])
+    top = sorted(np.argsort(-scores)[:max_sentences])
+    return [{"start_time": sentences[i][0], "sentence": sentences[i][1]} for i in top]
+
+
+def draft_notes(milano_books_data: List[Dict[str, Any]], user_prompt: str = "") -> str:
+    """
+    在大模型不可用时生成本地抽取式笔记草稿（Markdown）
+
+    Args:
+        milano_books_data: MilanoBook数据列表
+        user_prompt: 用户自定义提示词，草稿中仅作记录
+
+    Returns:
+        笔记草稿内容
+    """
+    parts = ["# 笔记草稿\n\n"]
+    parts.append("> 大模型服务暂不可用，以下内容由本地抽取式摘要生成，稍后可升级为完整笔记。\n\n")
+    if user_prompt:
+        parts.append(f"> 用户要求：{user_prompt}\n\n")
+
+    for i, book_data in enumerate(milano_books_data, 1):
+        parts.append(f"## 视频 {i}: {book_data['title']}\n\n")
+        parts.append(f"作者: {book_data['author']}\n\n")
+
+        if book_data.get("abstract"):
+            parts.append(f"### 内容摘要\n\n{book_data['abstract']}\n\n")
+
+        key_sentences = summarize(book_data.get("paragraphs", []))
+        if key_sentences:
+            parts.append("### 关键句\n\n")
+            for entry in key_sentences:
+                parts.append(f"- [{entry['start_time']:.0f}s] {entry['sentence']}\n")
+            parts.append("\n")
+
+        if book_data.get("key_terms"):
+            parts.append(f"### 关键术语\n\n{'、'.join(book_data['key_terms'])}\n\n")
+
+    return "".join(parts)
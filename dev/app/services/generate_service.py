@@ -1,7 +1,16 @@
 import os
-from typing import List, Dict, Any
+import json
+import time
+import hashlib
+from typing import List, Dict, Any, Optional
 from openai import OpenAI
 from app.utils import read_config
+from app.services.llm_metrics import metrics
+from app.services.hedging import hedged_stream
+from app.services.circuit_breaker import llm_breaker, CircuitOpenError
+from app.services.extractive_summarizer import draft_notes
+
+NOTES_SYSTEM_PROMPT = "你是一个专业的笔记整理助手，擅长从多个视频内容中提取关键信息，生成结构化、易读的学习笔记。"
 
 class GenerateService:
     """使用ModelScope OpenAI兼容接口生成笔记内容"""
@@ -17,88 +26,200 @@ class GenerateService:
             api_key=self.api_key,
             base_url=self.base_url
         )
+        
+        # 对冲请求：主模型在截止时间内没有返回首token时，向备用模型/端点发起同样的请求
+        self.hedge_model = os.environ.get("MODELSCOPE_HEDGE_MODEL") or self.model_name
+        self.hedge_deadline = float(os.environ.get("MODELSCOPE_HEDGE_DEADLINE", "8"))
+        self.hedge_client = None
+        if os.environ.get("MODELSCOPE_HEDGE_MODEL") or os.environ.get("MODELSCOPE_HEDGE_BASE_URL"):
+            self.hedge_client = OpenAI(
+                api_key=os.environ.get("MODELSCOPE_HEDGE_API_KEY", self.api_key),
+                base_url=os.environ.get("MODELSCOPE_HEDGE_BASE_URL", self.base_url)
+            )
     
-    def generate_notes(self, milano_books_data: List[Dict[str, Any]], user_prompt: str = "") -> str:
+    def generate_notes(self, milano_books_data: List[Dict[str, Any]], user_prompt: str = "",
+                       stats: Optional[Dict[str, Any]] = None, allow_fallback: bool = True) -> str:
         """
         根据多个MilanoBook生成笔记
         
         Args:
             milano_books_data: MilanoBook数据列表，每个元素包含book_id, title, paragraphs, items等
             user_prompt: 用户自定义提示词，用于指定内容偏好
+            stats: 可选的字典，调用结束后会被填入本次调用的延迟和token统计
+            allow_fallback: 模型不可用时是否返回本地抽取式草稿，为False时直接抛出异常
         
         Returns:
-            生成的笔记内容
+            生成的笔记内容；使用了本地草稿时stats["fallback"]为"extractive"
         """
         prompt = self._build_prompt(milano_books_data, user_prompt)
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "你是一个专业的笔记整理助手，擅长从多个视频内容中提取关键信息，生成结构化、易读的学习笔记。"
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
+            return "".join(self._stream_chat(
+                NOTES_SYSTEM_PROMPT,
+                prompt,
                 temperature=0.7,
                 max_tokens=4000,
-                stream=True
-            )
-            
-            # 收集流式返回的内容
-            full_content = ""
-            for chunk in response:
-                if chunk.choices[0].delta.content is not None:
-                    full_content += chunk.choices[0].delta.content
-            
-            return full_content
+                operation="generate_notes",
+                stats=stats
+            ))
         except Exception as e:
             print(f"生成笔记失败：{str(e)}")
-            return f"生成笔记失败：{str(e)}"
+            if not allow_fallback:
+                raise
+            return self._draft_notes(milano_books_data, user_prompt, stats, e)
     
-    def generate_notes_stream(self, milano_books_data: List[Dict[str, Any]], user_prompt: str = ""):
+    def generate_notes_stream(self, milano_books_data: List[Dict[str, Any]], user_prompt: str = "",
+                              stats: Optional[Dict[str, Any]] = None):
         """
         流式生成笔记，支持实时返回结果
         
         Args:
             milano_books_data: MilanoBook数据列表
             user_prompt: 用户自定义提示词
+            stats: 可选的字典，生成结束后会被填入本次调用的延迟和token统计
         
         Returns:
-            generator: 流式返回生成的内容片段
+            generator: 流式返回生成的内容片段；首个片段之前失败时返回本地抽取式草稿，
+            之后失败则抛出异常，不会把错误信息当作笔记内容
         """
         prompt = self._build_prompt(milano_books_data, user_prompt)
+        emitted = False
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "你是一个专业的笔记整理助手，擅长从多个视频内容中提取关键信息，生成结构化、易读的学习笔记。"
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
+            for content in self._stream_chat(
+                NOTES_SYSTEM_PROMPT,
+                prompt,
                 temperature=0.7,
                 max_tokens=4000,
-                stream=True
-            )
-            
-            # 流式返回生成的内容
-            for chunk in response:
-                if chunk.choices[0].delta.content is not None:
-                    yield chunk.choices[0].delta.content
+                operation="generate_notes_stream",
+                stats=stats
+            ):
+                emitted = True
+                yield content
         except Exception as e:
             print(f"生成笔记失败：{str(e)}")
-            yield f"生成笔记失败：{str(e)}"
-
+            if emitted:
+                raise
+            yield self._draft_notes(milano_books_data, user_prompt, stats, e)
+    
+    def _draft_notes(self, milano_books_data: List[Dict[str, Any]], user_prompt: str,
+                     stats: Optional[Dict[str, Any]], error: Exception) -> str:
+        """生成本地抽取式笔记草稿，并在stats中标记以便之后升级"""
+        if stats is not None:
+            stats["fallback"] = "extractive"
+            stats["error"] = str(error)
+        return draft_notes(milano_books_data, user_prompt)
+    
+    def _stream_chat(self, system_prompt: str, prompt: str, temperature: float = 0.7, max_tokens: int = 4000,
+                     operation: str = "chat", stats: Optional[Dict[str, Any]] = None):
+        """
+        所有模型调用的统一入口：流式调用模型并记录延迟和token统计
+        
+        配置了备用模型/端点时会进行对冲请求，见hedging.hedged_stream。
+        所有调用共享熔断器llm_breaker，连续失败后会直接抛出CircuitOpenError，不再等待超时。
+        统计内容包括首token时间、总耗时、生成速度、提示词和生成token数以及实际应答的模型名称，
+        调用结束（包括出错或被提前关闭）时写入stats并汇总到llm_metrics
+        
+        Args:
+            system_prompt: 系统提示词
+            prompt: 用户提示词
+            temperature: 采样温度
+            max_tokens: 最大生成token数
+            operation: 调用用途，用于分组统计
+            stats: 可选的字典，会被填入本次调用的统计
+        
+        Returns:
+            generator: 流式返回生成的内容片段
+        """
+        call_stats = {
+            "model": self.model_name,
+            "operation": operation,
+            "success": False,
+            "ttft_seconds": None,
+            "latency_seconds": None,
+            "tokens_per_second": None,
+            "prompt_tokens": None,
+            "completion_tokens": None,
+            "hedged": False
+        }
+        request = {
+            "messages": [
+                {
+                    "role": "system",
+                    "content": system_prompt
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True,
+            "stream_options": {"include_usage": True}
+        }
+        if not llm_breaker.allow():
+            raise CircuitOpenError("大模型服务熔断中，暂时跳过调用")
+        started = time.perf_counter()
+        
+        try:
+            open_primary = lambda: self.client.chat.completions.create(model=self.model_name, **request)
+            if self.hedge_client is None:
+                stream = (("primary", chunk) for chunk in open_primary())
+            else:
+                stream = hedged_stream(
+                    ("primary", open_primary),
+                    ("hedge", lambda: self.hedge_client.chat.completions.create(model=self.hedge_model, **request)),
+                    self.hedge_deadline,
+                    has_token=lambda chunk: bool(chunk.choices and chunk.choices[0].delta.content)
+                )
+            
+            for source, chunk in stream:
+                if source == "hedge" and not call_stats["hedged"]:
+                    call_stats["model"] = self.hedge_model
+                    call_stats["hedged"] = True
+                # 开启include_usage后，最后一个chunk只包含usage，choices为空
+                if getattr(chunk, "usage", None):
+                    call_stats["prompt_tokens"] = chunk.usage.prompt_tokens
+                    call_stats["completion_tokens"] = chunk.usage.completion_tokens
+                if chunk.choices and chunk.choices[0].delta.content is not None:
+                    if call_stats["ttft_seconds"] is None:
+                        call_stats["ttft_seconds"] = time.perf_counter() - started
+                    yield chunk.choices[0].delta.content
+            
+            call_stats["success"] = True
+            llm_breaker.record_success()
+        except GeneratorExit:
+            llm_breaker.record_abort()
+            raise
+        except Exception:
+            llm_breaker.record_failure()
+            raise
+        finally:
+            latency = time.perf_counter() - started
+            call_stats["latency_seconds"] = latency
+            generation_time = latency - (call_stats["ttft_seconds"] or 0)
+            if call_stats["completion_tokens"] and generation_time > 0:
+                call_stats["tokens_per_second"] = call_stats["completion_tokens"] / generation_time
+            
+            metrics.record(call_stats)
+            if stats is not None:
+                stats.update(call_stats)
+    
+    def prompt_key(self, milano_books_data: List[Dict[str, Any]], user_prompt: str = "") -> str:
+        """
+        计算笔记生成请求的合并键，模型和提示词都相同的请求会得到相同的键
+        
+        Args:
+            milano_books_data: MilanoBook数据列表
+            user_prompt: 用户自定义提示词
+        
+        Returns:
+            十六进制的SHA-256哈希
+        """
+        prompt = self._build_prompt(milano_books_data, user_prompt)
+        return hashlib.sha256(f"{self.base_url}\n{self.model_name}\n{prompt}".encode("utf-8")).hexdigest()
+    
     def _build_prompt(self, milano_books_data: List[Dict[str, Any]], user_prompt: str = "") -> str:
         """
         构建生成笔记的提示词
@@ -119,8 +240,21 @@ class GenerateService:
             prompt_parts.append(f"作者: {book_data['author']}\n")
             prompt_parts.append(f"来源: {book_data['source_url']}\n\n")
             
+            # 优先使用入库时预计算的摘要和段落提纲，避免每次重新理解原文
+            if book_data.get('abstract'):
+                prompt_parts.append("### 内容摘要\n")
+                prompt_parts.append(f"{book_data['abstract']}\n\n")
+                
+                if book_data.get('key_terms'):
+                    prompt_parts.append(f"关键术语: {'、'.join(book_data['key_terms'])}\n\n")
+                
+                outline = self._build_outline(book_data.get('paragraphs', []))
+                if outline:
+                    prompt_parts.append("### 段落提纲\n")
+                    prompt_parts.extend(outline)
+                    prompt_parts.append("\n")
             # 添加段落内容
-            if book_data.get('paragraphs'):
+            elif book_data.get('paragraphs'):
                 prompt_parts.append("### 内容概要\n")
                 for j, para in enumerate(book_data['paragraphs'][:5], 1):  # 只取前5个段落避免过长
                     prompt_parts.append(f"{j}. {para['text_content'][:200]}...\n")
@@ -148,6 +282,136 @@ class GenerateService:
         
         return "".join(prompt_parts)
     
+    def _build_outline(self, paragraphs: List[Dict[str, Any]]) -> List[str]:
+        """
+        根据段落的预计算标题和关键词构建紧凑的提纲
+        
+        Args:
+            paragraphs: 段落数据列表
+        
+        Returns:
+            提纲行列表，没有预计算信息的段落会被跳过
+        """
+        outline = []
+        for j, para in enumerate(paragraphs, 1):
+            enrichment = (para.get('multi_modal_data') or {}).get('enrichment')
+            if not enrichment or not enrichment.get('title'):
+                continue
+            line = f"{j}. [{para['start_time']:.0f}s] {enrichment['title']}"
+            if enrichment.get('keywords'):
+                line += f"（{'、'.join(enrichment['keywords'])}）"
+            outline.append(line + "\n")
+        return outline
+    
+    def enrich_paragraph(self, paragraph_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        为单个段落生成标题和关键词
+        
+        Args:
+            paragraph_data: 段落数据，包含start_time, end_time, text_content
+        
+        Returns:
+            包含title和keywords的字典
+        """
+        prompt = (
+            "请为以下视频段落生成一个简短标题（不超过20字）和3-5个关键词。\n"
+            "只输出JSON，格式为：{\"title\": \"...\", \"keywords\": [\"...\"]}\n\n"
+            f"段落内容：{paragraph_data['text_content']}"
+        )
+        
+        result = self._parse_json_content(self._chat(
+            "你是一个专业的内容标注助手，擅长为文本片段提炼标题和关键词。",
+            prompt,
+            temperature=0.3,
+            max_tokens=200,
+            operation="enrich_paragraph"
+        ))
+        
+        return {
+            "title": str(result.get("title", "")).strip(),
+            "keywords": [str(k).strip() for k in result.get("keywords", []) if str(k).strip()]
+        }
+    
+    def summarize_book(self, milano_book_data: Dict[str, Any], max_chars: int = 8000) -> Dict[str, Any]:
+        """
+        为整本MilanoBook生成摘要和关键术语
+        
+        Args:
+            milano_book_data: MilanoBook数据
+            max_chars: 送入模型的原文最大字符数
+        
+        Returns:
+            包含abstract和key_terms的字典
+        """
+        text = " ".join(p['text_content'] for p in milano_book_data.get('paragraphs', []))[:max_chars]
+        prompt = (
+            f"标题: {milano_book_data['title']}\n"
+            f"作者: {milano_book_data['author']}\n\n"
+            f"视频文稿：{text}\n\n"
+            "请为以上视频生成一段300字以内的内容摘要，并列出5-10个关键术语。\n"
+            "只输出JSON，格式为：{\"abstract\": \"...\", \"key_terms\": [\"...\"]}"
+        )
+        
+        result = self._parse_json_content(self._chat(
+            "你是一个专业的笔记整理助手，擅长从视频文稿中提炼摘要和关键术语。",
+            prompt,
+            temperature=0.3,
+            max_tokens=800,
+            operation="summarize_book"
+        ))
+        
+        return {
+            "abstract": str(result.get("abstract", "")).strip(),
+            "key_terms": [str(t).strip() for t in result.get("key_terms", []) if str(t).strip()]
+        }
+    
+    def _chat(self, system_prompt: str, prompt: str, temperature: float = 0.7, max_tokens: int = 4000,
+              operation: str = "chat") -> str:
+        """
+        调用模型并收集完整的流式输出
+        
+        Args:
+            system_prompt: 系统提示词
+            prompt: 用户提示词
+            temperature: 采样温度
+            max_tokens: 最大生成token数
+            operation: 调用用途，用于分组统计
+        
+        Returns:
+            模型输出的完整文本
+        """
+        return "".join(self._stream_chat(system_prompt, prompt, temperature, max_tokens, operation))
+    
+    def _parse_json_content(self, content: str) -> Dict[str, Any]:
+        """
+        从模型输出中解析JSON对象，兼容```json代码块和<think>思考内容
+        
+        Args:
+            content: 模型输出文本
+        
+        Returns:
+            解析得到的字典
+        
+        Raises:
+            ValueError: 输出中没有合法的JSON对象
+        """
+        if "</think>" in content:
+            content = content.split("</think>", 1)[1]
+        
+        start = content.find("{")
+        end = content.rfind("}")
+        if start == -1 or end <= start:
+            raise ValueError(f"模型输出中没有JSON对象：{content[:200]}")
+        
+        try:
+            result = json.loads(content[start:end + 1])
+        except json.JSONDecodeError as e:
+            raise ValueError(f"模型输出的JSON格式错误：{str(e)}")
+        
+        if not isinstance(result, dict):
+            raise ValueError("模型输出的JSON不是对象")
+        return result
+    
     def analyze_structure(self, milano_book_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         使用大模型分析MilanoBook的结构，提取逻辑关系
@@ -161,27 +425,17 @@ class GenerateService:
         prompt = self._build_structure_prompt(milano_book_data)
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "你是一个专业的知识结构分析助手，擅长从视频内容中提取逻辑关系和结构化信息。"
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
+            analysis = self._chat(
+                "你是一个专业的知识结构分析助手，擅长从视频内容中提取逻辑关系和结构化信息。",
+                prompt,
                 temperature=0.3,
                 max_tokens=2000,
-                stream=True
+                operation="analyze_structure"
             )
-            
-            # 流式返回分析结果
-            for chunk in response:
-                if chunk.choices[0].delta.content is not None:
-                    yield chunk.choices[0].delta.content
+            return {
+                "success": True,
+                "analysis": analysis
+            }
         except Exception as e:
             print(f"结构分析失败：{str(e)}")
             return {
@@ -189,6 +443,133 @@ class GenerateService:
                 "error": str(e)
             }
     
+    def analyze_structure_json(self, milano_book_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        使用大模型一次性输出严格JSON格式的结构，可直接用于构建Items
+        
+        Args:
+            milano_book_data: MilanoBook数据
+        
+        Returns:
+            包含success和structure（或error）的字典，structure已通过校验，段落序号已转换为从0开始
+        """
+        prompt = self._build_structure_json_prompt(milano_book_data)
+        
+        try:
+            content = self._chat(
+                "你是一个专业的知识结构分析助手，只输出符合要求的JSON，不输出任何解释。",
+                prompt,
+                temperature=0.2,
+                max_tokens=2000,
+                operation="analyze_structure_json"
+            )
+            structure = self._validate_structure(
+                self._parse_json_content(content),
+                len(milano_book_data.get('paragraphs', []))
+            )
+            return {
+                "success": True,
+                "structure": structure
+            }
+        except Exception as e:
+            print(f"结构分析失败：{str(e)}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+    
+    def _validate_structure(self, data: Dict[str, Any], paragraph_count: int) -> Dict[str, Any]:
+        """
+        校验并规范化结构分析JSON
+        
+        越界或非整数的段落序号会被丢弃，没有有效成员的Item会被跳过
+        
+        Args:
+            data: 模型输出解析得到的字典
+            paragraph_count: 段落总数
+        
+        Returns:
+            规范化后的结构字典，包含timelines、lists、graphs三个列表
+        
+        Raises:
+            ValueError: 结构不符合要求或没有任何有效Item
+        """
+        def to_index(value):
+            # 模型看到的段落序号从1开始
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or int(value) != value:
+                return None
+            index = int(value) - 1
+            return index if 0 <= index < paragraph_count else None
+        
+        def text(value, default):
+            return str(value).strip() if isinstance(value, (str, int, float)) and str(value).strip() else default
+        
+        for key in ("timelines", "lists", "graphs"):
+            if not isinstance(data.get(key, []), list):
+                raise ValueError(f"字段{key}必须是数组")
+        
+        structure = {"timelines": [], "lists": [], "graphs": []}
+        
+        for timeline in data.get("timelines", []):
+            if not isinstance(timeline, dict):
+                continue
+            points = []
+            for point in timeline.get("points", []):
+                index = to_index(point.get("paragraph") if isinstance(point, dict) else point)
+                if index is None:
+                    continue
+                time_point = point.get("time") if isinstance(point, dict) else None
+                if isinstance(time_point, bool) or not isinstance(time_point, (int, float)):
+                    time_point = None
+                points.append({"paragraph": index, "time": time_point})
+            if points:
+                structure["timelines"].append({
+                    "name": text(timeline.get("name"), "内容时间线"),
+                    "description": text(timeline.get("description"), ""),
+                    "points": points
+                })
+        
+        for stuff_list in data.get("lists", []):
+            if not isinstance(stuff_list, dict):
+                continue
+            members = [index for index in map(to_index, stuff_list.get("members", [])) if index is not None]
+            if members:
+                structure["lists"].append({
+                    "name": text(stuff_list.get("name"), "关键内容清单"),
+                    "description": text(stuff_list.get("description"), ""),
+                    "members": members
+                })
+        
+        for graph in data.get("graphs", []):
+            if not isinstance(graph, dict):
+                continue
+            nodes = [index for index in map(to_index, graph.get("nodes", [])) if index is not None]
+            edges = []
+            for edge in graph.get("edges", []):
+                if not isinstance(edge, dict):
+                    continue
+                source = to_index(edge.get("source"))
+                target = to_index(edge.get("target"))
+                if source is None or target is None:
+                    continue
+                edges.append({
+                    "source": source,
+                    "target": target,
+                    "relation": text(edge.get("relation"), "相关")
+                })
+            if nodes or edges:
+                structure["graphs"].append({
+                    "name": text(graph.get("name"), "逻辑关系图"),
+                    "description": text(graph.get("description"), ""),
+                    "nodes": nodes,
+                    "edges": edges
+                })
+        
+        if not any(structure.values()):
+            raise ValueError("结构分析结果中没有有效的Item")
+        
+        return structure
+    
     def _build_structure_prompt(self, milano_book_data: Dict[str, Any]) -> str:
         """
         构建结构分析的提示词
@@ -221,4 +602,40 @@ class GenerateService:
         prompt_parts.append("请使用Markdown格式输出，确保分析结果清晰、可操作。")
         
         return "".join(prompt_parts)
+    
+    def _build_structure_json_prompt(self, milano_book_data: Dict[str, Any]) -> str:
+        """
+        构建要求严格JSON输出的结构分析提示词
+        
+        Args:
+            milano_book_data: MilanoBook数据
+        
+        Returns:
+            提示词字符串
+        """
+        prompt_parts = []
+        
+        prompt_parts.append("请分析以下视频内容的逻辑结构：\n\n")
+        prompt_parts.append(f"标题: {milano_book_data['title']}\n")
+        prompt_parts.append(f"作者: {milano_book_data['author']}\n\n")
+        
+        if milano_book_data.get('paragraphs'):
+            prompt_parts.append("### 内容段落\n")
+            for i, para in enumerate(milano_book_data['paragraphs'], 1):
+                prompt_parts.append(f"{i}. [{para['start_time']:.1f}s-{para['end_time']:.1f}s] {para['text_content']}\n")
+            prompt_parts.append("\n")
+        
+        prompt_parts.append("请只输出一个JSON对象，不要输出任何其他内容。段落使用上面的序号引用，格式如下：\n")
+        prompt_parts.append(json.dumps({
+            "timelines": [{"name": "时间线名称", "description": "说明", "points": [{"paragraph": 1, "time": 0.0}]}],
+            "lists": [{"name": "列表名称", "description": "说明", "members": [1, 2]}],
+            "graphs": [{
+                "name": "关系图名称",
+                "description": "说明",
+                "nodes": [1, 2],
+                "edges": [{"source": 1, "target": 2, "relation": "因果"}]
+            }]
+        }, ensure_ascii=False))
+        prompt_parts.append("\n\n只收录真正相关的段落，不需要的类型请输出空数组。")
+        
         return "".join(prompt_parts)
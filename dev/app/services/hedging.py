@@ -0,0 +1,120 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterator, Tuple
+
+
+class _Attempt:
+    """在独立线程中消费一路流式响应，把每个chunk放入共享队列"""
+
+    def __init__(self, label: str, open_stream: Callable[[], Any], events: queue.Queue):
+        self.label = label
+        self._open_stream = open_stream
+        self._events = events
+        self._response = None
+        self.cancelled = threading.Event()
+        self.buffered = []
+        self._thread = threading.Thread(target=self._run, name=f"hedge-{label}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            self._response = self._open_stream()
+            for chunk in self._response:
+                if self.cancelled.is_set():
+                    break
+                self._events.put((self, "chunk", chunk))
+            self._events.put((self, "end", None))
+        except Exception as e:
+            self._events.put((self, "error", e))
+        finally:
+            self._close()
+
+    def cancel(self):
+        """取消这一路请求，关闭底层连接"""
+        self.cancelled.set()
+        self._close()
+
+    def _close(self):
+        response = self._response
+        if response is not None and hasattr(response, "close"):
+            try:
+                response.close()
+            except Exception:
+                pass
+
+
+def hedged_stream(primary: Tuple[str, Callable[[], Any]], secondary: Tuple[str, Callable[[], Any]],
+                  deadline: float, has_token: Callable[[Any], bool]) -> Iterator[Tuple[str, Any]]:
+    """
+    对冲的流式请求：主请求在deadline秒内没有产出首token时，向备用模型/端点发起同样的请求，
+    谁先产出首token就采用谁，另一路会被取消；主请求在首token前出错时立即切换到备用请求
+
+    Args:
+        primary: (标签, 打开流式响应的函数)
+        secondary: (标签, 打开流式响应的函数)
+        deadline: 等待主请求首token的秒数
+        has_token: 判断chunk是否包含生成内容的函数
+
+    Returns:
+        generator: 产出(胜出请求的标签, chunk)
+    """
+    events = queue.Queue()
+    attempts = [_Attempt(*primary, events).start()]
+    hedge_at = time.monotonic() + deadline
+    winner = None
+
+    def start_secondary():
+        attempts.append(_Attempt(*secondary, events).start())
+
+    try:
+        while True:
+            timeout = None
+            if winner is None and len(attempts) == 1:
+                timeout = max(hedge_at - time.monotonic(), 0)
+
+            try:
+                attempt, kind, payload = events.get(timeout=timeout)
+            except queue.Empty:
+                print(f"主请求{deadline}秒内没有返回首token，发起对冲请求")
+                start_secondary()
+                continue
+
+            if attempt.cancelled.is_set() or (winner is not None and attempt is not winner):
+                continue
+
+            if kind == "chunk":
+                if winner is None:
+                    if not has_token(payload):
+                        # 首token之前的chunk（例如只有role的delta）先缓存
+                        attempt.buffered.append(payload)
+                        continue
+                    winner = attempt
+                    for other in attempts:
+                        if other is not winner:
+                            other.cancel()
+                    for buffered in attempt.buffered:
+                        yield attempt.label, buffered
+                yield attempt.label, payload
+            elif kind == "end":
+                if winner is None:
+                    # 没有任何内容就结束，也视为该请求胜出
+                    winner = attempt
+                    for buffered in attempt.buffered:
+                        yield attempt.label, buffered
+                return
+            elif kind == "error":
+                if winner is attempt:
+                    raise payload
+                attempt.cancelled.set()
+                if len(attempts) == 1:
+                    print(f"主请求失败，切换到备用请求：{str(payload)}")
+                    start_secondary()
+                elif all(a.cancelled.is_set() for a in attempts):
+                    raise payload
+    finally:
+        for attempt in attempts:
+            attempt.cancel()
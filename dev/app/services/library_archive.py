@@ -0,0 +1,229 @@
+import hashlib
+import json
+import os
+import tarfile
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Union
+
+from app.models.MilanoBook.blobs import file_sha256
+from app.models.MilanoBook.codec import FORMAT_VERSION, BOOK_FILE_NAMES
+
+# 归档中每个成员的sha256保存在这个pax扩展头中
+CHECKSUM_HEADER = "MILANO.sha256"
+
+MEDIA_KINDS = ("video", "audio")
+
+_BLOCK_SIZE = tarfile.BLOCKSIZE
+_RECORD_SIZE = tarfile.RECORDSIZE
+_CHUNK_SIZE = 1024 * 1024
+
+
+def parse_since(value: Union[None, str, float, int]) -> Optional[float]:
+    """把Unix时间戳或ISO 8601时间转换为Unix时间戳，None或空字符串返回None"""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.fromisoformat(str(value)).timestamp()
+
+
+def _valid_name(name: str) -> bool:
+    """归档中的book_id、notes_id和文件名只能是单个路径分量"""
+    return bool(name) and name not in (".", "..") and "/" not in name and "\\" not in name
+
+
+def _member_header(name: str, size: int, sha256: str, mtime: Optional[float] = None) -> bytes:
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(mtime if mtime is not None else time.time())
+    info.mode = 0o644
+    info.pax_headers = {CHECKSUM_HEADER: sha256}
+    return info.tobuf(format=tarfile.PAX_FORMAT, encoding="utf-8")
+
+
+def _padding(size: int) -> bytes:
+    return b"\0" * (-size % _BLOCK_SIZE)
+
+
+def iter_export(storage, notes_storage, include_media: bool = False, since: Optional[float] = None) -> Iterator[bytes]:
+    """
+    以tar格式流式导出书库，逐块生成字节，内存占用与书库大小无关
+
+    归档依次包含 manifest.json、每本书的 books/<book_id>/book.json（当前版本结构，与存储后端无关）
+    及其媒体 books/<book_id>/media/<kind>/<文件名>、notes/<notes_id>.json；
+    每个成员的sha256保存在pax扩展头 MILANO.sha256 中，导入时逐一校验。
+
+    Args:
+        storage: 书籍存储管理器
+        notes_storage: 笔记存储管理器
+        include_media: 是否包含视频和音频文件
+        since: Unix时间戳，只导出在此之后写入的书籍和笔记（增量导出）；None表示全部
+
+    Yields:
+        tar归档的字节块
+    """
+    written = 0
+
+    def member(name, data, mtime=None):
+        nonlocal written
+        chunk = _member_header(name, len(data), hashlib.sha256(data).hexdigest(), mtime) + data + _padding(len(data))
+        written += len(chunk)
+        return chunk
+
+    manifest = {
+        "exported_at": time.time(),
+        "since": since,
+        "include_media": include_media,
+        "format_version": FORMAT_VERSION
+    }
+    yield member("manifest.json", json.dumps(manifest, ensure_ascii=False).encode("utf-8"))
+
+    for entry in storage.list_books(reverse=False):
+        book_id = entry["book_id"]
+        try:
+            modified_at = storage.book_modified_at(book_id)
+            if since is not None and modified_at <= since:
+                continue
+            book_data = storage.export_book_data(book_id)
+        except FileNotFoundError:
+            # 导出过程中被删除的书籍
+            continue
+        raw = json.dumps(book_data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        yield member(f"books/{book_id}/book.json", raw, modified_at)
+        del raw, book_data
+
+        if not include_media:
+            continue
+        for kind in MEDIA_KINDS:
+            media = storage.get_media(book_id, kind)
+            if media is None:
+                continue
+            sha256 = media["sha256"] or file_sha256(media["path"])
+            size = os.path.getsize(media["path"])
+            header = _member_header(f"books/{book_id}/media/{kind}/{media['filename']}", size, sha256,
+                                    os.path.getmtime(media["path"]))
+            written += len(header)
+            yield header
+            remaining = size
+            with open(media["path"], "rb") as f:
+                while remaining > 0:
+                    chunk = f.read(min(_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise RuntimeError(f"导出过程中媒体文件被截断：{media['path']}")
+                    remaining -= len(chunk)
+                    written += len(chunk)
+                    yield chunk
+            padding = _padding(size)
+            written += len(padding)
+            yield padding
+
+    _, notes_entries = notes_storage.query_notes()
+    for entry in reversed(notes_entries):
+        notes_id = entry["notes_id"]
+        try:
+            modified_at = notes_storage.modified_at(notes_id)
+            if since is not None and modified_at <= since:
+                continue
+            notes_data = notes_storage.load_notes(notes_id)
+        except FileNotFoundError:
+            continue
+        raw = json.dumps(notes_data, ensure_ascii=False).encode("utf-8")
+        yield member(f"notes/{notes_id}.json", raw, modified_at)
+
+    # 归档结尾的两个空块，再补齐到tar的记录大小
+    end = b"\0" * (2 * _BLOCK_SIZE)
+    written += len(end)
+    yield end + b"\0" * (-written % _RECORD_SIZE)
+
+
+def import_archive(storage, notes_storage, fileobj: BinaryIO, overwrite: bool = False) -> Dict[str, Any]:
+    """
+    流式导入iter_export生成的归档（可以是gzip等压缩后的tar），逐个成员校验sha256
+
+    校验失败或无法解析的成员会被跳过并记录在errors中；书籍已存在且overwrite为False时，
+    这本书的数据和媒体都不导入。
+
+    Returns:
+        {"manifest", "books", "media", "notes", "skipped", "errors"}
+    """
+    summary = {"manifest": None, "books": 0, "media": 0, "notes": 0, "skipped": 0, "errors": []}
+    skipped_books = set()
+
+    with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+        for info in archive:
+            if not info.isfile():
+                continue
+            parts = info.name.split("/")
+            expected = info.pax_headers.get(CHECKSUM_HEADER)
+            try:
+                source = archive.extractfile(info)
+                if len(parts) == 5 and parts[0] == "books" and parts[2] == "media":
+                    book_id, kind, file_name = parts[1], parts[3], parts[4]
+                    if book_id in skipped_books:
+                        summary["skipped"] += 1
+                        continue
+                    if not (_valid_name(book_id) and _valid_name(file_name) and kind in MEDIA_KINDS
+                            and file_name not in BOOK_FILE_NAMES):
+                        raise ValueError("无效的媒体路径")
+                    _import_media(storage, book_id, kind, file_name, source, expected)
+                    summary["media"] += 1
+                    continue
+
+                data = source.read()
+                if expected and hashlib.sha256(data).hexdigest() != expected:
+                    raise ValueError("sha256校验失败")
+
+                if info.name == "manifest.json":
+                    summary["manifest"] = json.loads(data)
+                elif len(parts) == 3 and parts[0] == "books" and parts[2] == "book.json" and _valid_name(parts[1]):
+                    book_data = json.loads(data)
+                    if book_data.get("book_id") != parts[1]:
+                        raise ValueError("book_id与路径不一致")
+                    if storage.import_book_data(book_data, overwrite):
+                        summary["books"] += 1
+                    else:
+                        skipped_books.add(parts[1])
+                        summary["skipped"] += 1
+                elif len(parts) == 2 and parts[0] == "notes" and parts[1].endswith(".json") \
+                        and _valid_name(parts[1][:-len(".json")]):
+                    notes_data = json.loads(data)
+                    if notes_data.get("notes_id") != parts[1][:-len(".json")]:
+                        raise ValueError("notes_id与路径不一致")
+                    if not overwrite and notes_storage.exists(notes_data["notes_id"]):
+                        summary["skipped"] += 1
+                    else:
+                        notes_storage.save_notes(notes_data)
+                        summary["notes"] += 1
+                else:
+                    raise ValueError("未知的归档成员")
+            except Exception as e:
+                print(f"跳过归档成员 {info.name}：{str(e)}")
+                summary["errors"].append({"name": info.name, "error": str(e)})
+
+    return summary
+
+
+def _import_media(storage, book_id: str, kind: str, file_name: str, source: BinaryIO, expected: Optional[str]):
+    """把媒体成员边读边计算sha256写入临时文件，校验通过后放入媒体仓库"""
+    if not storage.book_exists(book_id):
+        raise ValueError(f"书籍 {book_id} 不在归档或书库中")
+
+    fd, tmp_path = tempfile.mkstemp(dir=storage.storage_dir, suffix=".tmp")
+    try:
+        digest = hashlib.sha256()
+        with os.fdopen(fd, "wb") as f:
+            for chunk in iter(lambda: source.read(_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                f.write(chunk)
+        if expected and digest.hexdigest() != expected:
+            raise ValueError("sha256校验失败")
+
+        book_dir = os.path.join(storage.storage_dir, book_id)
+        os.makedirs(book_dir, exist_ok=True)
+        storage.blob_store.add_media(book_id, kind, tmp_path, os.path.join(book_dir, file_name))
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
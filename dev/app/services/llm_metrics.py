@@ -0,0 +1,96 @@
+import bisect
+import threading
+from typing import Any, Dict, List, Optional
+
+
+class Histogram:
+    """固定分桶的直方图，记录观测值的分布、总和与次数"""
+
+    def __init__(self, buckets: List[float]):
+        self.buckets = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        """记录一次观测值"""
+        self._counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回累计分桶计数（le为上界，inf表示所有观测值）"""
+        cumulative = 0
+        buckets = []
+        for bound, count in zip(self.buckets + [float("inf")], self._counts):
+            cumulative += count
+            buckets.append({"le": bound if bound != float("inf") else "inf", "count": cumulative})
+        return {
+            "buckets": buckets,
+            "count": self.count,
+            "sum": self.total,
+            "avg": self.total / self.count if self.count else None
+        }
+
+
+# 各指标的分桶边界
+_BUCKETS = {
+    "ttft_seconds": [0.25, 0.5, 1, 2, 4, 8, 15, 30, 60],
+    "latency_seconds": [1, 2, 5, 10, 20, 30, 60, 120, 300],
+    "tokens_per_second": [1, 5, 10, 20, 40, 80, 160],
+    "prompt_tokens": [250, 500, 1000, 2000, 4000, 8000, 16000, 32000],
+    "completion_tokens": [100, 250, 500, 1000, 2000, 4000, 8000]
+}
+
+
+class LLMMetrics:
+    """按模型和操作聚合的大模型调用指标，线程安全"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def record(self, stats: Dict[str, Any]):
+        """
+        记录一次模型调用
+
+        Args:
+            stats: GenerateService产生的调用统计，包含model、operation、success以及各项耗时和token数
+        """
+        key = (stats.get("model") or "unknown", stats.get("operation") or "unknown")
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {
+                    "calls": 0,
+                    "errors": 0,
+                    "histograms": {name: Histogram(buckets) for name, buckets in _BUCKETS.items()}
+                }
+                self._series[key] = series
+
+            series["calls"] += 1
+            if not stats.get("success"):
+                series["errors"] += 1
+            for name, histogram in series["histograms"].items():
+                value = stats.get(name)
+                if value is not None:
+                    histogram.observe(value)
+
+    def snapshot(self, model: Optional[str] = None) -> List[Dict[str, Any]]:
+        """返回所有（或指定模型的）聚合指标"""
+        with self._lock:
+            return [
+                {
+                    "model": series_model,
+                    "operation": operation,
+                    "calls": series["calls"],
+                    "errors": series["errors"],
+                    "histograms": {name: h.snapshot() for name, h in series["histograms"].items()}
+                }
+                for (series_model, operation), series in sorted(self._series.items())
+                if model is None or series_model == model
+            ]
+
+
+# 进程内共享的指标注册表
+metrics = LLMMetrics()
@@ -0,0 +1,195 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional
+
+MEDIA_KINDS = ("video", "audio")
+
+
+class MediaGovernor:
+    """控制书库中媒体文件占用的磁盘空间
+
+    - 媒体总大小超过预算时，按最近访问时间淘汰最久未访问书籍的视频和音频（书籍数据保留）
+    - 可选地把保留的音频转码为低码率Opus
+    - 被淘汰的媒体再次被请求时，从书籍的source_url重新下载；从未有过某种媒体的书籍不会触发下载
+    """
+
+    def __init__(self, storage, processor=None, budget_bytes: Optional[int] = None,
+                 opus_bitrate: Optional[str] = None):
+        """
+        Args:
+            storage: 书籍存储管理器
+            processor: VideoProcessor，用于重新下载被淘汰的媒体；None表示不重新下载
+            budget_bytes: 媒体总大小上限（字节），未指定时读取环境变量MILANO_MEDIA_BUDGET_MB（默认0，表示不限制）
+            opus_bitrate: 音频转码为Opus的码率（如32k），未指定时读取环境变量MILANO_AUDIO_OPUS_BITRATE（默认不转码）
+        """
+        self.storage = storage
+        self.processor = processor
+        if budget_bytes is None:
+            budget_bytes = int(float(os.environ.get("MILANO_MEDIA_BUDGET_MB", "0")) * 1024 * 1024)
+        self.budget_bytes = budget_bytes
+        self.opus_bitrate = opus_bitrate if opus_bitrate is not None else os.environ.get("MILANO_AUDIO_OPUS_BITRATE", "")
+        self._lock = threading.Lock()
+        self._download_locks: Dict[str, threading.Lock] = {}
+
+    def media_usage(self) -> Dict[str, Any]:
+        """媒体占用统计，被多本书共用的文件只计算一次"""
+        sizes = {}
+        books = 0
+        refs = self.storage.blob_store.media_table()
+        for entry in self.storage.list_books(reverse=False):
+            has_media = False
+            for kind in MEDIA_KINDS:
+                media = self.storage.get_media(entry["book_id"], kind, refs)
+                if media:
+                    sizes[media["sha256"] or media["path"]] = media["size"]
+                    has_media = True
+            books += has_media
+        return {"bytes": sum(sizes.values()), "files": len(sizes), "books": books, "budget": self.budget_bytes}
+
+    def enforce(self, keep: Optional[str] = None) -> Dict[str, Any]:
+        """
+        执行保留策略：先按配置转码音频，再淘汰媒体直到总大小不超过预算
+
+        Args:
+            keep: 不淘汰的书籍（通常是刚入库或正在访问的书籍）
+
+        Returns:
+            {"transcoded": [book_id], "evicted": [book_id], "freed": 释放的字节数, "usage": 执行后的占用统计}
+        """
+        with self._lock:
+            transcoded = []
+            if self.opus_bitrate:
+                refs = self.storage.blob_store.media_table()
+                for entry in self.storage.list_books(reverse=False):
+                    if self.transcode_audio(entry["book_id"], refs):
+                        transcoded.append(entry["book_id"])
+
+            evicted = []
+            freed = 0
+            usage = self.media_usage()
+            if self.budget_bytes > 0 and usage["bytes"] > self.budget_bytes:
+                total = usage["bytes"]
+                for book_id in self._eviction_order(keep):
+                    if total <= self.budget_bytes:
+                        break
+                    released = self.storage.evict_media(book_id)
+                    total -= released
+                    freed += released
+                    evicted.append(book_id)
+                usage = self.media_usage()
+
+            return {"transcoded": transcoded, "evicted": evicted, "freed": freed, "usage": usage}
+
+    def _eviction_order(self, keep: Optional[str]) -> List[str]:
+        """有媒体的书籍，按最近访问时间从旧到新排列"""
+        candidates = []
+        refs = self.storage.blob_store.media_table()
+        for entry in self.storage.list_books(reverse=False):
+            book_id = entry["book_id"]
+            if book_id == keep:
+                continue
+            if any(self.storage.get_media(book_id, kind, refs) for kind in MEDIA_KINDS):
+                candidates.append((self.storage.media_accessed_at(book_id), book_id))
+        candidates.sort()
+        return [book_id for _, book_id in candidates]
+
+    def transcode_audio(self, book_id: str, refs: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        把书籍的音频转码为Opus并替换原文件
+
+        Args:
+            book_id: 书籍ID
+            refs: 预先读取的媒体引用表，同storage.get_media
+
+        Returns:
+            是否进行了转码（没有音频、已经是Opus或转码失败时为False）
+        """
+        media = self.storage.get_media(book_id, "audio", refs)
+        if media is None or media["filename"].lower().endswith(".opus"):
+            return False
+
+        tmp_dir = tempfile.mkdtemp(dir=self.storage.storage_dir, suffix=".tmp")
+        try:
+            opus_path = os.path.join(tmp_dir, os.path.splitext(media["filename"])[0] + ".opus")
+            cmd = [
+                'ffmpeg',
+                '-v', 'error',
+                '-i', media["path"],
+                '-vn',
+                '-c:a', 'libopus',
+                '-b:a', self.opus_bitrate,
+                '-application', 'voip',
+                '-y',
+                opus_path
+            ]
+            try:
+                result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='ignore')
+            except OSError as e:
+                print(f"ffmpeg不可用，无法转码音频：{str(e)}")
+                return False
+            if result.returncode != 0 or not os.path.exists(opus_path) or os.path.getsize(opus_path) == 0:
+                print(f"音频转码失败 {book_id}：{result.stderr.strip()}")
+                return False
+
+            self.storage.store_media(book_id, audio_path=opus_path)
+            return True
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def ensure_media(self, book_id: str, kind: str) -> Optional[Dict[str, Any]]:
+        """
+        获取书籍的媒体并记录访问；媒体已被淘汰时从source_url重新下载
+
+        Returns:
+            同storage.get_media，无法获取时返回None
+
+        Raises:
+            FileNotFoundError: 书籍不存在
+        """
+        media = self.storage.get_media(book_id, kind)
+        if media is None and self.processor is not None and kind in self.storage.evicted_media(book_id):
+            with self._lock:
+                download_lock = self._download_locks.setdefault(book_id, threading.Lock())
+            # 同一本书的并发请求只下载一次
+            with download_lock:
+                try:
+                    media = self.storage.get_media(book_id, kind)
+                    if media is None:
+                        media = self._redownload(book_id, kind)
+                finally:
+                    # 等待中的请求持有同一个锁，拿到锁后会先检查媒体是否已经下载
+                    with self._lock:
+                        if self._download_locks.get(book_id) is download_lock:
+                            del self._download_locks[book_id]
+
+        if media is not None:
+            self.storage.touch_media(book_id)
+        return media
+
+    def _redownload(self, book_id: str, kind: str) -> Optional[Dict[str, Any]]:
+        """从source_url重新下载视频（请求音频时同时提取音频），并重新执行保留策略"""
+        source_url = self.storage.open_book(book_id).source_url
+        if not source_url:
+            return None
+
+        print(f"重新下载书籍 {book_id} 的媒体：{source_url}")
+        try:
+            video_path = self.processor.download_video(source_url)["filename"]
+            audio_path = None
+            if kind == "audio":
+                audio_path = os.path.splitext(video_path)[0] + ".mp3"
+                if not self.processor.extract_audio(video_path, audio_path):
+                    audio_path = None
+            self.storage.store_media(book_id, video_path=video_path, audio_path=audio_path)
+        except Exception as e:
+            print(f"重新下载媒体失败：{str(e)}")
+            return None
+
+        if kind == "audio" and self.opus_bitrate:
+            self.transcode_audio(book_id)
+        self.storage.touch_media(book_id)
+        self.enforce(keep=book_id)
+        return self.storage.get_media(book_id, kind)
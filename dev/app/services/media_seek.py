@@ -0,0 +1,105 @@
+import bisect
+import os
+import subprocess
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# 最多缓存多少个媒体文件的关键帧索引
+KEYFRAME_CACHE_SIZE = 64
+
+
+class MediaSeeker:
+    """把媒体中的时间换算为可以直接跳转的关键帧时间和字节位置
+
+    第一次查询某个文件时用ffprobe读取所选流的全部数据包，记录关键帧的(时间, 文件字节位置)，
+    之后的查询只是在内存中二分查找。索引按文件路径、mtime和大小缓存。
+    """
+
+    def __init__(self, cache_size: int = KEYFRAME_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._indexes = OrderedDict()
+
+    def keyframes(self, media_path: str, kind: str = "video") -> Optional[Tuple[List[float], List[int]]]:
+        """
+        读取媒体文件的关键帧索引
+
+        Args:
+            media_path: 媒体文件路径
+            kind: video（使用第一个视频流）或audio（使用第一个音频流，每个数据包都可以独立解码）
+
+        Returns:
+            (按时间升序的关键帧时间列表, 对应的字节位置列表)；ffprobe不可用或读取失败时返回None
+        """
+        stat = os.stat(media_path)
+        key = (media_path, kind, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if key in self._indexes:
+                self._indexes.move_to_end(key)
+                return self._indexes[key]
+
+        index = self._probe(media_path, kind)
+        if index is None:
+            return None
+
+        with self._lock:
+            self._indexes[key] = index
+            while len(self._indexes) > self.cache_size:
+                self._indexes.popitem(last=False)
+        return index
+
+    def seek_target(self, media_path: str, seconds: float, kind: str = "video") -> Dict[str, Any]:
+        """
+        计算跳转到seconds时应该从哪个关键帧开始
+
+        Returns:
+            {"time": 请求的时间, "keyframe_time": 不晚于该时间的最后一个关键帧时间,
+             "byte_offset": 该关键帧在文件中的字节位置}；无法读取关键帧时后两项为None
+        """
+        target = {"time": seconds, "keyframe_time": None, "byte_offset": None}
+        index = self.keyframes(media_path, kind)
+        if not index or not index[0]:
+            return target
+
+        times, positions = index
+        i = max(bisect.bisect_right(times, seconds) - 1, 0)
+        target["keyframe_time"] = times[i]
+        target["byte_offset"] = positions[i]
+        return target
+
+    def _probe(self, media_path: str, kind: str) -> Optional[Tuple[List[float], List[int]]]:
+        """调用ffprobe列出所选流的数据包，只保留关键帧"""
+        cmd = [
+            'ffprobe',
+            '-v', 'error',
+            '-select_streams', 'v:0' if kind == "video" else 'a:0',
+            '-show_entries', 'packet=pts_time,pos,flags',
+            '-of', 'csv=p=0',
+            media_path
+        ]
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='ignore')
+        except OSError as e:
+            print(f"ffprobe不可用，无法计算跳转位置：{str(e)}")
+            return None
+        if result.returncode != 0:
+            print(f"读取关键帧失败：{result.stderr.strip()}")
+            return None
+
+        keyframes = []
+        for line in result.stdout.splitlines():
+            fields = line.strip().split(',')
+            if len(fields) < 3 or 'K' not in fields[2]:
+                continue
+            try:
+                keyframes.append((float(fields[0]), int(fields[1])))
+            except ValueError:
+                # pts或pos为N/A的数据包
+                continue
+
+        keyframes.sort()
+        return [t for t, _ in keyframes], [p for _, p in keyframes]
+
+
+seeker = MediaSeeker()
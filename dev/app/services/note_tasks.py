@@ -0,0 +1,163 @@
+import json
+import os
+import threading
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+
+class NoteGenerationTask:
+    """在后台线程中运行的笔记生成任务
+
+    生成的片段同时保存在内存和 notes/<notes_id>.log 追加日志中，
+    与发起请求的连接无关；任意数量的观察者都可以通过 tail 从指定偏移量开始跟随输出。
+    偏移量是已输出内容的字符数，因此生成完成后也可以用保存的笔记内容续传。
+    """
+
+    def __init__(self, notes_id: str, chunks: Iterable[str], on_complete: Callable[[str], None],
+                 log_dir: str = "notes", on_finish: Optional[Callable[[], None]] = None):
+        self.notes_id = notes_id
+        self.log_path = os.path.join(log_dir, f"{notes_id}.log")
+        self._chunks_source = chunks
+        self._on_complete = on_complete
+        self._on_finish = on_finish
+        self._chunks = []
+        self._condition = threading.Condition()
+        self.done = False
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name=f"notes-{notes_id}", daemon=True)
+
+    def start(self):
+        """启动后台生成线程"""
+        os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        """消费生成器，把每个片段写入日志并通知观察者"""
+        try:
+            with open(self.log_path, "a", encoding="utf-8") as log:
+                for chunk in self._chunks_source:
+                    if not chunk:
+                        continue
+                    log.write(json.dumps({"content": chunk}, ensure_ascii=False) + "\n")
+                    log.flush()
+                    with self._condition:
+                        self._chunks.append(chunk)
+                        self._condition.notify_all()
+
+            self._on_complete(self.content)
+            # 笔记已完整保存，续传改为读取笔记内容，日志不再需要
+            os.remove(self.log_path)
+        except Exception as e:
+            print(f"后台生成笔记失败：{str(e)}")
+            self.error = str(e)
+        finally:
+            with self._condition:
+                self.done = True
+                self._condition.notify_all()
+            if self._on_finish:
+                self._on_finish()
+
+    @property
+    def content(self) -> str:
+        """目前已生成的全部内容"""
+        with self._condition:
+            return "".join(self._chunks)
+
+    def tail(self, offset: int = 0, keepalive: float = 15.0) -> Iterator[Optional[Tuple[int, str]]]:
+        """
+        从字符偏移量offset开始跟随输出
+
+        Args:
+            offset: 已接收内容的字符数
+            keepalive: 等待新片段的最长秒数，超时会产出None，便于调用方发送心跳
+
+        Returns:
+            generator: 产出(片段结束后的偏移量, 片段)，任务结束后停止
+        """
+        index = 0
+        position = 0
+        while True:
+            with self._condition:
+                if index >= len(self._chunks) and not self.done:
+                    self._condition.wait(timeout=keepalive)
+                pending = self._chunks[index:]
+                finished = self.done
+
+            if not pending and not finished:
+                yield None
+                continue
+
+            for chunk in pending:
+                index += 1
+                end = position + len(chunk)
+                if end > offset:
+                    yield end, chunk[max(offset - position, 0):]
+                position = end
+
+            if finished and index >= len(self._chunks):
+                return
+
+
+class NoteTaskManager:
+    """管理进行中的笔记生成任务，任务结束后自动移除
+
+    带key启动的任务会进行single-flight合并：相同key的任务进行中时，
+    后来的请求直接复用该任务，从头跟随同一份输出，不会再次调用模型。
+    """
+
+    def __init__(self, log_dir: str = "notes"):
+        self.log_dir = log_dir
+        self._tasks = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def start(self, notes_id: str, chunks_factory: Callable[[], Iterable[str]],
+              on_complete: Callable[[str], None], key: Optional[str] = None) -> Tuple[NoteGenerationTask, bool]:
+        """
+        创建并启动一个后台生成任务
+
+        Args:
+            notes_id: 新任务的笔记ID
+            chunks_factory: 返回内容片段生成器的函数，只有真正创建任务时才会调用
+            on_complete: 生成完成后保存笔记的回调
+            key: 合并键，相同key的进行中任务会被复用
+
+        Returns:
+            (任务, 是否复用了已有任务)
+        """
+        with self._lock:
+            if key is not None and key in self._inflight:
+                return self._tasks[self._inflight[key]], True
+
+            def finish():
+                with self._lock:
+                    self._tasks.pop(notes_id, None)
+                    if key is not None and self._inflight.get(key) == notes_id:
+                        del self._inflight[key]
+
+            task = NoteGenerationTask(notes_id, chunks_factory(), on_complete, log_dir=self.log_dir, on_finish=finish)
+            self._tasks[notes_id] = task
+            if key is not None:
+                self._inflight[key] = notes_id
+        return task.start(), False
+
+    def get(self, notes_id: str) -> Optional[NoteGenerationTask]:
+        """获取进行中的任务，不存在或已结束时返回None"""
+        with self._lock:
+            return self._tasks.get(notes_id)
+
+    def read_log(self, notes_id: str) -> Optional[str]:
+        """读取被中断任务（例如进程重启）遗留的追加日志，不存在时返回None"""
+        log_path = os.path.join(self.log_dir, f"{notes_id}.log")
+        if not os.path.exists(log_path):
+            return None
+
+        chunks = []
+        with open(log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    chunks.append(json.loads(line)["content"])
+                except (ValueError, KeyError):
+                    # 进程崩溃时最后一行可能没有写完整
+                    break
+        return "".join(chunks)
@@ -0,0 +1,92 @@
+import sqlite3
+import threading
+from typing import Iterable, Optional, Set, Tuple
+
+# FTS5的trigram分词器按三个字符建立索引，更短的查询只能逐行查找子串
+_TRIGRAM_LENGTH = 3
+
+
+class NotesSearchIndex:
+    """笔记正文和提示词的全文索引（notes/search.db）
+
+    每篇笔记保存一行小写后的正文和提示词。SQLite支持FTS5 trigram分词器时建立trigram索引，
+    不少于三个字符的查询直接走索引；更短的查询（如两个汉字的词）和不支持FTS5的SQLite用instr在数据库中
+    逐行查找子串，不再打开笔记文件。索引由NotesStorage在保存和删除笔记时同步更新。
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+
+        conn = self._connect()
+        try:
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS notes_search "
+                "USING fts5(notes_id UNINDEXED, body, tokenize='trigram')"
+            )
+            self.fts = True
+        except sqlite3.OperationalError:
+            # SQLite 3.34之前没有trigram分词器
+            conn.execute("CREATE TABLE IF NOT EXISTS notes_search (notes_id TEXT NOT NULL, body TEXT NOT NULL)")
+            self.fts = False
+        conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _body(content: str, user_prompt: Optional[str]) -> str:
+        return f"{content or ''}\n{user_prompt or ''}".lower()
+
+    def index(self, notes_id: str, content: str, user_prompt: Optional[str] = None):
+        """新增或替换一篇笔记的索引"""
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM notes_search WHERE notes_id = ?", (notes_id,))
+            conn.execute("INSERT INTO notes_search (notes_id, body) VALUES (?, ?)",
+                         (notes_id, self._body(content, user_prompt)))
+
+    def remove(self, notes_id: str):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM notes_search WHERE notes_id = ?", (notes_id,))
+
+    def rebuild(self, notes: Iterable[Tuple[str, str, Optional[str]]]):
+        """
+        用(notes_id, 正文, 提示词)重新生成全部索引
+
+        Args:
+            notes: 可以是生成器，逐篇读取笔记文件，不需要全部放入内存
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM notes_search")
+            conn.executemany(
+                "INSERT INTO notes_search (notes_id, body) VALUES (?, ?)",
+                ((notes_id, self._body(content, user_prompt)) for notes_id, content, user_prompt in notes)
+            )
+
+    def count(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM notes_search").fetchone()[0]
+
+    def search(self, query: str) -> Set[str]:
+        """正文或提示词包含query（不区分大小写）的笔记ID集合"""
+        query = query.lower()
+        if self.fts and len(query) >= _TRIGRAM_LENGTH:
+            # 整个查询作为一个短语，trigram索引按子串匹配
+            phrase = '"' + query.replace('"', '""') + '"'
+            rows = self._connect().execute(
+                "SELECT notes_id FROM notes_search WHERE notes_search MATCH ?", (phrase,)
+            )
+        else:
+            rows = self._connect().execute(
+                "SELECT notes_id FROM notes_search WHERE instr(body, ?) > 0", (query,)
+            )
+        return {row[0] for row in rows}
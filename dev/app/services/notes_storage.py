@@ -0,0 +1,235 @@
+import json
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.models.MilanoBook.locks import file_lock
+from app.services.notes_search import NotesSearchIndex
+
+# 目录索引中保存的笔记正文和提示词摘录长度
+EXCERPT_LENGTH = 200
+PROMPT_EXCERPT_LENGTH = 100
+
+# notes_id是uuid4生成的UUID字符串，其他值（如catalog）都不是笔记
+NOTES_ID_PATTERN = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
+
+def valid_notes_id(notes_id: str) -> bool:
+    """检查notes_id是否为UUID字符串"""
+    return isinstance(notes_id, str) and NOTES_ID_PATTERN.fullmatch(notes_id) is not None
+
+
+class NotesStorage:
+    """生成笔记的存储管理器
+
+    每篇笔记仍然保存为 notes/<notes_id>.json；另外维护 notes/catalog.json 目录索引
+    （不含正文），列表和按书籍查找只读取索引，不再逐个解析笔记文件；关键词搜索使用
+    notes/search.db 全文索引。
+    """
+
+    def __init__(self, notes_dir: str = "notes"):
+        self.notes_dir = notes_dir
+        os.makedirs(self.notes_dir, exist_ok=True)
+        self._catalog_path = os.path.join(self.notes_dir, "catalog.json")
+        # 目录索引的读-改-写在线程和进程之间都要互斥
+        self._catalog_lock_path = self._catalog_path + ".lock"
+        # (文件签名, 索引, 书籍ID -> 笔记ID列表)
+        self._catalog_cache = None
+        self.search_index = NotesSearchIndex(os.path.join(self.notes_dir, "search.db"))
+
+    def _get_notes_path(self, notes_id: str) -> str:
+        """笔记文件路径，notes_id无效时抛出FileNotFoundError"""
+        if not valid_notes_id(notes_id):
+            raise FileNotFoundError(f"笔记 {notes_id} 不存在")
+        return os.path.join(self.notes_dir, f"{notes_id}.json")
+
+    def exists(self, notes_id: str) -> bool:
+        return valid_notes_id(notes_id) and os.path.exists(self._get_notes_path(notes_id))
+
+    def modified_at(self, notes_id: str) -> float:
+        """笔记文件最后一次写入的时间（Unix时间戳）"""
+        return os.path.getmtime(self._get_notes_path(notes_id))
+
+    def load_notes(self, notes_id: str) -> Dict[str, Any]:
+        """读取笔记（包含正文），不存在时抛出FileNotFoundError"""
+        notes_path = self._get_notes_path(notes_id)
+        if not os.path.exists(notes_path):
+            raise FileNotFoundError(f"笔记 {notes_id} 不存在")
+        with open(notes_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_notes(self, notes_data: Dict[str, Any]) -> Dict[str, Any]:
+        """保存（新建或覆盖）笔记并更新目录索引，notes_id不是UUID时抛出ValueError"""
+        notes_id = notes_data["notes_id"]
+        if not valid_notes_id(notes_id):
+            raise ValueError(f"无效的notes_id：{notes_id}")
+        notes_path = self._get_notes_path(notes_id)
+        tmp_path = f"{notes_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(notes_data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, notes_path)
+
+        self._update_catalog(notes_id, self._catalog_entry(notes_data))
+        self.search_index.index(notes_id, notes_data.get("content", ""), notes_data.get("user_prompt"))
+        return notes_data
+
+    def delete_notes(self, notes_id: str) -> bool:
+        """删除笔记，不存在时返回False"""
+        if not self.exists(notes_id):
+            return False
+        os.remove(self._get_notes_path(notes_id))
+        self._update_catalog(notes_id)
+        self.search_index.remove(notes_id)
+        return True
+
+    def query_notes(self, limit: Optional[int] = None, offset: int = 0, book_id: Optional[str] = None,
+                    query: Optional[str] = None) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        按创建时间倒序分页列出笔记摘要
+
+        Args:
+            limit: 最多返回的数量，None表示全部
+            offset: 跳过的数量
+            book_id: 只列出使用了这本书籍的笔记
+            query: 只列出正文或提示词中包含该文本的笔记（不区分大小写），使用全文索引查找
+
+        Returns:
+            (符合条件的笔记总数, 笔记摘要列表)
+
+        Raises:
+            ValueError: offset为负数或limit小于1
+        """
+        if offset < 0 or (limit is not None and limit < 1):
+            raise ValueError("offset不能为负数，limit必须大于0")
+        catalog, by_book = self._load_catalog()
+        entries = catalog["notes"]
+
+        if book_id is not None:
+            wanted = set(by_book.get(book_id, []))
+            entries = [e for e in entries if e["notes_id"] in wanted]
+        if query:
+            if not self.search_index.count() and entries:
+                # 建立全文索引之前保存的笔记，第一次搜索时补建索引
+                self.rebuild_catalog()
+            matched = self.search_index.search(query)
+            entries = [e for e in entries if e["notes_id"] in matched]
+
+        # 索引按created_at升序保存
+        entries = entries[::-1]
+        end = None if limit is None else offset + limit
+        return len(entries), [dict(e) for e in entries[offset:end]]
+
+    def notes_for_book(self, book_id: str) -> List[str]:
+        """使用了指定书籍的笔记ID列表（按创建时间升序）"""
+        return list(self._load_catalog()[1].get(book_id, []))
+
+    def count_notes(self) -> int:
+        return len(self._load_catalog()[0]["notes"])
+
+    def catalog_version(self) -> int:
+        """目录索引的版本号，每次保存或删除笔记都会递增"""
+        return self._load_catalog()[0]["version"]
+
+    def rebuild_catalog(self) -> Dict[str, Any]:
+        """扫描笔记目录，重新生成目录索引和全文索引"""
+        with file_lock(self._catalog_lock_path):
+            previous = self._read_catalog_file(use_cache=False)
+            entries = []
+
+            def scan():
+                # 逐篇读取，全文索引边读边写入，不把所有笔记正文放入内存
+                for filename in os.listdir(self.notes_dir):
+                    if filename.endswith(".json") and valid_notes_id(filename[:-len(".json")]):
+                        try:
+                            with open(os.path.join(self.notes_dir, filename), "r", encoding="utf-8") as f:
+                                notes_data = json.load(f)
+                            entries.append(self._catalog_entry(notes_data))
+                        except (OSError, ValueError, KeyError) as e:
+                            print(f"跳过无法解析的笔记文件 {filename}：{str(e)}")
+                            continue
+                        yield notes_data["notes_id"], notes_data.get("content", ""), notes_data.get("user_prompt")
+
+            self.search_index.rebuild(scan())
+
+            entries.sort(key=lambda x: x["created_at"])
+            catalog = {
+                "version": (previous[0]["version"] + 1) if previous else 1,
+                "notes": entries
+            }
+            self._write_catalog_file(catalog)
+            return catalog
+
+    def _catalog_entry(self, notes_data: Dict[str, Any]) -> Dict[str, Any]:
+        """目录索引中的单条记录"""
+        content = notes_data.get("content", "")
+        return {
+            "notes_id": notes_data["notes_id"],
+            "book_ids": notes_data.get("book_ids", []),
+            "prompt_excerpt": (notes_data.get("user_prompt") or "")[:PROMPT_EXCERPT_LENGTH],
+            "excerpt": content[:EXCERPT_LENGTH],
+            "size": len(content.encode("utf-8")),
+            "draft": bool(notes_data.get("draft")),
+            "created_at": notes_data.get("created_at", "")
+        }
+
+    def _load_catalog(self):
+        """读取目录索引和书籍索引，不存在或损坏时自动重建"""
+        cached = self._read_catalog_file()
+        if cached is None:
+            self.rebuild_catalog()
+            cached = self._read_catalog_file()
+        return cached
+
+    def _read_catalog_file(self, use_cache: bool = True):
+        """读取目录索引文件并建立书籍索引，文件未变化时直接使用内存中的副本；use_cache为False时总是重新读取（读-改-写时使用）"""
+        try:
+            stat = os.stat(self._catalog_path)
+        except FileNotFoundError:
+            return None
+
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if use_cache and self._catalog_cache is not None and self._catalog_cache[0] == signature:
+            return self._catalog_cache[1:]
+
+        try:
+            with open(self._catalog_path, "r", encoding="utf-8") as f:
+                catalog = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"读取笔记目录索引失败，将重建：{str(e)}")
+            return None
+
+        by_book = {}
+        for entry in catalog["notes"]:
+            for book_id in entry["book_ids"]:
+                by_book.setdefault(book_id, []).append(entry["notes_id"])
+
+        self._catalog_cache = (signature, catalog, by_book)
+        return catalog, by_book
+
+    def _write_catalog_file(self, catalog: Dict[str, Any]):
+        """原子地写入目录索引（先写临时文件再替换）"""
+        tmp_path = f"{self._catalog_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(catalog, f, ensure_ascii=False)
+        os.replace(tmp_path, self._catalog_path)
+        self._catalog_cache = None
+
+    def _update_catalog(self, notes_id: str, entry: Optional[Dict[str, Any]] = None):
+        """在目录索引中新增/更新（entry不为None）或删除一篇笔记"""
+        with file_lock(self._catalog_lock_path):
+            cached = self._read_catalog_file(use_cache=False)
+            if cached is None:
+                # 索引缺失时从磁盘重建，重建结果已经包含本次的变更
+                self.rebuild_catalog()
+                return
+
+            catalog = cached[0]
+            notes = [n for n in catalog["notes"] if n["notes_id"] != notes_id]
+            if entry is not None:
+                # 通常是最新的笔记，从末尾向前找插入位置
+                position = len(notes)
+                while position > 0 and notes[position - 1]["created_at"] > entry["created_at"]:
+                    position -= 1
+                notes.insert(position, entry)
+            self._write_catalog_file({"version": catalog["version"] + 1, "notes": notes})
@@ -2,6 +2,9 @@ import yt_dlp
 import os
 import subprocess
 import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, List, Any, Tuple
 from app.models.MilanoBook import MilanoBook, Paragraph
 from app.models.MilanoBook.Item.StuffList import StuffList
@@ -9,8 +12,13 @@ from app.models.MilanoBook.Item.Timeline import Timeline
 from app.models.MilanoBook.Item.RelationGraph import RelationGraph
 
 class VideoProcessor:
-    def __init__(self, output_dir="downloads"):
+    def __init__(self, output_dir="downloads", enrich_workers=None, recomposition_mode=None):
         self.output_dir = output_dir
+        # 入库预计算时并发调用大模型的最大线程数
+        self.enrich_workers = enrich_workers or int(os.environ.get("MILANO_ENRICH_WORKERS", "4"))
+        # 重组模式：json为一次调用输出严格JSON结构，markdown为旧的自由文本分析
+        self.recomposition_mode = recomposition_mode or os.environ.get("MILANO_RECOMPOSITION_MODE", "json")
+        self.recomposition_cache_dir = os.path.join(output_dir, "recomposition_cache")
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
     
@@ -274,6 +282,16 @@ class VideoProcessor:
                 "items": []
             }
             
+            if self.recomposition_mode == "json":
+                structure_result = self._analyze_structure_cached(generate_service, milano_book_data)
+                
+                if structure_result["success"]:
+                    self._create_items_from_structure(milano_book, paragraphs, structure_result["structure"])
+                else:
+                    print(f"结构分析失败，使用默认重组：{structure_result.get('error', 'Unknown error')}")
+                    self._default_recomposition(milano_book, paragraphs)
+                return milano_book
+            
             analysis_result = generate_service.analyze_structure(milano_book_data)
             
             if analysis_result["success"]:
@@ -288,6 +306,65 @@ class VideoProcessor:
         
         return milano_book
     
+    def _analyze_structure_cached(self, generate_service, milano_book_data: Dict[str, Any]) -> Dict[str, Any]:
+        """调用JSON结构分析，并按文稿哈希缓存成功的结果"""
+        transcript = json.dumps(
+            [milano_book_data["title"], generate_service.model_name, milano_book_data["paragraphs"]],
+            ensure_ascii=False,
+            sort_keys=True
+        )
+        transcript_hash = hashlib.sha256(transcript.encode("utf-8")).hexdigest()
+        cache_path = os.path.join(self.recomposition_cache_dir, f"{transcript_hash}.json")
+        
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'r', encoding='utf-8') as f:
+                    return {"success": True, "structure": json.load(f)}
+            except (OSError, ValueError) as e:
+                print(f"读取结构缓存失败，重新分析：{str(e)}")
+        
+        structure_result = generate_service.analyze_structure_json(milano_book_data)
+        
+        if structure_result["success"]:
+            # 写缓存失败不影响已经得到的结构分析结果
+            tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                os.makedirs(self.recomposition_cache_dir, exist_ok=True)
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(structure_result["structure"], f, ensure_ascii=False)
+                os.replace(tmp_path, cache_path)
+            except OSError as e:
+                print(f"写入结构缓存失败：{str(e)}")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        
+        return structure_result
+    
+    def _create_items_from_structure(self, milano_book: MilanoBook, paragraphs: List[Paragraph], structure: Dict[str, Any]):
+        """根据已校验的JSON结构直接创建Items，段落序号从0开始"""
+        for timeline_data in structure["timelines"]:
+            timeline = Timeline(name=timeline_data["name"], description=timeline_data["description"])
+            timeline.extend(
+                (point["time"] if point["time"] is not None else paragraphs[point["paragraph"]].start_time,
+                 paragraphs[point["paragraph"]])
+                for point in timeline_data["points"]
+            )
+            milano_book.add_item(timeline)
+        
+        for list_data in structure["lists"]:
+            stuff_list = StuffList(name=list_data["name"], description=list_data["description"])
+            for index in list_data["members"]:
+                stuff_list.add_content(paragraphs[index])
+            milano_book.add_item(stuff_list)
+        
+        for graph_data in structure["graphs"]:
+            relation_graph = RelationGraph(name=graph_data["name"], description=graph_data["description"])
+            for index in graph_data["nodes"]:
+                relation_graph.add_node(paragraphs[index])
+            for edge in graph_data["edges"]:
+                relation_graph.add_edge(paragraphs[edge["source"]], paragraphs[edge["target"]], edge["relation"])
+            milano_book.add_item(relation_graph)
+    
     def _default_recomposition(self, milano_book: MilanoBook, paragraphs: List[Paragraph]):
         """默认的重组逻辑，创建基础Items"""
         stuff_list = StuffList(name="视频内容列表", description="按顺序排列的视频内容切片")
@@ -296,8 +373,7 @@ class VideoProcessor:
         milano_book.add_item(stuff_list)
         
         timeline = Timeline(name="视频时间线", description="按时间顺序排列的视频内容")
-        for paragraph in paragraphs:
-            timeline.add_timeline_item(paragraph.start_time, paragraph)
+        timeline.extend((paragraph.start_time, paragraph) for paragraph in paragraphs)
         milano_book.add_item(timeline)
         
         relation_graph = RelationGraph(name="内容关系图", description="视频内容之间的逻辑关系")
@@ -313,8 +389,7 @@ class VideoProcessor:
         
         if "timeline" in analysis_lower or "时间线" in analysis_lower:
             timeline = Timeline(name="内容时间线", description="按时间顺序排列的关键内容")
-            for paragraph in paragraphs:
-                timeline.add_timeline_item(paragraph.start_time, paragraph)
+            timeline.extend((paragraph.start_time, paragraph) for paragraph in paragraphs)
             milano_book.add_item(timeline)
         
         if "stufflist" in analysis_lower or "列表" in analysis_lower or "清单" in analysis_lower:
@@ -337,11 +412,63 @@ class VideoProcessor:
                 storyline.add_content(paragraph)
             milano_book.add_item(storyline)
     
+    def enrichment(self, milano_book: MilanoBook):
+        """入库预计算：生成书籍摘要、关键术语以及每个段落的标题和关键词
+        
+        各次模型调用在有界线程池中并发执行，单个段落失败不影响其他段落，
+        结果写入milano_book.abstract/key_terms和paragraph.multi_modal_data["enrichment"]
+        """
+        try:
+            from app.services.generate_service import GenerateService
+            from app.services.circuit_breaker import llm_breaker
+            if llm_breaker.is_open():
+                print("大模型服务熔断中，跳过预计算")
+                return
+            generate_service = GenerateService()
+        except Exception as e:
+            print(f"预计算初始化失败，跳过：{str(e)}")
+            return
+        
+        paragraphs_data = [
+            {
+                "start_time": p.start_time,
+                "end_time": p.end_time,
+                "text_content": p.text_content
+            } for p in milano_book.paragraphs
+        ]
+        milano_book_data = {
+            "title": milano_book.title,
+            "author": milano_book.author,
+            "paragraphs": paragraphs_data
+        }
+        
+        with ThreadPoolExecutor(max_workers=self.enrich_workers) as executor:
+            book_future = executor.submit(generate_service.summarize_book, milano_book_data)
+            paragraph_futures = {
+                executor.submit(generate_service.enrich_paragraph, paragraph_data): paragraph
+                for paragraph, paragraph_data in zip(milano_book.paragraphs, paragraphs_data)
+            }
+            
+            for future in as_completed(paragraph_futures):
+                paragraph = paragraph_futures[future]
+                try:
+                    paragraph.multi_modal_data["enrichment"] = future.result()
+                except Exception as e:
+                    print(f"段落预计算失败：{str(e)}")
+            
+            try:
+                summary = book_future.result()
+                milano_book.abstract = summary["abstract"]
+                milano_book.key_terms = summary["key_terms"]
+            except Exception as e:
+                print(f"书籍摘要预计算失败：{str(e)}")
+    
     def process_video(self, url: str) -> Tuple[MilanoBook, str, str]:
-        """完整处理流程：下载视频、提取音频、转录、语义切片、重组"""
+        """完整处理流程：下载视频、提取音频、转录、语义切片、重组、预计算"""
         video_info = self.download_video(url)
         paragraphs, video_path, audio_path = self.tokenization(video_info)
         milano_book = self.recomposition(video_info, paragraphs)
+        self.enrichment(milano_book)
         
         return milano_book, video_path, audio_path
     
@@ -0,0 +1,183 @@
+"""笔记生成接口的压测脚本，统计首token时间、吞吐量和错误率
+
+用法：
+    python tools/benchmark.py --base-url http://127.0.0.1:5001 --endpoint both --concurrency 8 --requests 40
+
+配合 tools/mock_llm_server.py 可以完全离线运行。
+"""
+import argparse
+import json
+import math
+import statistics
+import sys
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _post(url, payload, timeout):
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST"
+    )
+    return urllib.request.urlopen(request, timeout=timeout)
+
+
+def _payload(options, index):
+    user_prompt = options.user_prompt
+    if not options.same_prompt:
+        # 默认给每个请求不同的提示词，避免被合并成同一个生成任务
+        user_prompt = f"{user_prompt} [bench {uuid.uuid4().hex[:8]}-{index}]".strip()
+    return {"book_ids": options.book_ids, "user_prompt": user_prompt}
+
+
+def run_notes(options, index):
+    """调用 /api/generate-notes，返回单次请求的结果"""
+    started = time.perf_counter()
+    try:
+        with _post(f"{options.base_url}/api/generate-notes", _payload(options, index), options.timeout) as response:
+            body = json.load(response)
+        latency = time.perf_counter() - started
+        return {"ok": bool(body.get("success")), "ttft": None, "latency": latency, "chars": 0,
+                "draft": bool(body.get("draft"))}
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        return {"ok": False, "latency": time.perf_counter() - started, "error": str(e)}
+
+
+def run_stream(options, index):
+    """调用 /api/generate-notes-stream，返回单次请求的结果"""
+    started = time.perf_counter()
+    ttft = None
+    chars = 0
+    try:
+        with _post(f"{options.base_url}/api/generate-notes-stream", _payload(options, index), options.timeout) as response:
+            for raw_line in response:
+                line = raw_line.decode("utf-8").strip()
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[len("data: "):])
+                if event["type"] == "content":
+                    if ttft is None:
+                        ttft = time.perf_counter() - started
+                    chars += len(event["content"])
+                elif event["type"] == "error":
+                    return {"ok": False, "latency": time.perf_counter() - started, "error": event.get("error")}
+                elif event["type"] == "done":
+                    break
+        return {"ok": True, "ttft": ttft, "latency": time.perf_counter() - started, "chars": chars}
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        return {"ok": False, "latency": time.perf_counter() - started, "error": str(e)}
+
+
+def percentile(values, p):
+    """最近秩法计算百分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(p / 100.0 * len(ordered)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def summarize(name, results, wall_time):
+    """汇总一组请求结果"""
+    ok = [r for r in results if r["ok"]]
+    latencies = [r["latency"] for r in ok]
+    ttfts = [r["ttft"] for r in ok if r.get("ttft") is not None]
+    chars = sum(r.get("chars", 0) for r in ok)
+
+    def stats(values):
+        if not values:
+            return None
+        return {
+            "mean": statistics.mean(values),
+            "p50": percentile(values, 50),
+            "p90": percentile(values, 90),
+            "p99": percentile(values, 99),
+            "max": max(values)
+        }
+
+    return {
+        "endpoint": name,
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "error_rate": (len(results) - len(ok)) / len(results) if results else 0,
+        "drafts": sum(1 for r in ok if r.get("draft")),
+        "wall_seconds": wall_time,
+        "requests_per_second": len(results) / wall_time if wall_time > 0 else None,
+        "chars_per_second": chars / wall_time if wall_time > 0 else None,
+        "ttft_seconds": stats(ttfts),
+        "latency_seconds": stats(latencies),
+        "sample_errors": [r["error"] for r in results if not r["ok"]][:5]
+    }
+
+
+def benchmark(options, name, runner):
+    """以指定并发运行一组请求"""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=options.concurrency) as executor:
+        results = list(executor.map(lambda i: runner(options, i), range(options.requests)))
+    return summarize(name, results, time.perf_counter() - started)
+
+
+def print_report(report):
+    def fmt(value):
+        return "-" if value is None else f"{value:.3f}"
+
+    print(f"\n== {report['endpoint']} ==")
+    print(f"请求数 {report['requests']}  错误 {report['errors']} ({report['error_rate']:.1%})  草稿 {report['drafts']}")
+    print(f"耗时 {report['wall_seconds']:.2f}s  吞吐 {fmt(report['requests_per_second'])} req/s  "
+          f"{fmt(report['chars_per_second'])} 字符/s")
+    for label, key in (("首token", "ttft_seconds"), ("总延迟", "latency_seconds")):
+        values = report[key]
+        if values:
+            print(f"{label}: mean {fmt(values['mean'])}  p50 {fmt(values['p50'])}  p90 {fmt(values['p90'])}  "
+                  f"p99 {fmt(values['p99'])}  max {fmt(values['max'])}")
+    for error in report["sample_errors"]:
+        print(f"错误示例: {error}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="压测笔记生成接口")
+    parser.add_argument("--base-url", default="http://127.0.0.1:5001")
+    parser.add_argument("--endpoint", choices=["notes", "stream", "both"], default="both")
+    parser.add_argument("--book-ids", nargs="+", help="参与生成的书籍ID，默认取书库中最新的一本")
+    parser.add_argument("--user-prompt", default="")
+    parser.add_argument("--same-prompt", action="store_true", help="所有请求使用相同提示词（测试请求合并）")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出结果")
+    options = parser.parse_args(argv)
+    options.base_url = options.base_url.rstrip("/")
+    return options
+
+
+def main(argv=None):
+    options = parse_args(argv)
+
+    if not options.book_ids:
+        with urllib.request.urlopen(f"{options.base_url}/api/books", timeout=options.timeout) as response:
+            books = json.load(response)["books"]
+        if not books:
+            print("书库为空，请先处理至少一个视频或通过--book-ids指定", file=sys.stderr)
+            return 1
+        options.book_ids = [books[0]["book_id"]]
+
+    runners = {"notes": run_notes, "stream": run_stream}
+    names = ["notes", "stream"] if options.endpoint == "both" else [options.endpoint]
+    reports = [benchmark(options, f"/api/generate-{'notes' if n == 'notes' else 'notes-stream'}", runners[n]) for n in names]
+
+    if options.json:
+        print(json.dumps(reports, ensure_ascii=False, indent=2))
+    else:
+        for report in reports:
+            print_report(report)
+    return 1 if any(report["errors"] for report in reports) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
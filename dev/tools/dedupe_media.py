@@ -0,0 +1,39 @@
+"""把书库中已有的视频和音频文件放入按内容寻址的媒体仓库
+
+用法：
+    python tools/dedupe_media.py --storage-dir milano_books
+
+内容相同的媒体文件只保留一份（milano_books/blobs/），书籍文件夹中的同名文件改为指向它的硬链接；
+文件系统不支持硬链接时尝试reflink，都不支持时才复制。
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.MilanoBook.storage import create_storage
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="把书库中已有的媒体文件放入媒体仓库并去重")
+    parser.add_argument("--storage-dir", default="milano_books")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    storage = create_storage(storage_dir=options.storage_dir)
+
+    results = storage.dedupe_media()
+    for book_id, file_name, sha256 in results:
+        print(f"{book_id}/{file_name}: {sha256[:12]}")
+
+    counts = storage.blob_store.ref_counts()
+    shared = sum(1 for count in counts.values() if count > 1)
+    print(f"共处理 {len(results)} 个文件，媒体仓库中现有 {len(counts)} 个文件，其中 {shared} 个被多本书共用")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
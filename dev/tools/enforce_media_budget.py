@@ -0,0 +1,46 @@
+"""执行媒体保留策略，适合放在定时任务中运行
+
+用法：
+    python tools/enforce_media_budget.py --budget-mb 20480
+    python tools/enforce_media_budget.py --budget-mb 20480 --opus-bitrate 32k
+
+按最近访问时间淘汰最久未访问书籍的视频和音频（书籍数据保留），直到媒体总大小不超过预算；
+指定--opus-bitrate时先把保留的音频转码为Opus。被淘汰的媒体再次被请求时会从原视频地址重新下载。
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.MilanoBook.storage import create_storage
+from app.services.media_governor import MediaGovernor
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="执行媒体保留策略")
+    parser.add_argument("--storage-dir", default="milano_books")
+    parser.add_argument("--budget-mb", type=float, help="媒体总大小上限（MB），默认读取MILANO_MEDIA_BUDGET_MB")
+    parser.add_argument("--opus-bitrate", help="把音频转码为该码率的Opus（如32k），默认读取MILANO_AUDIO_OPUS_BITRATE")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    budget_bytes = int(options.budget_mb * 1024 * 1024) if options.budget_mb is not None else None
+    governor = MediaGovernor(create_storage(storage_dir=options.storage_dir), budget_bytes=budget_bytes,
+                             opus_bitrate=options.opus_bitrate)
+
+    before = governor.media_usage()
+    result = governor.enforce()
+    for book_id in result["transcoded"]:
+        print(f"已转码音频：{book_id}")
+    for book_id in result["evicted"]:
+        print(f"已淘汰媒体：{book_id}")
+    after = result["usage"]
+    print(f"媒体占用 {before['bytes']} -> {after['bytes']} 字节（预算 {after['budget'] or '不限'}）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
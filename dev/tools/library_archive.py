@@ -0,0 +1,76 @@
+"""流式导出和导入书库（书籍、笔记以及可选的媒体文件）
+
+用法：
+    python tools/library_archive.py export -o library.tar --media
+    python tools/library_archive.py export -o nightly.tar.gz --since 2026-01-03T00:00:00
+    python tools/library_archive.py import library.tar --overwrite
+
+归档是带sha256 pax扩展头的tar，输出文件名以.gz结尾时用gzip压缩；导入时自动识别压缩格式。
+导出完成后打印本次的导出时间，下次增量导出可以把它作为--since。
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.MilanoBook.storage import create_storage
+from app.services.notes_storage import NotesStorage
+from app.services.library_archive import iter_export, import_archive, parse_since
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="流式导出和导入书库")
+    parser.add_argument("--storage-dir", default="milano_books")
+    parser.add_argument("--notes-dir", default="notes")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="导出书库")
+    export_parser.add_argument("-o", "--output", default="-", help="输出文件，-表示标准输出")
+    export_parser.add_argument("--media", action="store_true", help="包含视频和音频文件")
+    export_parser.add_argument("--since", help="只导出此时间之后写入的书籍和笔记（Unix时间戳或ISO 8601时间）")
+
+    import_parser = commands.add_parser("import", help="导入书库")
+    import_parser.add_argument("archive", help="归档文件，-表示标准输入")
+    import_parser.add_argument("--overwrite", action="store_true", help="覆盖已存在的书籍和笔记")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    storage = create_storage(storage_dir=options.storage_dir)
+    notes_storage = NotesStorage(options.notes_dir)
+
+    if options.command == "export":
+        started_at = time.time()
+        if options.output == "-":
+            output = sys.stdout.buffer
+        elif options.output.endswith(".gz"):
+            output = gzip.open(options.output, "wb", compresslevel=6)
+        else:
+            output = open(options.output, "wb")
+        try:
+            for chunk in iter_export(storage, notes_storage, include_media=options.media,
+                                     since=parse_since(options.since)):
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+        print(f"导出完成，导出时间：{started_at}", file=sys.stderr)
+        return 0
+
+    source = sys.stdin.buffer if options.archive == "-" else open(options.archive, "rb")
+    try:
+        summary = import_archive(storage, notes_storage, source, overwrite=options.overwrite)
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
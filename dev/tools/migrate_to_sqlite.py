@@ -0,0 +1,40 @@
+"""把JSON存储（milano_books/*/book.json）中的书籍导入SQLite存储
+
+用法：
+    python tools/migrate_to_sqlite.py --storage-dir milano_books
+    MILANO_STORAGE_BACKEND=sqlite python run.py
+
+迁移保留book_id和created_at，媒体文件仍然留在原来的书籍文件夹中；book.json不会被删除。
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.MilanoBook.storage import MilanoBookStorage
+from app.models.MilanoBook.sqlite_storage import SQLiteMilanoBookStorage
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="把JSON存储中的书籍导入SQLite存储")
+    parser.add_argument("--storage-dir", default="milano_books")
+    parser.add_argument("--db-path", help="数据库文件路径，默认为<storage-dir>/library.db")
+    parser.add_argument("--overwrite", action="store_true", help="覆盖数据库中已存在的书籍")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    json_storage = MilanoBookStorage(options.storage_dir)
+    sqlite_storage = SQLiteMilanoBookStorage(options.storage_dir, db_path=options.db_path)
+
+    migrated = sqlite_storage.migrate_from_json(json_storage, overwrite=options.overwrite)
+    for book_id in migrated:
+        print(f"已迁移 {book_id}")
+    print(f"共迁移 {len(migrated)} 本，数据库中现有 {sqlite_storage.count_books()} 本：{sqlite_storage.db_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""本地的OpenAI兼容接口替身服务，用于离线测试和压测GenerateService
+
+用法：
+    python tools/mock_llm_server.py --port 8001 --latency 0.5 --token-rate 50
+    MODELSCOPE_BASE_URL=http://127.0.0.1:8001/v1 python run.py
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import time
+import uuid
+
+from flask import Flask, Response, jsonify, request
+
+CANNED_TEXT = (
+    "# 学习笔记\n\n"
+    "## 核心知识点总结\n\n"
+    "- 这是本地替身服务返回的固定内容，用于测试和压测。\n"
+    "- 可以通过 --mode echo 让服务原样返回提示词。\n\n"
+    "## 关键概念解释\n\n"
+    "本地替身服务支持流式输出、首token延迟、生成速度和错误注入。\n"
+)
+
+
+def tokenize(text):
+    """粗略地把文本切分为“token”：英文单词、数字、单个汉字或标点"""
+    return re.findall(r"[A-Za-z]+\s*|\d+\s*|\s+|.", text, re.S)
+
+
+def create_mock_app(options):
+    """创建替身服务的Flask应用"""
+    app = Flask(__name__)
+
+    def completion_text(payload):
+        if options.mode == "echo":
+            messages = payload.get("messages", [])
+            return messages[-1]["content"] if messages else ""
+        return options.canned_text
+
+    def chunk_payload(completion_id, model, delta, finish_reason=None):
+        return {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        }
+
+    @app.route("/v1/models", methods=["GET"])
+    def list_models():
+        return jsonify({"object": "list", "data": [{"id": options.model, "object": "model"}]})
+
+    @app.route("/v1/chat/completions", methods=["POST"])
+    def chat_completions():
+        payload = request.get_json(force=True)
+        model = payload.get("model") or options.model
+
+        if random.random() < options.error_rate:
+            return jsonify({"error": {"message": "injected error", "type": "server_error"}}), options.error_status
+
+        text = completion_text(payload)
+        tokens = tokenize(text)[:payload.get("max_tokens") or None]
+        prompt_tokens = sum(len(tokenize(m.get("content", ""))) for m in payload.get("messages", []))
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens)
+        }
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+        if not payload.get("stream"):
+            time.sleep(options.latency + len(tokens) / options.token_rate)
+            return jsonify({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage
+            })
+
+        include_usage = (payload.get("stream_options") or {}).get("include_usage")
+
+        def generate():
+            yield f"data: {json.dumps(chunk_payload(completion_id, model, {'role': 'assistant'}))}\n\n"
+            time.sleep(options.latency)
+            for token in tokens:
+                if options.stall_rate and random.random() < options.stall_rate / max(len(tokens), 1):
+                    # 模拟连接中途断开
+                    return
+                yield f"data: {json.dumps(chunk_payload(completion_id, model, {'content': token}))}\n\n"
+                time.sleep(1.0 / options.token_rate)
+            yield f"data: {json.dumps(chunk_payload(completion_id, model, {}, 'stop'))}\n\n"
+            if include_usage:
+                usage_chunk = chunk_payload(completion_id, model, {})
+                usage_chunk["choices"] = []
+                usage_chunk["usage"] = usage
+                yield f"data: {json.dumps(usage_chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return Response(generate(), mimetype="text/event-stream")
+
+    return app
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="本地OpenAI兼容chat-completions替身服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--model", default="mock-model", help="未指定model时返回的模型名称")
+    parser.add_argument("--mode", choices=["canned", "echo"], default="canned",
+                        help="canned返回固定内容，echo原样返回最后一条消息")
+    parser.add_argument("--canned-text", default=CANNED_TEXT, help="canned模式返回的内容")
+    parser.add_argument("--canned-file", help="从文件读取canned模式返回的内容")
+    parser.add_argument("--latency", type=float, default=0.5, help="首token延迟（秒）")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="生成速度（token/秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="请求直接返回错误的概率")
+    parser.add_argument("--error-status", type=int, default=503, help="注入错误时的HTTP状态码")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="流式输出中途断开的概率")
+    parser.add_argument("--seed", type=int, help="随机数种子，便于复现错误注入")
+    options = parser.parse_args(argv)
+
+    if options.canned_file:
+        with open(options.canned_file, "r", encoding="utf-8") as f:
+            options.canned_text = f.read()
+    if options.token_rate <= 0:
+        parser.error("--token-rate必须大于0")
+    return options
+
+
+if __name__ == "__main__":
+    options = parse_args()
+    if options.seed is not None:
+        random.seed(options.seed)
+    print(f"替身服务已启动：http://{options.host}:{options.port}/v1", file=sys.stderr)
+    create_mock_app(options).run(host=options.host, port=options.port, threaded=True)
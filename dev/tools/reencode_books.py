@@ -0,0 +1,42 @@
+"""把书库中所有book.json转换为指定的存储格式
+
+用法：
+    python tools/reencode_books.py --format zstd
+    MILANO_BOOK_FORMAT=zstd python run.py
+
+读取时会自动识别格式，转换前后的书籍可以混用。
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.MilanoBook.codec import BOOK_FORMATS
+from app.models.MilanoBook.storage import MilanoBookStorage
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="转换书库中所有书籍数据文件的存储格式")
+    parser.add_argument("--storage-dir", default="milano_books")
+    parser.add_argument("--format", choices=sorted(BOOK_FORMATS), default="compact",
+                        help="json为带缩进的JSON，compact为无缩进JSON，gzip和zstd为压缩后的compact")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    storage = MilanoBookStorage(options.storage_dir, book_format=options.format)
+
+    total_before = total_after = 0
+    for book_id, before, after in storage.reencode_all():
+        total_before += before
+        total_after += after
+        print(f"{book_id}: {before} -> {after} 字节")
+    if total_before:
+        print(f"合计 {total_before} -> {total_after} 字节（{total_after / total_before:.1%}）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())